@@ -0,0 +1,203 @@
+# admission.py
+# Admission control for /invoke*: token buckets per session (cart_id) and per
+# tool, checked before a call touches the DB, and a per-worker limit on
+# requests in flight with a bounded FIFO queue in front of it, enforced in
+# the event loop before a request takes a threadpool thread. A request over
+# a limit is refused at once with 429 + Retry-After and
+# {"error": {"code": "RATE_LIMITED", ...}} instead of queueing behind the
+# sessions that behave.
+import asyncio
+import collections
+import math
+import threading
+import time
+
+from fastapi.responses import JSONResponse
+
+MAX_BUCKETS = 65536  # idle sessions beyond this are forgotten, oldest first
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after_s: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+    def body(self) -> dict:
+        return {"error": {"code": "RATE_LIMITED", "message": str(self), "retry_after_s": round(self.retry_after_s, 3)}}
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after_s)))}
+
+
+def parse_rates(spec: str) -> dict:
+    """"tool=rate[/burst],..." -> {tool: (rate, burst)}; burst defaults to rate."""
+    rates = {}
+    for item in filter(None, (s.strip() for s in (spec or "").split(","))):
+        tool, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        rates[tool.strip()] = (float(rate), float(burst or rate))
+    return rates
+
+
+class Buckets:
+    """Token buckets keyed by ("cart", id) / ("tool", name), refilled lazily.
+
+    take() is all-or-nothing across the keys of one request, so a batch is
+    either admitted whole or costs nothing.
+    """
+
+    def __init__(self, cart_rate: float, cart_burst: float, tool_rates: dict):
+        self.cart_rate, self.cart_burst = cart_rate, cart_burst
+        self.tool_rates = tool_rates
+        self._buckets = collections.OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def _limits(self, key):
+        if key[0] == "cart":
+            return (self.cart_rate, self.cart_burst) if self.cart_rate > 0 else None
+        return self.tool_rates.get(key[1])
+
+    def take(self, need: dict):
+        """need: {key: tokens}; raises Rejected if any bucket is short."""
+        now = time.monotonic()
+        with self._lock:
+            plan = []
+            for key, n in need.items():
+                limits = self._limits(key)
+                if limits is None:
+                    continue
+                rate, burst = limits
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = [burst, now]
+                    if len(self._buckets) > MAX_BUCKETS:
+                        self._buckets.popitem(last=False)
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                n = min(n, burst)  # a batch larger than the burst waits for a full bucket
+                if bucket[0] < n:
+                    raise Rejected(f"{key[0]}_rate", (n - bucket[0]) / rate,
+                                   f"too many calls for {key[0]} {key[1]!r}; slow down")
+                plan.append((bucket, n))
+            for bucket, n in plan:
+                bucket[0] -= n
+
+
+class ConcurrencyLimit:
+    """At most max_in_flight holders; up to max_queue more wait in FIFO order
+    for at most timeout_s. Event-loop only (no locking)."""
+
+    def __init__(self, max_in_flight: int, max_queue: int, timeout_s: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        self.queued = 0
+        self.waits_ms = collections.deque(maxlen=1024)  # recent queue waits
+        self.wait_total_ms = 0.0
+
+    async def acquire(self):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected("queue_full", self.timeout_s, "server busy: admission queue full")
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(fut, self.timeout_s)  # release() hands its slot over
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  # got the slot just as we gave up: pass it on
+            else:
+                fut.cancel()
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("queue_timeout", self.timeout_s, "server busy: timed out in the admission queue")
+            raise
+        finally:
+            waited = (time.perf_counter() - t0) * 1000
+            self.waits_ms.append(waited)
+            self.wait_total_ms += waited
+
+    def release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # the slot passes straight to the next waiter
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits_ms)
+        pick = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))], 2) if waits else 0.0
+        return {
+            "max_in_flight": self.max_in_flight, "in_flight": self.in_flight,
+            "max_queue": self.max_queue, "queue_depth": len(self._waiters), "queued": self.queued,
+            "queue_wait_ms": {"total": round(self.wait_total_ms, 1), "p50": pick(0.5), "p99": pick(0.99),
+                              "max": round(waits[-1], 2) if waits else 0.0},
+        }
+
+
+class Admission:
+    def __init__(self, cart_rate=10.0, cart_burst=30.0, tool_rates=None,
+                 max_in_flight=32, max_queue=256, queue_timeout_s=2.0):
+        self.buckets = Buckets(cart_rate, cart_burst, tool_rates or {})
+        self.concurrency = ConcurrencyLimit(max_in_flight, max_queue, queue_timeout_s)
+        self.admitted = 0
+        self.rejected = collections.Counter()
+        self._lock = threading.Lock()
+
+    def check(self, calls):
+        """Charge one token per (session, tool) call to both of its buckets."""
+        need = collections.Counter()
+        for session, tool in calls:
+            need[("cart", session)] += 1
+            need[("tool", tool)] += 1
+        try:
+            self.buckets.take(need)
+        except Rejected as e:
+            self.reject(e)
+            raise
+        with self._lock:
+            self.admitted += 1
+
+    def reject(self, e: Rejected):
+        with self._lock:
+            self.rejected[e.reason] += 1
+
+    def stats(self) -> dict:
+        return {"admitted": self.admitted, "rejected": dict(self.rejected), **self.concurrency.stats()}
+
+
+class AdmissionMiddleware:
+    """ASGI wrapper holding a ConcurrencyLimit slot for each request to `paths`
+    (for streams: until the last byte is sent)."""
+
+    def __init__(self, app, get_admission, paths=("/invoke", "/invoke_batch", "/invoke_stream")):
+        self.app = app
+        self.get_admission = get_admission  # -> Admission, or None when disabled
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        admission = self.get_admission() if scope["type"] == "http" and scope["path"] in self.paths else None
+        if admission is None:
+            return await self.app(scope, receive, send)
+        limit = admission.concurrency
+        try:
+            await limit.acquire()
+        except Rejected as e:
+            admission.reject(e)
+            return await JSONResponse(e.body(), status_code=429, headers=e.headers())(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release()
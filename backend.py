@@ -2,84 +2,674 @@
 
 
 from unittest import result
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import contextlib
+import functools
+import heapq
+import itertools
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
 import uuid
 
-DB_PATH = "food1.db"
+try:
+    import orjson
+except ImportError:  # stdlib json via JSONResponse
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack negotiation disabled
+    msgpack = None
+
+from writer import WriteQueue
+from admission import Admission, AdmissionMiddleware, Rejected, parse_rates
+from catalog_cache import MEMBERSHIP, WHOLE_CATALOG, CatalogVersions, VersionedLRU
+from catalog_index import CatalogIndex
+from catalog_snapshot import MappedCatalog
+from metrics import MeteredConnection, RequestMetricsMiddleware, collect, registry, render, start_flusher
+from sharding import HashRing, parse_shards
+from singleflight import SingleFlight
+from storage import (
+    TOOLS, CART_FIELDS, CONDITIONAL_TOOLS, DEFAULT_CART_FIELDS, DELIVERY_FEE_CENTS, MENU_FIELDS,
+    RESTAURANT_FIELDS, InvalidFields, InvalidParams, Savepoints, Storage, cart_result, make_etag, parse_items,
+    parse_menu_limit, parse_messages, projection, recent_limit, search_filters,
+    wants_columnar,
+)
+from storage_memory import MemoryStorage
+from storage_pg import PostgresStorage
 
-app = FastAPI(title="Food Order API")
+DB_PATH = "food1.db"
+# CATALOG_DB=catalog.db keeps restaurants/menu_items/catalog_meta in their own
+# file, opened read-only with a large mmap and ATTACHed to the transactional
+# DB as `catalog`, so joins like cart views keep working unchanged.
+# CATALOG_IMMUTABLE=1 also skips all locking (restart to see catalog edits).
+# Unset: everything lives in DB_PATH.
+# DB_SHARDS=s0.db,s1.db,... spreads carts (by cart_id) and conversations (by
+# conversation_id) over several files with consistent hashing, each with its
+# own connections and writer (sharding.py; reshard there when the list
+# changes). The catalog then stays in CATALOG_DB, default DB_PATH.
+DB_SHARDS = parse_shards(os.getenv("DB_SHARDS"))
+RING = HashRing(DB_SHARDS) if DB_SHARDS else None
+CATALOG_DB = os.getenv("CATALOG_DB") or (DB_PATH if DB_SHARDS else None)
+# STORAGE=sqlite (default), memory (catalog loaded from the SQLite catalog at
+# start, everything else in process) or postgres (POSTGRES_DSN). The writer,
+# shards, catalog split and streaming cursors are SQLite-only; PG_POOL_MAX
+# caps the psycopg pool.
+STORAGE = os.getenv("STORAGE", "sqlite")
+CATALOG_IMMUTABLE = os.getenv("CATALOG_IMMUTABLE", "0") == "1"
+CATALOG_MMAP_BYTES = int(os.getenv("CATALOG_MMAP_MB", "256")) * 1024 * 1024
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # build the search index before the first request instead of during it
+    if STORAGE == "sqlite":
+        get_catalog_index()
+    if METRICS and METRICS_DIR:
+        start_flusher(METRICS_DIR, METRICS_FLUSH_S)
+    yield
+
+
+app = FastAPI(title="Food Order API", lifespan=lifespan)
+
+# Admission control (admission.py), per worker. Token buckets: ADMIT_CART_RATE
+# calls/s in bursts of up to ADMIT_CART_BURST per session (the call's cart_id,
+# else the X-Cart-Id header the agent sends, else the client address) and
+# ADMIT_TOOL_RATES for single tools across sessions, e.g.
+# "restaurants.search=200/400,orders.create_mock=20" (rate/burst). At most
+# ADMIT_MAX_IN_FLIGHT requests run at once (keep it below the threadpool's
+# 40), ADMIT_MAX_QUEUE more wait up to ADMIT_QUEUE_TIMEOUT_MS in arrival
+# order; anything past a limit gets 429 + Retry-After and a RATE_LIMITED
+# error. Counters and queue waits under admission in GET /stats; ADMISSION=0
+# disables.
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+admission = Admission(
+    cart_rate=float(os.getenv("ADMIT_CART_RATE", "10")),
+    cart_burst=float(os.getenv("ADMIT_CART_BURST", "30")),
+    tool_rates=parse_rates(os.getenv("ADMIT_TOOL_RATES", "")),
+    max_in_flight=int(os.getenv("ADMIT_MAX_IN_FLIGHT", "32")),
+    max_queue=int(os.getenv("ADMIT_MAX_QUEUE", "256")),
+    queue_timeout_s=float(os.getenv("ADMIT_QUEUE_TIMEOUT_MS", "2000")) / 1000,
+)
+app.add_middleware(AdmissionMiddleware, get_admission=lambda: admission if ADMISSION else None)
+
+# GET /metrics: Prometheus text (metrics.py). Per tool: calls, errors by code,
+# latency histogram, SQL statements and time (METRICS_SQL=1 times every
+# SQLite execute/fetch through a connection subclass); plus HTTP requests in
+# flight, admission, writer, pool and cache counters. Several workers: set
+# METRICS_DIR to a shared empty directory, each worker drops its totals
+# there every METRICS_FLUSH_S and any worker's scrape adds them up.
+# METRICS=0 disables.
+METRICS = os.getenv("METRICS", "1") == "1"
+METRICS_SQL = METRICS and os.getenv("METRICS_SQL", "1") == "1"
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+if METRICS:
+    app.add_middleware(RequestMetricsMiddleware)  # outermost: includes admission queueing
 
 # ---------- DB Helper ----------
+def _catalog_uri() -> str:
+    return f"file:{CATALOG_DB}?mode=ro" + ("&immutable=1" if CATALOG_IMMUTABLE else "")
+
+
+def connect(path=None, **kwargs):
+    """Transactional DB (the current shard); in split mode the catalog is
+    attached, and unqualified restaurants/menu_items resolve to it."""
+    if METRICS_SQL:
+        kwargs.setdefault("factory", MeteredConnection)
+    conn = sqlite3.connect(path or current_path(), uri=True, **kwargs)
+    if CATALOG_DB:
+        conn.execute("ATTACH DATABASE ? AS catalog", (_catalog_uri(),))
+        conn.execute(f"PRAGMA catalog.mmap_size = {CATALOG_MMAP_BYTES}")
+    return conn
+
+
+def connect_catalog(**kwargs):
+    """Catalog-only connection: never touches the transactional file."""
+    if METRICS_SQL:
+        kwargs.setdefault("factory", MeteredConnection)
+    if not CATALOG_DB:
+        return sqlite3.connect(DB_PATH, **kwargs)
+    conn = sqlite3.connect(_catalog_uri(), uri=True, **kwargs)
+    conn.execute(f"PRAGMA mmap_size = {CATALOG_MMAP_BYTES}")
+    return conn
+
+
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    batch = getattr(_batch_local, "conn", None)
+    if batch is not None:
+        return BatchConnection(batch, sqlite3.Row)
+    conn = connect()
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# Read tools keep one connection per worker thread (and shard), so SQLite's
+# prepared statement cache (one entry per projection) survives across requests.
+_read_local = threading.local()
+
+def get_read_db():
+    batch = getattr(_batch_local, "conn", None)
+    if batch is not None:
+        return BatchConnection(batch, None)
+    conns = getattr(_read_local, "conns", None)
+    if conns is None:
+        conns = _read_local.conns = {}
+    path = current_path()
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path, cached_statements=256)
+    return conn
+
+
+# Catalog reads (search, menus, catalog version) use their own read-only
+# connection, so they never wait on cart/order/message writers.
+_catalog_local = threading.local()
+
+def get_catalog_db():
+    batch = getattr(_batch_local, "conn", None)
+    if batch is not None:
+        return BatchConnection(batch, None)
+    conn = getattr(_catalog_local, "conn", None)
+    if conn is None:
+        conn = connect_catalog(cached_statements=256)
+        _catalog_local.conn = conn
+    return conn
+
+
+# restaurants.search is answered from an in-process index of the catalog
+# (catalog_index.py), rebuilt in the background within CATALOG_POLL_S of a
+# catalog_meta.version change. CATALOG_INDEX=0 goes back to SQL; so does a
+# catalog the index cannot load. With CATALOG_SNAPSHOT=catalog.snap the index
+# is that file, mmap'd and shared by all workers (catalog_snapshot.py builds
+# it; a rebuild is picked up within CATALOG_POLL_S).
+CATALOG_INDEX = os.getenv("CATALOG_INDEX", "1") == "1"
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT")
+CATALOG_POLL_S = float(os.getenv("CATALOG_POLL_S", "1"))
+_catalog_indexes = {}
+_catalog_index_lock = threading.Lock()
+
+
+# Catalog reads on the SQL path (menus.list, and restaurants.search when the
+# index is off) go through catalog_cache.py: whole menus per restaurant
+# (MENU_CACHE_SIZE restaurants) and search answers (SEARCH_CACHE_SIZE
+# requests), each dropped once a restaurant it read changes or after
+# CATALOG_CACHE_TTL_S (0 = no TTL). Needs restaurant_versions (re-run
+# schema_catalog.sql); CATALOG_CACHE=0 disables.
+CATALOG_CACHE = os.getenv("CATALOG_CACHE", "1") == "1"
+MENU_CACHE_SIZE = int(os.getenv("MENU_CACHE_SIZE", "1024"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+CATALOG_CACHE_TTL_S = float(os.getenv("CATALOG_CACHE_TTL_S", "300"))
+
+
+class CatalogCache:
+    def __init__(self):
+        self.versions = CatalogVersions()
+        self.menus = VersionedLRU(self.versions, MENU_CACHE_SIZE, CATALOG_CACHE_TTL_S)
+        self.searches = VersionedLRU(self.versions, SEARCH_CACHE_SIZE, CATALOG_CACHE_TTL_S)
+
+    def stats(self) -> dict:
+        return {"version": self.versions.seen, "menus": self.menus.stats(), "searches": self.searches.stats()}
+
+
+_catalog_caches = {}
+
+
+def catalog_cache(db):
+    """The catalog cache, synced with db (one catalog_meta read), or None."""
+    if not CATALOG_CACHE:
+        return None
+    path = CATALOG_DB or DB_PATH
+    cache = _catalog_caches.get(path)
+    if cache is None:
+        cache = _catalog_caches.setdefault(path, CatalogCache())
+    return cache if cache.versions.sync(db) else None
+
+
+# Identical restaurants.search calls that overlap (the same lunch-time query
+# from many sessions) run once: later callers wait for the first one's
+# answer. Keyed by the normalized request plus the catalog version it reads;
+# GET /stats shows the coalescing ratio. SEARCH_COALESCE=0 disables.
+SEARCH_COALESCE = os.getenv("SEARCH_COALESCE", "1") == "1"
+search_flights = SingleFlight()
+
+
+def _coalesced(key, fn):
+    return search_flights.do(key, fn) if SEARCH_COALESCE else fn()
+
+
+def get_catalog_index():
+    if not CATALOG_INDEX:
+        return None
+    path = CATALOG_SNAPSHOT or CATALOG_DB or DB_PATH
+    if path not in _catalog_indexes:
+        with _catalog_index_lock:
+            if path not in _catalog_indexes:
+                try:
+                    if CATALOG_SNAPSHOT:
+                        index = MappedCatalog(CATALOG_SNAPSHOT, CATALOG_POLL_S).start()
+                    else:
+                        index = CatalogIndex(connect_catalog, CATALOG_POLL_S).start()
+                except Exception as e:
+                    print("catalog index unavailable, searching with SQL:", e)
+                    index = None
+                _catalog_indexes[path] = index
+    return _catalog_indexes[path]
+
+
+# /invoke_batch runs every call on one connection; while it is set, get_db(),
+# get_read_db() and get_catalog_db() hand out views of it whose
+# commit()/close() do nothing, and the batch commits or rolls back once at
+# the end.
+_batch_local = threading.local()
+
+
+class BatchConnection:
+    def __init__(self, conn, row_factory):
+        self._conn = conn
+        self._row_factory = row_factory
+
+    def cursor(self):
+        cur = self._conn.cursor()
+        cur.row_factory = self._row_factory
+        return cur
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# ---------- Shards ----------
+# execute() picks the shard from the call's routing key and pins it for the
+# thread; connect()/get_read_db()/get_writer() then use that file.
+_shard_local = threading.local()
+
+
+def current_path() -> str:
+    path = getattr(_shard_local, "path", None)
+    if path is not None:
+        return path
+    return DB_SHARDS[0] if DB_SHARDS else DB_PATH
+
+
+@contextlib.contextmanager
+def on_shard(path: str):
+    prev = getattr(_shard_local, "path", None)
+    _shard_local.path = path
+    try:
+        yield path
+    finally:
+        _shard_local.path = prev
+
+
+def shard_for(key) -> str:
+    if RING is None:
+        return DB_PATH
+    return RING.node(key) if key is not None else DB_SHARDS[0]
+
+
+def shard_key(tool: str, params: dict):
+    if tool.startswith("conversation.") and params.get("conversation_id") is not None:
+        return str(params["conversation_id"])
+    return params.get("cart_id")
+
+
+def _prepare(tool: str, params: dict) -> dict:
+    # sharded conversation ids are chosen up front (random 53-bit ints,
+    # unique across files) so the new conversation can be routed by its id
+    if RING is not None and tool == "conversation.create" and params.get("conversation_id") is None:
+        return {**params, "conversation_id": (uuid.uuid4().int >> 75) or 1}
+    return params
+
+
+def _shards_for(tool: str, params: dict) -> set:
+    """Shards a call touches; empty for catalog-only calls."""
+    if RING is None:
+        return {DB_PATH}
+    if tool in SCATTER_TOOLS:
+        return set(DB_SHARDS)
+    if tool == "conversation.append":
+        return {shard_for(str(m.get("conversation_id"))) for m in params.get("messages") or []}
+    key = shard_key(tool, params)
+    return {shard_for(key)} if key is not None else set()
+
+
+# ---------- SQL ----------
+@functools.lru_cache(maxsize=256)
+def _search_sql(select: tuple) -> str:
+    cols = ", ".join(RESTAURANT_FIELDS[f] for f in select)
+    return f"""
+            SELECT {cols}
+            FROM restaurants
+            WHERE is_open = 1
+            AND (:area IS NULL OR LOWER(area) LIKE '%' || LOWER(:area) || '%')
+            AND (:cuisine IS NULL OR LOWER(cuisine_tags) LIKE '%' || LOWER(:cuisine) || '%')
+            AND (:city IS NULL OR LOWER(city) = LOWER(:city))
+            AND (:min_rating IS NULL OR rating >= :min_rating)
+            AND (:price_level IS NULL OR price_level <= :price_level)
+            AND (:dish IS NULL OR EXISTS (
+                SELECT 1 FROM menu_items mi
+                WHERE mi.restaurant_id = restaurants.id AND mi.is_available = 1
+                AND LOWER(mi.name) LIKE '%' || LOWER(:dish) || '%'))
+            ORDER BY id
+            """
+
+
+@functools.lru_cache(maxsize=256)
+def _menu_sql(select: tuple, limited: bool) -> str:
+    cols = ", ".join(MENU_FIELDS[f] for f in select)
+    limit = " LIMIT ?" if limited else ""
+    return f"SELECT {cols} FROM menu_items WHERE restaurant_id = ? AND is_available = 1 ORDER BY id{limit}"
+
+
+@functools.lru_cache(maxsize=64)
+def _cart_sql(select: tuple) -> str:
+    cols = ", ".join(CART_FIELDS[f] for f in select)
+    return f"""
+        SELECT {cols}
+        FROM cart_items ci
+        JOIN menu_items mi ON mi.id = ci.menu_item_id
+        WHERE ci.cart_id = ?
+        ORDER BY ci.id
+    """
+
+
 # ---------- Request Model ----------
 class InvokeRequest(BaseModel):
     tool: str
     params: dict
 
 
+class BatchRequest(BaseModel):
+    calls: list[InvokeRequest]
+    atomic: bool = False
+
+
 # ---------- API ----------
+# ---------- Response encoding ----------
+MSGPACK = "application/msgpack"
+
+def encode_response(result, accept: str = "") -> Response:
+    """Pre-encode the plain dict/list result so FastAPI skips jsonable_encoder;
+    MessagePack when the client asks for it."""
+    if msgpack is not None and MSGPACK in accept:
+        return Response(msgpack.packb(result, use_bin_type=True), media_type=MSGPACK)
+    if orjson is not None:
+        return Response(orjson.dumps(result), media_type="application/json")
+    return JSONResponse(result)
+
+
+# ---------- Single writer ----------
+# DB_WRITER=1 (default) sends every mutation to one writer thread per DB file
+# (writer.py), which applies queued calls in one transaction with a savepoint
+# each and commits once; reads stay on their own connections (WAL).
+DB_WRITER = os.getenv("DB_WRITER", "1") == "1"
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _bind_writer_conn(path, conn):
+    # handlers on the writer thread get views of its connection from get_db(),
+    # and current_path() is the writer's own shard
+    _batch_local.conn = conn
+    _shard_local.path = path
+
+
+def get_writer(path=None) -> WriteQueue:
+    path = path or current_path()
+    with _writers_lock:
+        w = _writers.get(path)
+        if w is None:
+            w = _writers[path] = WriteQueue(path, on_start=functools.partial(_bind_writer_conn, path), connect=connect)
+        return w
+
+
+# Tools that only read; a batch made of these needs no write lock.
+READ_TOOLS = {
+    "restaurants.search", "menus.list", "catalog.version", "cart.view",
+    "orders.list_recent", "conversation.load",
+}
+# conversation.append has its own write-behind path (below)
+WRITER_BYPASS = READ_TOOLS | {"conversation.append"}
+
+
+def execute(tool: str, params: dict):
+    """dispatch() on the call's shard, with mutations routed through the writer."""
+    if not _on_sqlite():
+        return dispatch(tool, params)
+    if RING is None or getattr(_batch_local, "conn", None) is not None:
+        return _execute(tool, params)
+    if tool in SCATTER_TOOLS:
+        return SCATTER_TOOLS[tool](params)
+    params = _prepare(tool, params)
+    with on_shard(shard_for(shard_key(tool, params))):
+        return _execute(tool, params)
+
+
+def _execute(tool: str, params: dict):
+    if not DB_WRITER or tool in WRITER_BYPASS or getattr(_batch_local, "conn", None) is not None:
+        return dispatch(tool, params)
+    try:
+        return get_writer().call(dispatch, tool, params)
+    except Exception as e:
+        return {"error": {"code": "SERVER_ERROR", "message": str(e)}}
+
+
+def _order_id() -> str:
+    """UUID in the version 7 layout: millisecond timestamp first, so order ids
+    sort in placing order (the tie-breaker of sharded orders.list_recent)."""
+    ms = time.time_ns() // 1_000_000
+    rand = uuid.uuid4().int & ((1 << 74) - 1)
+    return str(uuid.UUID(int=(ms << 80) | (0x7 << 76) | ((rand >> 62) << 64) | (0b10 << 62) | (rand & ((1 << 62) - 1))))
+
+
+def _scatter_orders_list_recent(params):
+    # orders live with their cart, so a user's orders can be on any shard;
+    # each shard's list is already newest first (same-second orders by
+    # insertion), and the merge orders same-second orders of different
+    # shards by their time-ordered id (ids from before that: arbitrary)
+    per_shard = []
+    for path in DB_SHARDS:
+        with on_shard(path):
+            res = dispatch("orders.list_recent", params)
+        if "error" in res:
+            return res
+        per_shard.append(res["orders"])
+    merged = heapq.merge(*per_shard, key=lambda o: (o["placed_at"], o["order_id"]), reverse=True)
+    return {"orders": list(itertools.islice(merged, recent_limit(params)))}
+
+
+# read tools without a routing key that have to ask every shard
+SCATTER_TOOLS = {"orders.list_recent": _scatter_orders_list_recent}
+
+
+def _rate_limited(request: Request, calls):
+    """None if the calls may run, else the 429 to send back."""
+    if not ADMISSION:
+        return None
+    fallback = request.headers.get("x-cart-id") or (request.client.host if request.client else "")
+    try:
+        admission.check([(str(c.params.get("cart_id") or fallback), c.tool) for c in calls])
+    except Rejected as e:
+        res = encode_response(e.body(), request.headers.get("accept", ""))
+        res.status_code = 429
+        res.headers.update(e.headers())
+        return res
+    return None
+
+
 @app.post("/invoke")
-def invoke(req: InvokeRequest):
-    tool = req.tool
-    params = req.params
+def invoke(req: InvokeRequest, request: Request):
+    limited = _rate_limited(request, [req])
+    if limited is not None:
+        return limited
+    return encode_response(execute(req.tool, req.params), request.headers.get("accept", ""))
+
+
+def _run_calls(tx, calls, atomic: bool) -> dict:
+    # runs inside a transaction owned by the storage (Storage.batch)
+    results = []
+    tx.savepoint("batch")
+    for i, call in enumerate(calls):
+        tx.savepoint("call")
+        res = dispatch(call.tool, call.params)
+        failed = isinstance(res, dict) and "error" in res
+        if failed:
+            tx.rollback_to("call")
+        tx.release("call")
+        results.append(res)
+        if failed and atomic:
+            tx.rollback_to("batch")
+            tx.release("batch")
+            # answers read inside the rolled-back writes must not be revalidated
+            for r in results:
+                if isinstance(r, dict):
+                    r.pop("etag", None)
+            return {"results": results, "committed": False, "failed_index": i}
+    tx.release("batch")
+    return {"results": results, "committed": True}
+
+
+@app.post("/invoke_batch")
+def invoke_batch(req: BatchRequest, request: Request):
+    """Run `calls` in order on one connection and one transaction.
+
+    Each call gets a savepoint: a call that fails (error result or exception)
+    is undone on its own and the rest commit together, unless `atomic` is set,
+    in which case the first failure rolls back the whole batch and stops it.
+    Batches that write run as one job on the writer.
+    """
+    limited = _rate_limited(request, req.calls)
+    if limited is not None:
+        return limited
+    accept = request.headers.get("accept", "")
+    if RING is None or not _on_sqlite():
+        return encode_response(_batch(req.calls, req.atomic), accept)
+
+    # sharded: one transaction only works within one file
+    calls = [InvokeRequest(tool=c.tool, params=_prepare(c.tool, c.params)) for c in req.calls]
+    shards = set().union(*(_shards_for(c.tool, c.params) for c in calls))
+    if len(shards) > 1:
+        if req.atomic:
+            return encode_response(
+                {"error": {"code": "INVALID_PARAMS", "message": "atomic batch spans several shards"}}, accept
+            )
+        # each call commits on its own shard, as a failed call would anyway
+        return encode_response({"results": [execute(c.tool, c.params) for c in calls], "committed": True}, accept)
+    with on_shard(shards.pop() if shards else shard_for(None)):
+        return encode_response(_batch(calls, req.atomic), accept)
 
+
+def _batch(calls, atomic: bool) -> dict:
+    writes = any(c.tool not in READ_TOOLS for c in calls)
     try:
-        if tool == "restaurants.search":
-            # print("Invoking restaurants.search with params:", params)
-            return restaurants_search(params)
+        return get_storage().batch(lambda tx: _run_calls(tx, calls, atomic), writes)
+    except Exception as e:
+        return {"error": {"code": "SERVER_ERROR", "message": str(e)}}
 
-        if tool == "menus.list":
-            return menus_list(params)
 
-        if tool == "cart.ensure":
-            return cart_ensure(params)
+@app.get("/stats")
+def stats():
+    return {
+        "storage": get_storage().name,
+        "writer": {path: w.stats() for path, w in _writers.items()},
+        "messages": {path: m.stats() for path, m in _message_writers.items()},
+        "catalog_index": {path: i.stats() for path, i in _catalog_indexes.items() if i is not None},
+        "catalog_cache": {path: c.stats() for path, c in _catalog_caches.items()},
+        "search_coalescing": search_flights.stats(),
+        "admission": admission.stats() if ADMISSION else None,
+    }
+
 
-        if tool == "cart.add_item":
-            return cart_add_item(params)
+@app.get("/metrics")
+def metrics():
+    if not METRICS:
+        return Response("metrics disabled (METRICS=0)\n", status_code=404, media_type="text/plain")
+    return Response(render(collect(METRICS_DIR)), media_type="text/plain; version=0.0.4")
 
-        if tool == "cart.view":
-            return cart_view(params)
-        
-        if tool == "cart.update_item":
-            return cart_update_item(params)
 
-        if tool == "cart.remove_item":
-            return cart_remove_item(params)
+def _gauges():
+    yield from (("food_writer_queue_depth", (("db", path),), w._queue.qsize()) for path, w in list(_writers.items()))
+    if ADMISSION:
+        yield "food_admission_queue_depth", (), admission.concurrency.stats()["queue_depth"]
+    yield from (("food_db_pool", (("stat", k),), v) for k, v in get_storage().pool_stats().items())
 
-        if tool == "cart.clear":
-            return cart_clear(params)
 
-        if tool == "orders.create_mock":
-            return orders_create(params)
-        
+def _totals():
+    for path, w in list(_writers.items()):
+        yield "food_writer_jobs_total", (("db", path),), w.jobs
+        yield "food_writer_commits_total", (("db", path),), w.batches
+    if ADMISSION:
+        yield "food_admission_admitted_total", (), admission.admitted
+        yield from (("food_admission_rejected_total", (("reason", r),), n) for r, n in list(admission.rejected.items()))
+        yield "food_admission_queue_wait_seconds_total", (), admission.concurrency.wait_total_ms / 1000
+    yield "food_search_executions_total", (), search_flights.leaders
+    yield "food_search_coalesced_total", (), search_flights.followers
+    for cache in list(_catalog_caches.values()):
+        for name, lru in (("menus", cache.menus), ("searches", cache.searches)):
+            yield "food_catalog_cache_hits_total", (("cache", name),), lru.hits
+            yield "food_catalog_cache_misses_total", (("cache", name),), lru.misses
 
 
-        if tool == "conversation.create":
-            conversation_id = conversation_create(params["cart_id"])
-            return {"conversation_id": conversation_id}
+registry.gauges.append(_gauges)
+registry.totals.append(_totals)
 
-        if tool == "conversation.save_message":
-            conversation_save(
-                params["conversation_id"],
-                params["role"],
-                params["content"]
-            )
-            return {"status": "saved"}
 
-        if tool == "conversation.load":
-            return {
-                "messages": load_messages(params["conversation_id"])
-            }
+def dispatch(tool: str, params: dict):
+    if not METRICS:
+        return _dispatch(tool, params)
+    labels = (("tool", tool if tool in TOOLS else "(unknown)"),)
+    prev = registry.set_tool(labels[0][1])  # SQL run from here counts for this tool
+    t0 = time.perf_counter()
+    try:
+        res = _dispatch(tool, params)
+    finally:
+        registry.set_tool(prev)
+    registry.observe("food_tool_seconds", labels, time.perf_counter() - t0)
+    registry.inc("food_tool_calls_total", labels)
+    if isinstance(res, dict) and isinstance(res.get("error"), dict):
+        registry.inc("food_tool_errors_total", labels + (("code", res["error"].get("code")),))
+    return res
 
-        return {"error": {"code": "UNKNOWN_TOOL", "message": tool}}
 
+def _dispatch(tool: str, params: dict):
+    try:
+        store = get_storage()
+        # conditional reads: the client sends the etag of the answer it holds
+        # (null the first time) and gets {"not_modified": true} back while it
+        # is still current; the tag is read before the answer, so it is never
+        # newer than the body it is sent with
+        tag = None
+        if "if_none_match" in params and tool in CONDITIONAL_TOOLS:
+            tag = store.etag(tool, params)
+            if tag is not None and tag == params["if_none_match"]:
+                return {"not_modified": True, "etag": tag}
+        res = store.call(tool, params)
+        if tag is not None and isinstance(res, dict) and "error" not in res:
+            res = {**res, "etag": tag}
+        return res
+    except InvalidFields as e:
+        return {"error": {"code": "INVALID_FIELDS", "message": str(e)}}
+    except InvalidParams as e:
+        return {"error": {"code": "INVALID_PARAMS", "message": str(e)}}
     except Exception as e:
         return {"error": {"code": "SERVER_ERROR", "message": str(e)}}
 
@@ -135,55 +725,242 @@ def user_login_or_create(p):
 
 
 def restaurants_search(p):
+    # invalid projections surface as INVALID_FIELDS from invoke()
+    fields, select = projection(p.get("fields"), RESTAURANT_FIELDS, RESTAURANT_FIELDS, required=("id",))
+    menu_fields, menu_select = projection(p.get("menu_fields"), MENU_FIELDS, MENU_FIELDS)
+    menu_limit = parse_menu_limit(p)
+    columnar = wants_columnar(p)
+    filters = search_filters(p)
+    key = (_search_key(filters), fields, select, menu_select, menu_limit, columnar)
+    index = get_catalog_index()
+    if index is not None:
+        snapshot = index.snapshot
+        return _coalesced(
+            ("index", snapshot.version) + key,
+            lambda: snapshot.search(fields, select, menu_select, menu_limit, columnar, filters),
+        )
     try:
-        db = get_db()
-        area = p.get("area") or None
-        cuisine = p.get("cuisine") or None
+        db = get_catalog_db()
+        cache = catalog_cache(db)
+        if cache is not None:
+            hit = cache.searches.get(key)
+            if hit is not None:
+                return hit
+        version = cache.versions.seen if cache is not None else _catalog_version(db)
+        return _coalesced(
+            ("sql", version) + key,
+            lambda: _search_sql_path(db, cache, key, fields, select, menu_select, menu_limit, columnar, filters),
+        )
+    except Exception as e:
+        print("Error in restaurants_search:", str(e))
+        return {"error": {"code": "SERVER_ERROR", "message": str(e)}}
 
-        # 1️⃣ Get matching restaurants
-        restaurants = db.execute(
-            """
-            SELECT *
-            FROM restaurants
-            WHERE is_open = 1
-            AND (:area IS NULL OR LOWER(area) LIKE '%' || LOWER(:area) || '%')
-            AND (:cuisine IS NULL OR LOWER(cuisine_tags) LIKE '%' || LOWER(:cuisine) || '%')
-            """,
-            {
-                "area": area,
-                "cuisine": cuisine
-            }
-        ).fetchall()
 
-        result = []
-        # print("Restaurants found:", [dict(r) for r in restaurants])
+def _search_sql_path(db, cache, key, fields, select, menu_select, menu_limit, columnar, filters):
+    # versions as of before the read; the matched ids are only known after it
+    as_of = cache.versions.seen if cache is not None else None
+    # 1️⃣ Get matching restaurants
+    restaurants = db.execute(_search_sql(select), filters).fetchall()
+    id_pos = select.index("id")
+
+    if columnar:
+        result = _search_columnar(db, cache, restaurants, select, menu_select, menu_limit)
+    else:
+        results = []
+        drop_id = "id" not in fields
 
         # 2️⃣ For each restaurant, fetch matching menu items
         for r in restaurants:
-            menu_items = db.execute(
-            "SELECT * FROM menu_items WHERE restaurant_id = ? AND is_available = 1",
-            (r["id"],)
-            ).fetchall()
-
-            result.append({
-                "restaurant": dict(r),
-                "menu": [dict(m) for m in menu_items]
+            menu_items = _menu_rows(db, cache, r[id_pos], menu_select, menu_limit)
+
+            restaurant = dict(zip(select, r))
+            if drop_id:
+                del restaurant["id"]
+            results.append({
+                "restaurant": restaurant,
+                "menu": [dict(zip(menu_select, m)) for m in menu_items]
             })
-            print(f"Menu items for restaurant {r['id']}:", menu_items)
-        print("Final result:", result)  
-        return {"results": result}
-    except Exception as e:
-        print("Error in restaurants_search:", str(e))
-        return {"error": {"code": "SERVER_ERROR", "message": str(e)}}
+        result = {"results": results}
+    if cache is not None:
+        # which restaurants match changes with any restaurant (or, for a
+        # dish filter, any menu); the answer itself with the matched ones
+        deps = [MEMBERSHIP] + [r[id_pos] for r in restaurants]
+        if filters["dish"] is not None:
+            deps.append(WHOLE_CATALOG)
+        cache.searches.put(key, result, cache.versions.deps(deps, as_of))
+    return result
+
+
+def _search_key(filters: dict) -> tuple:
+    # LIKE / LOWER() fold ASCII case only, so only ASCII needles are folded here
+    return tuple(
+        (k, v.lower() if isinstance(v, str) and v.isascii() else v)
+        for k, v in sorted(filters.items())
+    )
+
+
+def _search_columnar(db, cache, restaurants, select, menu_select, menu_limit):
+    # menus[i] holds the menu rows of restaurants[i]
+    id_pos = select.index("id")
+    menus = [_menu_rows(db, cache, r[id_pos], menu_select, menu_limit) for r in restaurants]
+    return {
+        "format": "columnar",
+        "restaurant_columns": select,
+        "menu_columns": menu_select,
+        "restaurants": restaurants,
+        "menus": menus,
+    }
+
+
+def _menu_rows(db, cache, restaurant_id, select, limit=None) -> list:
+    """Available items of one restaurant as `select` tuples; the cache keeps
+    every column of the whole menu, so one entry serves any projection."""
+    if cache is None or not isinstance(restaurant_id, int):
+        args = (restaurant_id,) if limit is None else (restaurant_id, limit)
+        return db.execute(_menu_sql(select, limit is not None), args).fetchall()
+    rows = cache.menus.get(restaurant_id)
+    if rows is None:
+        # before the read, so a sync landing during it leaves the entry stale
+        deps = cache.versions.deps((restaurant_id,))
+        rows = db.execute(_menu_sql(ALL_MENU_FIELDS, False), (restaurant_id,)).fetchall()
+        cache.menus.put(restaurant_id, rows, deps)
+    pick = _menu_picker(select)
+    return [pick(r) for r in rows[:limit]]
+
+
+ALL_MENU_FIELDS = tuple(MENU_FIELDS)
+
+
+@functools.lru_cache(maxsize=256)
+def _menu_picker(select: tuple):
+    if select == ALL_MENU_FIELDS:
+        return lambda r: r
+    positions = [ALL_MENU_FIELDS.index(f) for f in select]
+    return lambda r: tuple(r[i] for i in positions)
 
 
 def menus_list(p):
-    db = get_db()
-    rows = db.execute(
-        "SELECT * FROM menu_items WHERE restaurant_id = ? AND is_available = 1",
-        (p["restaurant_id"],)
-    ).fetchall()
-    return {"menu": [dict(r) for r in rows]}
+    fields, select = projection(p.get("fields"), MENU_FIELDS, MENU_FIELDS)
+    columnar = wants_columnar(p)
+    db = get_catalog_db()
+    restaurant_id = p["restaurant_id"]
+    if isinstance(restaurant_id, str) and restaurant_id.isdigit():
+        restaurant_id = int(restaurant_id)
+    rows = _menu_rows(db, catalog_cache(db), restaurant_id, select)
+    if columnar:
+        return {"format": "columnar", "columns": select, "rows": rows}
+    return {"menu": [dict(zip(select, r)) for r in rows]}
+
+
+def catalog_version(p):
+    return {"version": _catalog_version(get_catalog_db())}
+
+
+def _catalog_version(db) -> int:
+    row = db.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+# ---------- Streaming (NDJSON) ----------
+# /invoke_stream walks the cursor with fetchmany and sends one JSON record per
+# line (a search entry or a menu item), so memory per request is bounded by
+# the batch size instead of the match set.
+STREAM_BATCH = 200
+NDJSON = "application/x-ndjson"
+
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj, ensure_ascii=False).encode()
+
+
+def _fetch_iter(cursor, size: int):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def stream_restaurants_search(db, p, size):
+    fields, select = projection(p.get("fields"), RESTAURANT_FIELDS, RESTAURANT_FIELDS, required=("id",))
+    menu_fields, menu_select = projection(p.get("menu_fields"), MENU_FIELDS, MENU_FIELDS)
+    menu_limit = parse_menu_limit(p)
+    cursor = db.execute(_search_sql(select), search_filters(p))
+    id_pos = select.index("id")
+    drop_id = "id" not in fields
+    menu_sql = _menu_sql(menu_select, menu_limit is not None)
+
+    def records():
+        for r in _fetch_iter(cursor, size):
+            args = (r[id_pos],) if menu_limit is None else (r[id_pos], menu_limit)
+            restaurant = dict(zip(select, r))
+            if drop_id:
+                del restaurant["id"]
+            yield {
+                "restaurant": restaurant,
+                "menu": [dict(zip(menu_select, m)) for m in db.execute(menu_sql, args)],
+            }
+    return records()
+
+
+def stream_menus_list(db, p, size):
+    fields, select = projection(p.get("fields"), MENU_FIELDS, MENU_FIELDS)
+    cursor = db.execute(_menu_sql(select, False), (p["restaurant_id"],))
+    return (dict(zip(select, m)) for m in _fetch_iter(cursor, size))
+
+
+STREAM_TOOLS = {
+    "restaurants.search": stream_restaurants_search,
+    "menus.list": stream_menus_list,
+}
+
+
+def _ndjson(records, db, size):
+    # one chunk per batch; the connection is closed when the stream ends or
+    # the client goes away
+    try:
+        buf = []
+        for record in records:
+            buf.append(_dumps(record))
+            if len(buf) >= size:
+                yield b"\n".join(buf) + b"\n"
+                buf = []
+        if buf:
+            yield b"\n".join(buf) + b"\n"
+    except Exception as e:
+        yield _dumps({"error": {"code": "SERVER_ERROR", "message": str(e)}}) + b"\n"
+    finally:
+        db.close()
+
+
+@app.post("/invoke_stream")
+def invoke_stream(req: InvokeRequest, request: Request):
+    limited = _rate_limited(request, [req])
+    if limited is not None:
+        return limited
+    handler = STREAM_TOOLS.get(req.tool)
+    if handler is None:
+        return encode_response({"error": {"code": "UNKNOWN_TOOL", "message": f"{req.tool} does not stream"}})
+    if not _on_sqlite():
+        # no server-side cursor elsewhere: the whole result, one record per line
+        res = dispatch(req.tool, {k: v for k, v in req.params.items() if k != "format"})
+        if "error" in res:
+            return encode_response(res, request.headers.get("accept", ""))
+        records = res["results"] if req.tool == "restaurants.search" else res["menu"]
+        return StreamingResponse((_dumps(r) + b"\n" for r in records), media_type=NDJSON)
+    # own connection: the generator runs across threadpool threads
+    db = connect_catalog(check_same_thread=False)
+    try:
+        size = max(1, int(req.params.get("batch_size") or STREAM_BATCH))
+        records = handler(db, req.params, size)
+    except Exception as e:
+        db.close()
+        if isinstance(e, InvalidFields):
+            error = {"code": "INVALID_FIELDS", "message": str(e)}
+        else:
+            error = {"code": "SERVER_ERROR", "message": str(e)}
+        return encode_response({"error": error}, request.headers.get("accept", ""))
+    return StreamingResponse(_ndjson(records, db, size), media_type=NDJSON)
 
 
 def cart_ensure(p):
@@ -273,6 +1050,7 @@ def cart_add_item(p):
         FROM cart_items ci
         JOIN menu_items mi ON mi.id = ci.menu_item_id
         WHERE ci.cart_id = ?
+        ORDER BY ci.id
         """,
         (cart_id,)
     ).fetchall()
@@ -289,23 +1067,54 @@ def cart_add_item(p):
 
 
 
-def cart_view(p):
+
+def cart_add_items(p):
+    """Add several {menu_item_id, quantity} lines in one transaction; nothing
+    is applied unless every item exists and is available."""
+    fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+    cart_id = p["cart_id"]
+    wanted = parse_items(p)
+
     db = get_db()
-    rows = db.execute("""
-        SELECT mi.name, ci.quantity, ci.unit_price_cents,
-               ci.quantity * ci.unit_price_cents AS total
-        FROM cart_items ci
-        JOIN menu_items mi ON mi.id = ci.menu_item_id
-        WHERE ci.cart_id = ?
-    """, (p["cart_id"],)).fetchall()
+    marks = ",".join("?" * len(wanted))
+    found = {r[0]: r for r in db.execute(
+        f"SELECT id, price_cents, is_available FROM menu_items WHERE id IN ({marks})",
+        tuple(wanted)
+    ).fetchall()}
+    missing = [i for i in wanted if i not in found]
+    if missing:
+        return {"error": {"code": "NOT_FOUND", "message": f"menu items not found: {missing}"}}
+    unavailable = [i for i in wanted if found[i][2] != 1]
+    if unavailable:
+        return {"error": {"code": "NOT_FOUND", "message": f"menu items not available: {unavailable}"}}
+    prices = {i: r[1] for i, r in found.items()}
+
+    # needs the unique (cart_id, menu_item_id) index from schema.sql
+    db.executemany(
+        """
+        INSERT INTO cart_items(cart_id, menu_item_id, quantity, unit_price_cents)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(cart_id, menu_item_id) DO UPDATE SET quantity = quantity + excluded.quantity
+        """,
+        [(cart_id, i, q, prices[i]) for i, q in wanted.items()]
+    )
+    db.commit()
 
-    subtotal = sum(r["total"] for r in rows)
+    rows = db.execute(_cart_sql(select), (cart_id,)).fetchall()
     return {
-        "items": [dict(r) for r in rows],
-        "subtotal_rupees": subtotal / 100
+        "status": "items_added",
+        "added": [{"menu_item_id": i, "quantity": q} for i, q in wanted.items()],
+        "cart": cart_result(fields, select, rows),
     }
 
 
+def cart_view(p):
+    fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+    db = get_read_db()
+    rows = db.execute(_cart_sql(select), (p["cart_id"],)).fetchall()
+    return cart_result(fields, select, rows)
+
+
 def cart_update_item(p):
     db = get_db()
 
@@ -357,33 +1166,170 @@ def cart_clear(p):
 
 def orders_create(p):
     db = get_db()
-    order_id = str(uuid.uuid4())
+    order_id = _order_id()
 
     subtotal = db.execute("""
         SELECT SUM(quantity * unit_price_cents) FROM cart_items WHERE cart_id = ?
     """, (p["cart_id"],)).fetchone()[0] or 0
 
-    delivery = 4000  # flat delivery fee in cents
+    delivery = DELIVERY_FEE_CENTS
     total = subtotal + delivery
 
+    # no login yet: the cart id stands in for the user unless one is given
+    user_id = p.get("user_id") or p["cart_id"]
+
+    db.execute("""
+        INSERT INTO orders(id, cart_id, user_id, status, subtotal_cents, delivery_fee_cents, total_cents)
+        VALUES (?, ?, ?, 'PLACED', ?, ?, ?)
+    """, (order_id, p["cart_id"], user_id, subtotal, delivery, total))
+
+    # snapshot the lines so the order can be shown and reordered later
     db.execute("""
-        INSERT INTO orders(id, cart_id, status, subtotal_cents, delivery_fee_cents, total_cents)
-        VALUES (?, ?, 'PLACED', ?, ?, ?)
-    """, (order_id, p["cart_id"], subtotal, delivery, total))
+        INSERT INTO order_items(order_id, menu_item_id, menu_item_name, unit_price_cents, quantity)
+        SELECT ?, ci.menu_item_id, mi.name, ci.unit_price_cents, ci.quantity
+        FROM cart_items ci
+        JOIN menu_items mi ON mi.id = ci.menu_item_id
+        WHERE ci.cart_id = ?
+        ORDER BY ci.id
+    """, (order_id, p["cart_id"]))
 
     db.commit()
     return {"order_id": order_id, "total_rupees": total / 100}
 
 
+def orders_list_recent(p):
+    limit = recent_limit(p)
+    db = get_db()
+    # served by idx_orders_user_placed
+    orders = db.execute("""
+        SELECT id, status, total_cents, placed_at
+        FROM orders
+        WHERE user_id = ?
+        ORDER BY placed_at DESC
+        LIMIT ?
+    """, (p["user_id"], limit)).fetchall()
+
+    items = {}
+    if orders:
+        marks = ",".join("?" * len(orders))
+        items = dict(db.execute(f"""
+            SELECT order_id, group_concat(quantity || 'x ' || menu_item_name, ', ')
+            FROM order_items
+            WHERE order_id IN ({marks})
+            GROUP BY order_id
+        """, tuple(o["id"] for o in orders)).fetchall())
+
+    return {"orders": [
+        {
+            "order_id": o["id"],
+            "status": o["status"],
+            "placed_at": o["placed_at"],
+            "total_rupees": o["total_cents"] / 100,
+            "items": items.get(o["id"], ""),
+        }
+        for o in orders
+    ]}
+
+
+_ORDER_LINES_SQL = """
+    SELECT oi.menu_item_id, oi.menu_item_name, oi.quantity, oi.unit_price_cents,
+           mi.price_cents, COALESCE(mi.is_available, 0) AS available
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    LEFT JOIN menu_items mi ON mi.id = oi.menu_item_id
+    WHERE oi.order_id = ? AND o.user_id = ?
+    ORDER BY oi.id
+"""
+
+
+def _order_lines_elsewhere(order_id: str, user_id: str) -> list:
+    """Sharded: an order lives with the cart that placed it, so when the
+    caller's cart is on another shard look for it on the others."""
+    here = current_path()
+    for path in DB_SHARDS:
+        if path == here:
+            continue
+        conn = connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            lines = conn.execute(_ORDER_LINES_SQL, (order_id, user_id)).fetchall()
+        finally:
+            conn.close()
+        if lines:
+            return lines
+    return []
+
+
+def orders_reorder(p):
+    """Copy a past order's lines into the cart at today's prices; lines whose
+    dish is gone or unavailable are reported instead of added. Only the user
+    who placed the order (default: the cart, as in orders.create_mock) can."""
+    fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+    order_id, cart_id = p["order_id"], p["cart_id"]
+    user_id = p.get("user_id") or cart_id
+    db = get_db()
+
+    lines = db.execute(_ORDER_LINES_SQL, (order_id, user_id)).fetchall()
+    local = bool(lines)
+    if not lines and RING is not None:
+        lines = _order_lines_elsewhere(order_id, user_id)
+    if not lines:
+        return {"error": {"code": "NOT_FOUND", "message": f"no items for order {order_id}"}}
+
+    db.execute("INSERT OR IGNORE INTO carts(id) VALUES (?)", (cart_id,))
+    # one statement for all lines; needs the unique (cart_id, menu_item_id) index
+    upsert = """
+        ON CONFLICT(cart_id, menu_item_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            unit_price_cents = excluded.unit_price_cents
+    """
+    if local:
+        db.execute("""
+            INSERT INTO cart_items(cart_id, menu_item_id, quantity, unit_price_cents)
+            SELECT ?, mi.id, oi.quantity, mi.price_cents
+            FROM order_items oi
+            JOIN menu_items mi ON mi.id = oi.menu_item_id
+            WHERE oi.order_id = ? AND mi.is_available = 1
+            ORDER BY oi.id
+        """ + upsert, (cart_id, order_id))
+    else:
+        # the order's lines are on another shard: insert the ones read there
+        # (the catalog is shared, so their prices are today's)
+        available = [l for l in lines if l["available"]]
+        if available:
+            db.execute(
+                "INSERT INTO cart_items(cart_id, menu_item_id, quantity, unit_price_cents) VALUES "
+                + ",".join(["(?, ?, ?, ?)"] * len(available)) + upsert,
+                [v for l in available for v in (cart_id, l["menu_item_id"], l["quantity"], l["price_cents"])],
+            )
+    db.commit()
+
+    rows = db.execute(_cart_sql(select), (cart_id,)).fetchall()
+    return {
+        "status": "reordered",
+        "order_id": order_id,
+        "unavailable": [
+            {"menu_item_id": l["menu_item_id"], "name": l["menu_item_name"], "quantity": l["quantity"]}
+            for l in lines if not l["available"]
+        ],
+        "repriced": [
+            {"name": l["menu_item_name"], "was_rupees": l["unit_price_cents"] / 100, "now_rupees": l["price_cents"] / 100}
+            for l in lines if l["available"] and l["price_cents"] != l["unit_price_cents"]
+        ],
+        "cart": cart_result(fields, select, rows),
+    }
+
+
 
 
 # ---------- Conversation Logging ----------
 
-def conversation_create(cart_id: str) -> int:
+def conversation_create(cart_id: str, conversation_id: int = None) -> int:
+    # conversation_id is only given when sharded; otherwise AUTOINCREMENT
     conn = get_db()
     cursor = conn.execute(
-        "INSERT INTO conversations (cart_id) VALUES (?)",
-        (cart_id,)
+        "INSERT INTO conversations (id, cart_id) VALUES (?, ?)",
+        (conversation_id, cart_id)
     )
     conn.commit()
 
@@ -413,3 +1359,243 @@ def load_messages(conversation_id: int):
     conn.close()
 
     return [(row["role"], row["content"]) for row in rows]
+
+
+# ---------- Conversation write-behind ----------
+# conversation.append queues messages for one collector thread per worker
+# (and shard), which every CONVERSATION_FLUSH_MS hands everything queued (all sessions) to
+# the writer as multi-row INSERTs in one job. A request with wait=true returns
+# once its rows are committed; queue order is commit order, so messages stay
+# ordered per conversation. If that takes longer than CONVERSATION_WAIT_S it
+# answers {"status": "queued"} (not an error: the rows are still coming), and
+# since messages carry a client message_id, sending them again is harmless.
+CONVERSATION_FLUSH_MS = float(os.getenv("CONVERSATION_FLUSH_MS", "20"))
+CONVERSATION_WAIT_S = float(os.getenv("CONVERSATION_WAIT_S", "30"))
+ROWS_PER_INSERT = 240  # 4 params per row, under SQLite's 999 variable limit
+
+
+def _insert_messages(db, rows):
+    for i in range(0, len(rows), ROWS_PER_INSERT):
+        chunk = rows[i:i + ROWS_PER_INSERT]
+        db.execute(
+            "INSERT INTO messages (conversation_id, role, content, message_id) VALUES "
+            + ",".join(["(?, ?, ?, ?)"] * len(chunk))
+            + " ON CONFLICT(message_id) DO NOTHING",
+            [v for r in chunk for v in r],
+        )
+
+
+class MessageWriter:
+    def __init__(self, path: str, flush_ms: float = CONVERSATION_FLUSH_MS, max_rows: int = 5000):
+        self.path = path
+        self.flush_ms = flush_ms
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._conn = None  # only used with DB_WRITER=0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def submit(self, rows) -> Future:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"message-writer:{self.path}", daemon=True)
+                    self._thread.start()
+        fut = Future()
+        self._queue.put((rows, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            n = len(pending[0][0])
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while n < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                n += len(item[0])
+            self._flush(pending)
+
+    def _write(self, rows):
+        if DB_WRITER:
+            get_writer(self.path).call(lambda: _insert_messages(get_db(), rows))
+            return
+        if self._conn is None:
+            self._conn = connect(self.path)
+        try:
+            _insert_messages(self._conn, rows)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+
+    def _flush(self, pending):
+        rows = [r for batch, _ in pending for r in batch]
+        try:
+            self._write(rows)
+        except Exception as e:
+            for _, fut in pending:
+                fut.set_exception(e)
+            return
+        self.flushes += 1
+        self.rows_written += len(rows)
+        for batch, fut in pending:
+            fut.set_result(len(batch))
+
+    def stats(self) -> dict:
+        return {"queue_depth": self._queue.qsize(), "flushes": self.flushes, "rows_written": self.rows_written}
+
+
+# one per shard (DB_PATH when unsharded)
+_message_writers = {}
+_message_writers_lock = threading.Lock()
+
+
+def get_message_writer(path: str) -> MessageWriter:
+    with _message_writers_lock:
+        m = _message_writers.get(path)
+        if m is None:
+            m = _message_writers[path] = MessageWriter(path)
+        return m
+
+
+def conversation_append(p):
+    rows = parse_messages(p)
+    if getattr(_batch_local, "conn", None) is not None:
+        # inside /invoke_batch or a writer job: part of that transaction
+        _insert_messages(get_db(), rows)
+        return {"status": "saved", "count": len(rows)}
+    by_shard = {}
+    for r in rows:
+        by_shard.setdefault(shard_for(str(r[0])), []).append(r)
+    futs = [get_message_writer(path).submit(shard_rows) for path, shard_rows in by_shard.items()]
+    if not p.get("wait"):
+        return {"status": "queued", "count": len(rows)}
+    deadline = time.monotonic() + CONVERSATION_WAIT_S
+    for fut in futs:
+        try:
+            fut.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            return {"status": "queued", "count": len(rows)}
+    return {"status": "saved", "count": len(rows)}
+
+
+# ---------- Storage ----------
+class SQLiteStorage(Storage):
+    """The handlers above; execute() adds the writer and shards on top."""
+
+    name = "sqlite"
+    restaurants_search = staticmethod(restaurants_search)
+    menus_list = staticmethod(menus_list)
+    catalog_version = staticmethod(catalog_version)
+    cart_ensure = staticmethod(cart_ensure)
+    cart_add_item = staticmethod(cart_add_item)
+    cart_add_items = staticmethod(cart_add_items)
+    cart_view = staticmethod(cart_view)
+    cart_update_item = staticmethod(cart_update_item)
+    cart_remove_item = staticmethod(cart_remove_item)
+    cart_clear = staticmethod(cart_clear)
+    orders_create_mock = staticmethod(orders_create)
+    orders_list_recent = staticmethod(orders_list_recent)
+    orders_reorder = staticmethod(orders_reorder)
+    conversation_append = staticmethod(conversation_append)
+
+    def conversation_create(self, p):
+        return {"conversation_id": conversation_create(p["cart_id"], p.get("conversation_id"))}
+
+    def conversation_save_message(self, p):
+        conversation_save(p["conversation_id"], p["role"], p["content"])
+        return {"status": "saved"}
+
+    def conversation_load(self, p):
+        return {"messages": load_messages(p["conversation_id"])}
+
+    def etag(self, tool, p):
+        try:
+            if tool == "restaurants.search":
+                index = get_catalog_index()
+                if index is not None:
+                    return make_etag(p, "i", index.snapshot.version)
+                return make_etag(p, _catalog_version(get_catalog_db()))
+            if tool == "menus.list":
+                db = get_catalog_db()
+                cache = catalog_cache(db)
+                rid = p.get("restaurant_id")
+                if isinstance(rid, str) and rid.isdigit():
+                    rid = int(rid)
+                if cache is not None and isinstance(rid, int):
+                    return make_etag(p, "r", cache.versions.version(rid))  # only this menu's changes
+                return make_etag(p, _catalog_version(db))
+            if tool == "cart.view":
+                # names come from the catalog, lines from the cart
+                row = get_read_db().execute(
+                    "SELECT version FROM cart_versions WHERE cart_id = ?", (p.get("cart_id"),)
+                ).fetchone()
+                return make_etag(p, row[0] if row else 0, _catalog_version(get_catalog_db()))
+        except sqlite3.OperationalError:  # schema*.sql not re-run yet
+            return None
+        return None
+
+    def batch(self, run, writes: bool = True):
+        # writing batches run as one job on the writer (on its connection)
+        if DB_WRITER and writes:
+            return get_writer().call(lambda: run(Savepoints(_batch_local.conn)))
+        conn = connect(isolation_level=None)
+        _batch_local.conn = conn
+        try:
+            conn.execute("BEGIN IMMEDIATE" if writes else "BEGIN")
+            result = run(Savepoints(conn))
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            _batch_local.conn = None
+            conn.close()
+
+
+def open_storage(kind: str) -> Storage:
+    if kind == "sqlite":
+        return SQLiteStorage()
+    if kind == "memory":
+        conn = connect_catalog()
+        try:
+            return MemoryStorage.from_sqlite(conn)
+        finally:
+            conn.close()
+    if kind == "postgres":
+        return PostgresStorage(os.environ["POSTGRES_DSN"], max_size=int(os.getenv("PG_POOL_MAX", "10")))
+    raise ValueError(f"unknown STORAGE {kind!r}; expected sqlite, memory or postgres")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = open_storage(STORAGE)
+    return _storage
+
+
+def use_storage(storage: Storage):
+    """Swap the store in-process (contract checks, benchmarks)."""
+    global _storage
+    _storage = storage
+
+
+def _on_sqlite() -> bool:
+    return isinstance(get_storage(), SQLiteStorage)
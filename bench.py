@@ -0,0 +1,634 @@
+# bench.py
+# Offline latency benchmarks. Needs the backend running locally:
+#   uvicorn backend:app --port 8765
+#   python bench.py agent --sessions 20 --concurrency 5
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+
+def _summary(label: str, samples_ms):
+    samples = sorted(samples_ms)
+    if not samples:
+        print(f"{label}: no samples")
+        return
+    p = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    print(
+        f"{label}: n={len(samples)} mean={statistics.mean(samples):.1f}ms "
+        f"p50={p(0.50):.1f}ms p95={p(0.95):.1f}ms p99={p(0.99):.1f}ms max={samples[-1]:.1f}ms"
+    )
+
+
+# ---------------------------
+# agent: full agent -> tool -> backend path with the scripted fake model
+# ---------------------------
+def bench_agent(args):
+    os.environ["LLM_PROVIDER"] = "fake"
+    if args.script:
+        os.environ["FAKE_LLM_SCRIPT"] = args.script
+    if args.latency_ms is not None:
+        os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+        os.environ["FAKE_LLM_JITTER_MS"] = "0"
+
+    import createagent  # reads the env above at import time
+
+    turns = [t["user"] for t in createagent.llm.turns]
+    turn_ms = []
+
+    async def session(sem):
+        async with sem:
+            conv = await createagent.aclient.invoke("conversation.create", {"cart_id": createagent.CART_ID})
+            for q in turns:
+                t0 = time.perf_counter()
+                await createagent.chat_turn(conv["conversation_id"], q)
+                turn_ms.append((time.perf_counter() - t0) * 1000)
+
+    async def run():
+        sem = asyncio.Semaphore(args.concurrency)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.gather(*(session(sem) for _ in range(args.sessions)))
+        finally:
+            await createagent.conversation_log.flush()
+            await createagent.aclient.aclose()
+        return time.perf_counter() - t0
+
+    wall = asyncio.run(run())
+    print(f"sessions={args.sessions} concurrency={args.concurrency} turns/session={len(turns)} "
+          f"model_latency={createagent.llm.latency_ms}ms wall={wall:.2f}s")
+    _summary("turn", turn_ms)
+
+
+# ---------------------------
+# hedge: primary-only vs hedged across two stand-in providers with tails
+# ---------------------------
+def bench_hedge(args):
+    from langchain_core.messages import HumanMessage
+    from fakellm import ScriptedChatModel
+    from hedging import HedgedChatModel
+
+    def standin(seed, latency_ms):
+        return ScriptedChatModel.from_file(
+            args.script or "fake_script.json", latency_ms=latency_ms, jitter_ms=latency_ms / 4,
+            tail_ms=args.tail_ms, tail_prob=args.tail_prob, seed=seed)
+
+    messages = [HumanMessage(standin(0, 0).turns[0]["user"])]
+    primary = standin(1, args.latency_ms)
+    hedged = HedgedChatModel(
+        names=["primary", "backup"],
+        models=[standin(1, args.latency_ms), standin(2, args.latency_ms * 1.5)],
+        hedge_after_ms=args.hedge_after_ms,
+        default_hedge_ms=args.latency_ms * 3,
+    )
+
+    async def run(model):
+        samples = []
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            await model.ainvoke(messages)
+            samples.append((time.perf_counter() - t0) * 1000)
+        return samples
+
+    _summary("primary only", asyncio.run(run(primary)))
+    _summary("hedged", asyncio.run(run(hedged)))
+    print("counters:", hedged.counters)
+    print("latency:", hedged.tracker.snapshot())
+
+
+# ---------------------------
+# tool-output: raw JSON vs compact rendering of a restaurants.search payload
+# ---------------------------
+def synthetic_search(n_restaurants: int, items_per: int) -> dict:
+    """Backend-shaped restaurants.search result with every column present."""
+    areas = ["Guindy", "T. Nagar", "Adyar", "Velachery", "OMR", "Anna Nagar"]
+    dishes = ["Chicken Biryani", "Egg Biryani", "Masala Dosa", "Filter Coffee", "Meals", "Paneer Butter Masala"]
+    results, item_id = [], 1
+    for rid in range(1, n_restaurants + 1):
+        menu = []
+        for k in range(items_per):
+            menu.append({
+                "id": item_id, "restaurant_id": rid, "name": dishes[k % len(dishes)],
+                "description": "House special, freshly prepared", "price_cents": 8000 + 1000 * (k % 15),
+                "is_available": 1, "category": "Main Course",
+            })
+            item_id += 1
+        results.append({
+            "restaurant": {
+                "id": rid, "name": f"Restaurant {rid}", "area": areas[rid % len(areas)], "city": "Chennai",
+                "cuisine_tags": "South Indian,Biryani", "rating": round(3.5 + (rid % 15) / 10, 1),
+                "price_level": 1 + rid % 3, "is_open": 1,
+            },
+            "menu": menu,
+        })
+    return {"results": results}
+
+
+def bench_tool_output(args):
+    import json
+    import tool_format
+
+    def timed(fn, payload):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            out = fn(payload)
+        return out, (time.perf_counter() - t0) * 1000 / args.repeat
+
+    raw = lambda p: json.dumps(p, ensure_ascii=False)
+    compact = lambda p: tool_format.render("restaurants.search", p)
+
+    def uncapped(p):
+        saved = dict(tool_format.TOKEN_CAPS)
+        tool_format.TOKEN_CAPS["restaurants.search"] = 10 ** 9
+        try:
+            return compact(p)
+        finally:
+            tool_format.TOKEN_CAPS.clear()
+            tool_format.TOKEN_CAPS.update(saved)
+
+    for n in args.restaurants:
+        payload = synthetic_search(n, args.items)
+        print(f"-- {n} restaurants x {args.items} items")
+        for label, fn in (("raw json", raw), ("compact (no cap)", uncapped), ("compact (capped)", compact)):
+            out, ms = timed(fn, payload)
+            print(f"{label:>18}: chars={len(out):>8} ~tokens={tool_format.estimate_tokens(out):>7} encode={ms:.3f}ms")
+
+
+# ---------------------------
+# serialization: /invoke encode + client decode + tool re-encode
+# ---------------------------
+def bench_serialization(args):
+    import json
+    import msgpack
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+
+    payload = synthetic_search(args.restaurants, args.items)
+
+    def old_path():
+        # FastAPI default: jsonable_encoder + stdlib json; client r.json() + _json
+        body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode()
+        return len(body), json.dumps(json.loads(body), ensure_ascii=False)
+
+    def orjson_path():
+        body = orjson.dumps(payload)
+        return len(body), orjson.dumps(orjson.loads(body)).decode()
+
+    def msgpack_path():
+        body = msgpack.packb(payload, use_bin_type=True)
+        return len(body), orjson.dumps(msgpack.unpackb(body, raw=False)).decode()
+
+    print(f"restaurants.search payload: {args.restaurants} restaurants x {args.items} items")
+    for label, fn in (("jsonable_encoder+json", old_path), ("orjson", orjson_path), ("msgpack", msgpack_path)):
+        samples = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            size, _ = fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        print(f"{label:>22}: wire={size / 1024:.0f}KiB", end="  ")
+        _summary("3-pass time", samples)
+
+
+# ---------------------------
+# columnar: rows vs format=columnar for restaurants.search on a synthetic catalog
+# ---------------------------
+def _synthetic_catalog(path: str, n_restaurants: int, items_per: int):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE restaurants (id INTEGER PRIMARY KEY, name TEXT NOT NULL, area TEXT, city TEXT,
+            cuisine_tags TEXT, rating REAL, price_level INTEGER, is_open INTEGER DEFAULT 1);
+        CREATE TABLE menu_items (id INTEGER PRIMARY KEY, restaurant_id INTEGER NOT NULL, name TEXT NOT NULL,
+            description TEXT, price_cents INTEGER NOT NULL, is_available INTEGER DEFAULT 1, category TEXT);
+        CREATE INDEX idx_menu_restaurant ON menu_items(restaurant_id);
+        CREATE TABLE catalog_meta (id INTEGER PRIMARY KEY, version INTEGER NOT NULL);
+        INSERT INTO catalog_meta VALUES (1, 1);
+        CREATE TABLE restaurant_versions (restaurant_id INTEGER PRIMARY KEY, version INTEGER NOT NULL);
+    """)
+    for entry in synthetic_search(n_restaurants, items_per)["results"]:
+        r = entry["restaurant"]
+        conn.execute("INSERT INTO restaurants VALUES (?,?,?,?,?,?,?,?)", tuple(r.values()))
+        conn.executemany("INSERT INTO menu_items VALUES (?,?,?,?,?,?,?)", [tuple(m.values()) for m in entry["menu"]])
+    conn.commit()
+    conn.close()
+
+
+def bench_columnar(args):
+    import tempfile
+    import orjson
+    import backend
+    from tool_format import render
+
+    path = os.path.join(tempfile.mkdtemp(), "catalog.db")
+    _synthetic_catalog(path, args.restaurants, args.items)
+    backend.DB_PATH = path
+    backend.CATALOG_INDEX = backend.CATALOG_CACHE = False  # SQL rows vs columnar; `bench search` covers the rest
+    backend.print = lambda *a, **k: None  # handler debug prints would dominate
+
+    params = {}
+    if args.compact:
+        params = {"fields": ["id", "name", "area", "rating", "cuisine_tags"],
+                  "menu_fields": ["id", "name", "price_cents"]}
+    print(f"restaurants.search: {args.restaurants} restaurants x {args.items} items"
+          f" ({'compact projection' if args.compact else 'all columns'})")
+    for fmt in ("rows", "columnar"):
+        p = dict(params, format=fmt)
+        server, client = [], []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            body = orjson.dumps(backend.restaurants_search(p))
+            t1 = time.perf_counter()
+            render("restaurants.search", orjson.loads(body))
+            t2 = time.perf_counter()
+            server.append((t1 - t0) * 1000)
+            client.append((t2 - t1) * 1000)
+        print(f"{fmt:>9}: wire={len(body) / 1024:.0f}KiB")
+        _summary("   query+encode", server)
+        _summary("  decode+render", client)
+
+
+# ---------------------------
+# search: restaurants.search on SQL vs the in-process catalog index
+# ---------------------------
+def _anon_kb():
+    """Anonymous (heap) memory of this process; mapped file pages don't count."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("Anonymous:"))
+    except (OSError, StopIteration):
+        return None
+
+
+def bench_search(args):
+    import gc
+    import tempfile
+    import backend
+    import catalog_snapshot
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "catalog.db")
+    _synthetic_catalog(path, args.restaurants, args.items)
+    backend.DB_PATH = path
+    backend.print = lambda *a, **k: None
+    # the agent's compact request shape, plus the filters it sends
+    base = {"fields": ["id", "name", "area", "rating", "cuisine_tags"],
+            "menu_fields": ["id", "name", "price_cents"], "menu_limit": 3, "format": "columnar"}
+    queries = [
+        {"area": "adyar"},
+        {"area": "nagar", "cuisine": "biryani"},
+        {"city": "chennai", "min_rating": 4.5, "price_level": 1},
+        {"dish": "paneer"},
+    ]
+    print(f"restaurants.search: {args.restaurants} restaurants x {args.items} items, {args.repeat} x {len(queries)} queries")
+    for mode in ("sql", "sql+cache", "index", "snapshot"):
+        backend.CATALOG_INDEX = not mode.startswith("sql")
+        backend.CATALOG_CACHE = mode == "sql+cache"
+        if mode == "snapshot":
+            built = backend.get_catalog_index().snapshot  # the in-memory one from "index"
+            backend.CATALOG_SNAPSHOT = os.path.join(tmp, "catalog.snap")
+            size = catalog_snapshot.write(built, backend.CATALOG_SNAPSHOT)
+            del built
+            print(f"  snapshot file: {size / 1024:.0f}KiB")
+        if backend.CATALOG_INDEX:
+            gc.collect()
+            anon, t0 = _anon_kb(), time.perf_counter()
+            backend.get_catalog_index()
+            opened = (time.perf_counter() - t0) * 1000
+        us, matches = [], 0
+        for q in queries:
+            p = dict(base, **q)
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                res = backend.restaurants_search(p)
+                us.append((time.perf_counter() - t0) * 1e6)
+            matches += len(res["restaurants"])
+        us.sort()
+        print(f"{mode:>10}: matches={matches} mean={statistics.mean(us):.0f}us"
+              f" p50={us[len(us) // 2]:.0f}us p95={us[int(len(us) * 0.95)]:.0f}us", end="")
+        if backend.CATALOG_INDEX:
+            del res
+            gc.collect()  # what stays allocated, not the last result
+            grown = "" if anon is None else f", heap +{(_anon_kb() - anon) / 1024:.1f}MiB"
+            print(f"  (open {opened:.1f}ms{grown})", end="")
+        print()
+
+
+# ---------------------------
+# burst: many sessions sending the same search at once, with and without
+# single-flight coalescing (SQL path, no cache)
+# ---------------------------
+def bench_burst(args):
+    import tempfile
+    import threading
+    import backend
+    from singleflight import SingleFlight
+
+    path = os.path.join(tempfile.mkdtemp(), "catalog.db")
+    _synthetic_catalog(path, args.restaurants, args.items)
+    backend.DB_PATH = path
+    backend.CATALOG_INDEX = backend.CATALOG_CACHE = False
+    backend.print = lambda *a, **k: None
+    p = {"area": "nagar", "cuisine": "biryani", "fields": ["id", "name", "rating"],
+         "menu_fields": ["name", "price_cents"], "menu_limit": 3}
+    print(f"restaurants.search: {args.sessions} identical concurrent calls x {args.bursts} bursts"
+          f" ({args.restaurants} restaurants x {args.items} items)")
+    for coalesce in (False, True):
+        backend.SEARCH_COALESCE = coalesce
+        backend.search_flights = SingleFlight()
+        samples, lock = [], threading.Lock()
+        for _ in range(args.bursts):
+            start = threading.Barrier(args.sessions)
+
+            def session():
+                start.wait()
+                t0 = time.perf_counter()
+                backend.restaurants_search(p)
+                with lock:
+                    samples.append((time.perf_counter() - t0) * 1000)
+            threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        executions = backend.search_flights.stats()["executions"] if coalesce else len(samples)
+        _summary(f"{'coalesced' if coalesce else 'separate':>9} ({executions} executions)", samples)
+
+
+# ---------------------------
+# writes: per-call commits vs the single-writer group commit (in process)
+# ---------------------------
+def bench_writes(args):
+    import sqlite3
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    import backend
+
+    path = os.path.join(tempfile.mkdtemp(), "writes.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(open("schema_catalog.sql").read())
+    conn.executescript(open("schema.sql").read())
+    conn.executescript(open("seed.sql").read())
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.commit()
+    conn.close()
+    backend.DB_PATH = path
+    backend.print = lambda *a, **k: None
+    item = sqlite3.connect(path).execute("SELECT id FROM menu_items LIMIT 1").fetchone()[0]
+
+    def client(n, use_writer):
+        backend.DB_WRITER = use_writer
+        errors, ms = 0, []
+        cart = f"bench-{use_writer}-{n}"
+        backend.execute("cart.ensure", {"cart_id": cart})
+        for _ in range(args.ops):
+            t0 = time.perf_counter()
+            res = backend.execute("cart.add_item", {"cart_id": cart, "menu_item_id": item, "quantity": 1})
+            ms.append((time.perf_counter() - t0) * 1000)
+            errors += isinstance(res, dict) and "error" in res
+        return errors, ms
+
+    print(f"{args.threads} threads x {args.ops} cart.add_item")
+    for label, use_writer in (("per-call commit", False), ("single writer", True)):
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            out = list(pool.map(lambda n: client(n, use_writer), range(args.threads)))
+        wall = time.perf_counter() - t0
+        errors = sum(e for e, _ in out)
+        total = args.threads * args.ops
+        print(f"{label:>16}: {total / wall:.0f} writes/s errors={errors}", end="  ")
+        _summary("latency", [m for _, ms in out for m in ms])
+    print("writer:", backend.get_writer().stats())
+
+
+def bench_shards(args):
+    import sqlite3
+    import multiprocessing
+    import tempfile
+    import backend
+    from sharding import HashRing
+
+    tmp = tempfile.mkdtemp()
+    catalog = os.path.join(tmp, "catalog.db")
+    conn = sqlite3.connect(catalog)
+    conn.executescript(open("schema_catalog.sql").read())
+    conn.executescript(open("seed.sql").read())
+    conn.commit()
+    item = conn.execute("SELECT id FROM menu_items LIMIT 1").fetchone()[0]
+    conn.close()
+    backend.CATALOG_DB = catalog
+    backend.DB_WRITER = not args.no_writer
+    backend.print = lambda *a, **k: None
+
+    mode = "per-call commit" if args.no_writer else "writer per shard"
+    print(f"{args.procs} process(es) x {args.threads} threads x {args.ops} cart.add_item / conversation.save_message, {mode}")
+    for n in args.shards:
+        paths = [os.path.join(tmp, f"shard{n}_{i}.db") for i in range(n)]
+        for path in paths:
+            conn = sqlite3.connect(path)
+            conn.executescript(open("schema.sql").read())
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.close()
+        backend.DB_SHARDS, backend.RING = paths, HashRing(paths)
+        jobs = [(args, item, p) for p in range(args.procs)]
+        if args.procs == 1:
+            out = [_shard_clients(*jobs[0])]
+        else:
+            # like uvicorn --workers: each process has its own writer per shard
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(args.procs) as pool:
+                out = pool.starmap(_shard_clients, jobs)
+        wall = max(w for _, _, w in out)
+        errors = sum(e for e, _, _ in out)
+        total = args.procs * args.threads * args.ops
+        print(f"{n:>2} shard(s): {total / wall:.0f} writes/s errors={errors}", end="  ")
+        _summary("latency", [m for _, ms, _ in out for m in ms])
+
+
+def _shard_clients(args, item, proc):
+    from concurrent.futures import ThreadPoolExecutor
+    import backend
+
+    def client(n):
+        errors, ms = 0, []
+        cart = f"bench-{proc}-{n}"
+        backend.execute("cart.ensure", {"cart_id": cart})
+        conv = backend.execute("conversation.create", {"cart_id": cart})["conversation_id"]
+        for i in range(args.ops):
+            t0 = time.perf_counter()
+            if i % 2:
+                res = backend.execute("conversation.save_message", {"conversation_id": conv, "role": "user", "content": "hi"})
+            else:
+                res = backend.execute("cart.add_item", {"cart_id": cart, "menu_item_id": item, "quantity": 1})
+            ms.append((time.perf_counter() - t0) * 1000)
+            errors += isinstance(res, dict) and "error" in res
+        return errors, ms
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        out = list(pool.map(client, range(args.threads)))
+    return sum(e for e, _ in out), [m for _, ms in out for m in ms], time.perf_counter() - t0
+
+
+def bench_storage(args):
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    import backend
+    from storage_contract import STORES
+
+    backend.print = lambda *a, **k: None
+    tmp = tempfile.mkdtemp()
+    # one turn's worth of tool traffic per op
+    ops = [
+        ("restaurants.search", lambda n: {"cuisine": "biryani", "fields": ["id", "name"], "menu_fields": ["id", "name"]}),
+        ("cart.add_item", lambda n: {"cart_id": f"bench-{n}", "menu_item_id": 3, "quantity": 1}),
+        ("cart.view", lambda n: {"cart_id": f"bench-{n}"}),
+        ("conversation.append", lambda n: {"messages": [{"conversation_id": n + 1, "role": "user", "content": "hi"}], "wait": True}),
+    ]
+
+    def client(n):
+        errors, ms = 0, []
+        for i in range(args.ops):
+            tool, params = ops[i % len(ops)]
+            t0 = time.perf_counter()
+            res = backend.execute(tool, params(n))
+            ms.append((time.perf_counter() - t0) * 1000)
+            errors += isinstance(res, dict) and "error" in res
+        return errors, ms
+
+    print(f"{args.threads} threads x {args.ops} calls (search / add_item / view / append)")
+    for kind in args.stores:
+        if kind == "postgres" and not os.getenv("POSTGRES_DSN"):
+            print(f"{kind:>8}: skipped (POSTGRES_DSN not set)")
+            continue
+        store = STORES[kind](tempfile.mkdtemp(dir=tmp))
+        backend.use_storage(store)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            out = list(pool.map(client, range(args.threads)))
+        wall = time.perf_counter() - t0
+        store.close()
+        print(f"{kind:>8}: {args.threads * args.ops / wall:.0f} calls/s errors={sum(e for e, _ in out)}", end="  ")
+        _summary("latency", [m for _, ms in out for m in ms])
+
+
+# ---------------------------
+# admission: well-behaved sessions next to runaway loops (needs the backend)
+# ---------------------------
+def bench_admission(args):
+    import httpx
+
+    async def session(http, n, bad, deadline, out):
+        cart = f"{'bad' if bad else 'good'}-{n}"
+        body = {"tool": "restaurants.search", "params": {"cart_id": cart, "cuisine": "biryani", "fields": ["id", "name"]}}
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            r = await http.post(args.url, json=body, headers={"X-Cart-Id": cart})
+            out.append(((time.perf_counter() - t0) * 1000, r.status_code))
+            if not bad:
+                await asyncio.sleep(args.think_ms / 1000)
+
+    async def run():
+        good, bad = [], []
+        limits = httpx.Limits(max_connections=args.good + args.bad)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as http:
+            deadline = time.perf_counter() + args.seconds
+            await asyncio.gather(
+                *(session(http, n, False, deadline, good) for n in range(args.good)),
+                *(session(http, n, True, deadline, bad) for n in range(args.bad)),
+            )
+        return good, bad
+
+    print(f"{args.good} sessions (1 call per {args.think_ms:.0f}ms) + {args.bad} runaway loops, {args.seconds:.0f}s against {args.url}")
+    good, bad = asyncio.run(run())
+    for label, out in (("good", good), ("runaway", bad)):
+        limited = sum(code == 429 for _, code in out)
+        print(f"{label:>8}: {len(out)} calls, {limited} got 429")
+        _summary("          admitted latency", [ms for ms, code in out if code == 200])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Food agent benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("agent", help="scripted end-to-end agent turns (no network)")
+    p.add_argument("--sessions", type=int, default=10)
+    p.add_argument("--concurrency", type=int, default=1)
+    p.add_argument("--script", default=None, help="JSON script or transcript (default fake_script.json)")
+    p.add_argument("--latency-ms", type=float, default=None, help="override synthetic model latency")
+    p.set_defaults(func=bench_agent)
+
+    p = sub.add_parser("hedge", help="hedged provider requests vs a single provider (no network)")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--latency-ms", type=float, default=20)
+    p.add_argument("--tail-ms", type=float, default=300)
+    p.add_argument("--tail-prob", type=float, default=0.03)
+    p.add_argument("--hedge-after-ms", type=float, default=None, help="fixed deadline (default: primary p95)")
+    p.add_argument("--script", default=None)
+    p.set_defaults(func=bench_hedge)
+
+    p = sub.add_parser("tool-output", help="prompt tokens / encode time: raw JSON vs compact tool output")
+    p.add_argument("--restaurants", type=int, nargs="+", default=[1, 3, 10, 50])
+    p.add_argument("--items", type=int, default=6)
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_tool_output)
+
+    p = sub.add_parser("serialization", help="response encode/decode cost on a large search result")
+    p.add_argument("--restaurants", type=int, default=1000)
+    p.add_argument("--items", type=int, default=6)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_serialization)
+
+    p = sub.add_parser("columnar", help="rows vs format=columnar search results (synthetic SQLite catalog)")
+    p.add_argument("--restaurants", type=int, default=1000)
+    p.add_argument("--items", type=int, default=6)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--compact", action="store_true", help="use the agent's compact field projection")
+    p.set_defaults(func=bench_columnar)
+
+    p = sub.add_parser("search", help="restaurants.search: SQL, SQL + versioned cache, in-process index, mapped snapshot (synthetic SQLite catalog)")
+    p.add_argument("--restaurants", type=int, default=5000)
+    p.add_argument("--items", type=int, default=6)
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("burst", help="identical concurrent searches with and without single-flight coalescing (synthetic SQLite catalog)")
+    p.add_argument("--sessions", type=int, default=32)
+    p.add_argument("--bursts", type=int, default=20)
+    p.add_argument("--restaurants", type=int, default=2000)
+    p.add_argument("--items", type=int, default=6)
+    p.set_defaults(func=bench_burst)
+
+    p = sub.add_parser("writes", help="concurrent cart writes: per-call commit vs single writer (temp DB)")
+    p.add_argument("--threads", type=int, default=16)
+    p.add_argument("--ops", type=int, default=50)
+    p.set_defaults(func=bench_writes)
+
+    p = sub.add_parser("shards", help="cart + conversation writes over 1..N hash-sharded SQLite files (temp DBs)")
+    p.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--threads", type=int, default=16)
+    p.add_argument("--ops", type=int, default=100)
+    p.add_argument("--procs", type=int, default=1, help="worker processes, each with its own writers")
+    p.add_argument("--no-writer", action="store_true", help="per-call commits (DB_WRITER=0)")
+    p.set_defaults(func=bench_shards)
+
+    p = sub.add_parser("storage", help="same tool traffic against each storage backend (temp DBs; postgres needs POSTGRES_DSN)")
+    p.add_argument("--stores", nargs="+", default=["sqlite", "memory", "postgres"])
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--ops", type=int, default=200)
+    p.set_defaults(func=bench_storage)
+
+    p = sub.add_parser("admission", help="well-behaved sessions vs runaway loops against a running backend (rate limits / 429s)")
+    p.add_argument("--url", default="http://127.0.0.1:8765/invoke")
+    p.add_argument("--good", type=int, default=20)
+    p.add_argument("--bad", type=int, default=4)
+    p.add_argument("--think-ms", type=float, default=500)
+    p.add_argument("--seconds", type=float, default=10)
+    p.set_defaults(func=bench_admission)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
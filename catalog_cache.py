@@ -0,0 +1,117 @@
+# catalog_cache.py
+# Read-through caches for catalog reads on the SQL path: menus by restaurant
+# (menus.list and the per-restaurant menu query of restaurants.search) and
+# whole search answers by normalized request. Entries remember the version
+# of every restaurant they were built from; schema_catalog.sql triggers
+# stamp restaurant_versions with the new catalog_meta.version on each
+# change, so a request costs one primary-key read of catalog_meta and, only
+# when that moved, a fetch of the changed rows.
+import threading
+import time
+from collections import OrderedDict
+
+# restaurant_versions row bumped by every restaurants change: which
+# restaurants match a search can change with any of them
+MEMBERSHIP = 0
+# dependency on the whole catalog (dish searches read every menu)
+WHOLE_CATALOG = None
+
+
+class CatalogVersions:
+    """In-process mirror of restaurant_versions."""
+
+    def __init__(self):
+        self.seen = None
+        self.versions = {}
+        self.available = True
+        self._lock = threading.Lock()
+
+    def sync(self, db) -> bool:
+        """Catch up with the catalog; False if it has no restaurant_versions
+        (schema_catalog.sql not re-run yet) and nothing may be cached."""
+        if not self.available:
+            return False
+        try:
+            row = db.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+            version = row[0] if row else 0
+            if version == self.seen:
+                return True
+            with self._lock:
+                if version != self.seen:
+                    changed = db.execute(
+                        "SELECT restaurant_id, version FROM restaurant_versions WHERE version > ?",
+                        (-1 if self.seen is None else self.seen,),
+                    ).fetchall()
+                    self.versions.update(changed)
+                    self.seen = version
+        except Exception as e:
+            print("catalog cache disabled:", e)
+            self.available = False
+            return False
+        return True
+
+    def deps(self, restaurant_ids, as_of=None) -> tuple:
+        """(restaurant_id, version) pairs to store with an entry. Take them
+        before reading its rows, or pass as_of = the `seen` taken then: a
+        restaurant synced past it may have changed after the read, so it is
+        pinned to as_of, which no longer matches, and the entry is stale."""
+        pairs = ((rid, self.version(rid)) for rid in restaurant_ids)
+        if as_of is None:
+            return tuple(pairs)
+        return tuple((rid, v if v <= as_of else as_of) for rid, v in pairs)
+
+    def version(self, rid):
+        return self.seen if rid is WHOLE_CATALOG else self.versions.get(rid, 0)
+
+    def fresh(self, deps) -> bool:
+        return all(self.version(rid) == v for rid, v in deps)
+
+
+class VersionedLRU:
+    """LRU of (value, deps, stored_at); an entry is served only while every
+    restaurant it depends on is at the stored version and it is younger than
+    ttl_s (0 = no TTL)."""
+
+    def __init__(self, versions: CatalogVersions, max_entries: int, ttl_s: float):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, deps, stored_at = entry
+            if self.ttl_s and time.monotonic() - stored_at > self.ttl_s:
+                self.expirations += 1
+            elif not self.versions.fresh(deps):
+                self.invalidations += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, deps):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, deps, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries), "max_entries": self.max_entries, "ttl_s": self.ttl_s,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "invalidations": self.invalidations, "expirations": self.expirations,
+        }
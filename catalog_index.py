@@ -0,0 +1,242 @@
+# catalog_index.py
+# restaurants.search without SQL: the open restaurants and their available
+# menu items are loaded from the SQLite catalog into __slots__ records, with
+# inverted indexes (area, city, cuisine tag, dish-name token -> restaurant
+# positions) and sorted rating / price_level arrays for the range filters.
+# A Snapshot is immutable; CatalogIndex polls catalog_meta.version and
+# swaps in a new one (a single attribute store) when the catalog changes,
+# so a search always sees one consistent catalog.
+#   python catalog_index.py [catalog.db] [area=adyar cuisine=biryani ...]
+import bisect
+import functools
+import operator
+import sys
+import threading
+import time
+
+from storage import MENU_FIELDS, RESTAURANT_FIELDS
+
+EMPTY = frozenset()
+MEMO_MAX = 4096  # substring lookups remembered per snapshot
+
+
+class Restaurant:
+    __slots__ = tuple(RESTAURANT_FIELDS) + ("menu", "dishes")
+
+
+class MenuItem:
+    __slots__ = tuple(MENU_FIELDS)
+
+
+@functools.lru_cache(maxsize=256)
+def _getter(select: tuple):
+    """Record -> tuple of the selected attributes."""
+    get = operator.attrgetter(*select)
+    return get if len(select) > 1 else (lambda r: (get(r),))
+
+
+def _record(cls, fields, row):
+    rec = cls()
+    for f, v in zip(fields, row):
+        setattr(rec, f, v)
+    return rec
+
+
+class Snapshot:
+    """One catalog version, positions = open restaurants in id order."""
+
+    def __init__(self, version: int, restaurants, menu_items):
+        self.version = version
+        self.restaurants = [r for r in sorted(restaurants, key=lambda r: r.id) if r.is_open == 1]
+        by_id = {}
+        for r in self.restaurants:
+            r.menu, r.dishes = [], []
+            by_id[r.id] = r
+        for m in sorted(menu_items, key=lambda m: m.id):
+            r = by_id.get(m.restaurant_id)
+            if r is not None and m.is_available == 1:
+                r.menu.append(m)
+                r.dishes.append(m.name.lower())
+
+        self.area, self.city, self.cuisine, self.dish = {}, {}, {}, {}
+        ratings, prices = [], []
+        for pos, r in enumerate(self.restaurants):
+            if r.area is not None:
+                self.area.setdefault(r.area.lower(), set()).add(pos)
+            if r.city is not None:
+                self.city.setdefault(r.city.lower(), set()).add(pos)
+            for tag in (r.cuisine_tags or "").lower().split(","):
+                self.cuisine.setdefault(tag, set()).add(pos)
+            for name in r.dishes:
+                for token in name.split():
+                    self.dish.setdefault(token, set()).add(pos)
+            if r.rating is not None:
+                ratings.append((r.rating, pos))
+            if r.price_level is not None:
+                prices.append((r.price_level, pos))
+        ratings.sort()
+        prices.sort()
+        self.rating_keys, self.rating_pos = [k for k, _ in ratings], [p for _, p in ratings]
+        self.price_keys, self.price_pos = [k for k, _ in prices], [p for _, p in prices]
+        self._memo = {}
+
+    @classmethod
+    def load(cls, conn) -> "Snapshot":
+        # one read transaction: the version matches the rows
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+            cur = conn.execute(f"SELECT {', '.join(RESTAURANT_FIELDS)} FROM restaurants")
+            restaurants = [_record(Restaurant, RESTAURANT_FIELDS, r) for r in cur]
+            cur = conn.execute(f"SELECT {', '.join(MENU_FIELDS)} FROM menu_items")
+            menu_items = [_record(MenuItem, MENU_FIELDS, m) for m in cur]
+        finally:
+            conn.rollback()
+        return cls(row[0] if row else 0, restaurants, menu_items)
+
+    # match() and search() read the catalog only through size, the key
+    # tables (.get/.items), the sorted arrays and the methods below, so
+    # catalog_snapshot.MappedSnapshot can answer them from a mapped file
+    @property
+    def size(self) -> int:
+        return len(self.restaurants)
+
+    def dishes(self, pos: int) -> list:
+        return self.restaurants[pos].dishes
+
+    def cuisine_tags(self, pos: int):
+        return self.restaurants[pos].cuisine_tags
+
+    def rows(self, positions, select: tuple) -> list:
+        row = _getter(select)
+        return [row(self.restaurants[i]) for i in positions]
+
+    def menus(self, positions, select: tuple, limit) -> list:
+        item = _getter(select)
+        return [[item(m) for m in self.restaurants[i].menu[:limit]] for i in positions]
+
+    def _containing(self, name: str, index, needle: str):
+        # LIKE '%needle%' over the distinct keys, far fewer than the rows
+        memo = (name, needle)
+        hit = self._memo.get(memo)
+        if hit is None:
+            hit = set()
+            for key, positions in index.items():
+                if needle in key:
+                    hit.update(positions)
+            if len(self._memo) >= MEMO_MAX:
+                self._memo.clear()
+            self._memo[memo] = hit
+        return hit
+
+    def match(self, f: dict) -> list:
+        """Positions of the restaurants passing the search_filters() dict f."""
+        sets = []
+        if f["city"] is not None:
+            sets.append(set(self.city.get(f["city"].lower(), EMPTY)))
+        if f["area"] is not None:
+            sets.append(self._containing("area", self.area, f["area"].lower()))
+        cuisine = f["cuisine"] and f["cuisine"].lower()
+        if cuisine is not None and "," not in cuisine:
+            sets.append(self._containing("cuisine", self.cuisine, cuisine))
+        if f["min_rating"] is not None:
+            sets.append(set(self.rating_pos[bisect.bisect_left(self.rating_keys, f["min_rating"]):]))
+        if f["price_level"] is not None:
+            sets.append(set(self.price_pos[:bisect.bisect_right(self.price_keys, f["price_level"])]))
+        dish = f["dish"] and f["dish"].lower()
+        if dish is not None:
+            # every word of the needle sits inside one token of a matching name
+            sets.extend(self._containing("dish", self.dish, w) for w in dish.split())
+        if not sets:
+            hits = range(self.size)
+        else:
+            sets.sort(key=len)
+            hits = sorted(sets[0].intersection(*sets[1:]))
+        if dish is not None:
+            hits = [i for i in hits if any(dish in name for name in self.dishes(i))]
+        if cuisine is not None and "," in cuisine:
+            # the needle spans tags: check the whole tag string
+            hits = [i for i in hits if cuisine in (self.cuisine_tags(i) or "\0").lower()]
+        return hits
+
+    def search(self, fields, select, menu_select, menu_limit, columnar, f) -> dict:
+        matches = self.match(f)
+        menus = self.menus(matches, menu_select, menu_limit)
+        if columnar:
+            return {
+                "format": "columnar",
+                "restaurant_columns": select,
+                "menu_columns": menu_select,
+                "restaurants": self.rows(matches, select),
+                "menus": menus,
+            }
+        return {"results": [
+            {"restaurant": dict(zip(fields, row)), "menu": [dict(zip(menu_select, m)) for m in menu]}
+            for row, menu in zip(self.rows(matches, fields), menus)
+        ]}
+
+
+class CatalogIndex:
+    """The current Snapshot plus the poll thread that replaces it."""
+
+    def __init__(self, connect, poll_s: float = 1.0):
+        self._connect = connect
+        self.poll_s = poll_s
+        self.snapshot = None
+        self.reloads = 0
+        self.reload()
+
+    def _version(self, conn) -> int:
+        row = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def reload(self, force: bool = False) -> bool:
+        """Build a new snapshot if catalog_meta.version moved; True if swapped."""
+        conn = self._connect()
+        try:
+            if not force and self.snapshot is not None and self._version(conn) == self.snapshot.version:
+                return False
+            t0 = time.perf_counter()
+            snapshot = Snapshot.load(conn)
+        finally:
+            conn.close()
+        self.snapshot = snapshot
+        self.reloads += 1
+        print(f"catalog index: version {snapshot.version}, {snapshot.size} open restaurants"
+              f" ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        return True
+
+    def start(self):
+        threading.Thread(target=self._poll, name="catalog-index", daemon=True).start()
+        return self
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_s)
+            try:
+                self.reload()
+            except Exception as e:  # keep serving the last snapshot
+                print("catalog index reload failed:", e)
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {"version": snapshot.version, "restaurants": snapshot.size, "reloads": self.reloads}
+
+    def search(self, *args) -> dict:
+        return self.snapshot.search(*args)
+
+
+if __name__ == "__main__":
+    import sqlite3
+    from storage import search_filters
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "food1.db"
+    p = dict(a.split("=", 1) for a in sys.argv[2:])
+    index = CatalogIndex(lambda: sqlite3.connect(f"file:{path}?mode=ro", uri=True))
+    fields, menu_fields = ("id", "name", "area", "rating"), ("name", "price_cents")
+    t0 = time.perf_counter()
+    res = index.search(fields, fields, menu_fields, 3, False, search_filters(p))
+    dt = (time.perf_counter() - t0) * 1e6
+    for entry in res["results"]:
+        print(entry["restaurant"], [m["name"] for m in entry["menu"]])
+    print(f"{len(res['results'])} matches in {dt:.0f}us")
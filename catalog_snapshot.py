@@ -0,0 +1,286 @@
+# catalog_snapshot.py
+# The search index as one binary file (CATALOG_SNAPSHOT=catalog.snap), for
+# several uvicorn workers: `build` writes the open restaurants, their
+# available menu items, the catalog_index key tables and the sorted
+# rating/price arrays as fixed-size records plus one string blob. Workers
+# mmap it read-only and decode only the records a search touches, so opening
+# costs the same for any catalog size and every worker shares the same
+# page-cache pages instead of a private copy. A rebuild is written beside
+# the target and renamed over it; workers see the new inode and remap.
+#   python catalog_snapshot.py build [--db food1.db] [--out catalog.snap] [--watch 1]
+#   python catalog_snapshot.py info catalog.snap
+import argparse
+import array
+import functools
+import math
+import mmap
+import operator
+import os
+import sqlite3
+import struct
+import sys
+import time
+
+from catalog_index import EMPTY, CatalogIndex, Snapshot
+from storage import MENU_FIELDS, RESTAURANT_FIELDS
+
+MAGIC = b"FOODCAT\0"
+FORMAT = 1
+ORDER = b"L" if sys.byteorder == "little" else b"B"  # arrays are native order
+NULL_LEN = 0xFFFFFFFF  # string ref of a NULL
+NULL_INT = -2 ** 31    # price_level NULL; rating NULL is NaN
+KEY_TABLES = ("area", "city", "cuisine", "dish")
+SECTIONS = ("strings", "restaurants", "menu", *KEY_TABLES, "postings",
+            "rating_keys", "rating_pos", "price_keys", "price_pos")
+# magic, format, byte order, catalog version, restaurants, menu items,
+# then (offset, length) per section
+HEADER = struct.Struct("=8sHc5xqII" + "QQ" * len(SECTIONS))
+# id, name/area/city/cuisine_tags (offset, length), rating, price_level,
+# first menu record, menu record count
+RESTAURANT = struct.Struct("=q8IdiII")
+# id, restaurant_id, name/description/category (offset, length), price_cents, is_available
+MENU = struct.Struct("=qq6Iqi")
+# key (offset, length), first posting, posting count
+KEY = struct.Struct("=4I")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class _Strings:
+    """The string blob; equal strings are stored once."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self._refs = {}
+
+    def ref(self, s) -> tuple:
+        if s is None:
+            return 0, NULL_LEN
+        ref = self._refs.get(s)
+        if ref is None:
+            b = s.encode()
+            ref = self._refs[s] = (len(self.buf), len(b))
+            self.buf += b
+        return ref
+
+
+def write(snapshot: Snapshot, path: str) -> int:
+    """Serialize an in-memory Snapshot to path (atomically); returns its size."""
+    strings = _Strings()
+    restaurants, menu, n_menu = bytearray(), bytearray(), 0
+    for r in snapshot.restaurants:
+        restaurants += RESTAURANT.pack(
+            r.id, *strings.ref(r.name), *strings.ref(r.area), *strings.ref(r.city), *strings.ref(r.cuisine_tags),
+            math.nan if r.rating is None else r.rating, NULL_INT if r.price_level is None else r.price_level,
+            n_menu, len(r.menu),
+        )
+        for m in r.menu:
+            menu += MENU.pack(m.id, m.restaurant_id, *strings.ref(m.name), *strings.ref(m.description),
+                              *strings.ref(m.category), m.price_cents, m.is_available)
+        n_menu += len(r.menu)
+    postings, tables = array.array("I"), {}
+    for name in KEY_TABLES:
+        index, entries = getattr(snapshot, name), bytearray()
+        for key in sorted(index):  # code point order == UTF-8 byte order
+            entries += KEY.pack(*strings.ref(key), len(postings), len(index[key]))
+            postings.extend(sorted(index[key]))
+        tables[name] = entries
+    body = {
+        "strings": strings.buf, "restaurants": restaurants, "menu": menu, **tables,
+        "postings": postings.tobytes(),
+        "rating_keys": array.array("d", snapshot.rating_keys).tobytes(),
+        "rating_pos": array.array("I", snapshot.rating_pos).tobytes(),
+        "price_keys": array.array("q", snapshot.price_keys).tobytes(),
+        "price_pos": array.array("I", snapshot.price_pos).tobytes(),
+    }
+    layout, offset = [], HEADER.size
+    for name in SECTIONS:
+        offset += -offset % 8
+        layout += [offset, len(body[name])]
+        offset += len(body[name])
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT, ORDER, snapshot.version, snapshot.size, n_menu, *layout))
+        for name, section_offset in zip(SECTIONS, layout[::2]):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(body[name])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return offset
+
+
+class KeyTable:
+    """A sorted key -> postings table read in place (dict-like for Snapshot.match)."""
+
+    def __init__(self, entries, mm, strings_at: int, postings):
+        self._entries = entries
+        self._mm = mm
+        self._at = strings_at
+        self._postings = postings
+        self._n = len(entries) // KEY.size
+
+    def _key(self, i: int) -> str:
+        off, ln, _, _ = KEY.unpack_from(self._entries, i * KEY.size)
+        off += self._at
+        return self._mm[off:off + ln].decode()
+
+    def _postings_of(self, i: int):
+        _, _, start, count = KEY.unpack_from(self._entries, i * KEY.size)
+        return self._postings[start:start + count]
+
+    def get(self, key: str, default=EMPTY):
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self._postings_of(lo) if lo < self._n and self._key(lo) == key else default
+
+    def items(self):
+        for i in range(self._n):
+            yield self._key(i), self._postings_of(i)
+
+
+@functools.lru_cache(maxsize=256)
+def _picker(select: tuple, fields: tuple):
+    """Full record tuple -> tuple of the selected fields."""
+    get = operator.itemgetter(*(fields.index(f) for f in select))
+    return get if len(select) > 1 else (lambda t: (get(t),))
+
+
+class MappedSnapshot(Snapshot):
+    """A snapshot file, mmap'd; same match()/search() as the in-memory Snapshot."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.stamp = (st.st_ino, st.st_mtime_ns)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mm, 0)
+        magic, fmt, order, self.version, self._size, self.menu_items = header[:6]
+        if magic != MAGIC or fmt != FORMAT or order != ORDER:
+            raise SnapshotError(f"{path}: not a format {FORMAT} catalog snapshot for this machine")
+        view = memoryview(self._mm)
+        sec = {name: view[off:off + ln] for name, off, ln in zip(SECTIONS, header[6::2], header[7::2])}
+        # strings are sliced straight off the map (cheaper than memoryview + str)
+        self._at = header[6]
+        self._restaurants, self._menu = sec["restaurants"], sec["menu"]
+        postings = sec["postings"].cast("I")
+        self.area, self.city, self.cuisine, self.dish = (KeyTable(sec[n], self._mm, self._at, postings) for n in KEY_TABLES)
+        self.rating_keys, self.rating_pos = sec["rating_keys"].cast("d"), sec["rating_pos"].cast("I")
+        self.price_keys, self.price_pos = sec["price_keys"].cast("q"), sec["price_pos"].cast("I")
+        self._memo = {}
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _str(self, off: int, ln: int):
+        if ln == NULL_LEN:
+            return None
+        off += self._at
+        return self._mm[off:off + ln].decode()
+
+    def _restaurant(self, pos: int) -> tuple:
+        """RESTAURANT_FIELDS tuple plus (first menu record, count)."""
+        (rid, n_off, n_len, a_off, a_len, c_off, c_len, t_off, t_len,
+         rating, price_level, menu_start, menu_count) = RESTAURANT.unpack_from(self._restaurants, pos * RESTAURANT.size)
+        return (rid, self._str(n_off, n_len), self._str(a_off, a_len), self._str(c_off, c_len),
+                self._str(t_off, t_len), None if rating != rating else rating,
+                None if price_level == NULL_INT else price_level, 1, menu_start, menu_count)
+
+    def _menu_item(self, i: int) -> tuple:
+        (mid, rid, n_off, n_len, d_off, d_len, c_off, c_len,
+         price_cents, is_available) = MENU.unpack_from(self._menu, i * MENU.size)
+        return (mid, rid, self._str(n_off, n_len), self._str(d_off, d_len), price_cents, is_available,
+                self._str(c_off, c_len))
+
+    def _menu_range(self, pos: int, limit=None) -> range:
+        start, count = RESTAURANT.unpack_from(self._restaurants, pos * RESTAURANT.size)[-2:]
+        return range(start, start + (count if limit is None else min(count, limit)))
+
+    def dishes(self, pos: int) -> list:
+        out = []
+        for i in self._menu_range(pos):
+            off, ln = MENU.unpack_from(self._menu, i * MENU.size)[2:4]
+            out.append(self._str(off, ln).lower())
+        return out
+
+    def cuisine_tags(self, pos: int):
+        off, ln = RESTAURANT.unpack_from(self._restaurants, pos * RESTAURANT.size)[7:9]
+        return self._str(off, ln)
+
+    def rows(self, positions, select: tuple) -> list:
+        pick = _picker(select, tuple(RESTAURANT_FIELDS))
+        return [pick(self._restaurant(i)) for i in positions]
+
+    def menus(self, positions, select: tuple, limit) -> list:
+        pick = _picker(select, tuple(MENU_FIELDS))
+        return [[pick(self._menu_item(i)) for i in self._menu_range(pos, limit)] for pos in positions]
+
+
+class MappedCatalog(CatalogIndex):
+    """CatalogIndex over a snapshot file: the poll thread remaps it when the
+    path points at a new file (the builder renames a fresh one over it)."""
+
+    def __init__(self, path: str, poll_s: float = 1.0):
+        self.path = path
+        super().__init__(None, poll_s)
+
+    def reload(self, force: bool = False) -> bool:
+        if not force and self.snapshot is not None:
+            st = os.stat(self.path)
+            if (st.st_ino, st.st_mtime_ns) == self.snapshot.stamp:
+                return False
+        t0 = time.perf_counter()
+        self.snapshot = MappedSnapshot(self.path)
+        self.reloads += 1
+        print(f"catalog snapshot: version {self.snapshot.version}, {self.snapshot.size} open restaurants"
+              f" (mapped in {(time.perf_counter() - t0) * 1000:.2f}ms)")
+        return True
+
+
+def build(args):
+    index = CatalogIndex(lambda: sqlite3.connect(f"file:{args.db}?mode=ro", uri=True))
+    while True:
+        t0 = time.perf_counter()
+        size = write(index.snapshot, args.out)
+        print(f"{args.out}: version {index.snapshot.version}, {size / 1024:.0f}KiB"
+              f" ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        if not args.watch:
+            return
+        while not index.reload():
+            time.sleep(args.watch)
+
+
+def info(args):
+    snap = MappedSnapshot(args.path)
+    header = HEADER.unpack_from(snap._mm, 0)
+    print(f"{args.path}: format {FORMAT}, catalog version {snap.version}, "
+          f"{snap.size} restaurants, {snap.menu_items} menu items")
+    for name, ln in zip(SECTIONS, header[7::2]):
+        print(f"  {name:>12}: {ln} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="binary catalog snapshot for CATALOG_SNAPSHOT")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build", help="write the snapshot from a SQLite catalog")
+    p.add_argument("--db", default="food1.db", help="catalog.db in split mode")
+    p.add_argument("--out", default="catalog.snap")
+    p.add_argument("--watch", type=float, default=0, help="keep rebuilding, polling catalog_meta every N seconds")
+    p.set_defaults(func=build)
+    p = sub.add_parser("info", help="print a snapshot's header")
+    p.add_argument("path")
+    p.set_defaults(func=info)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
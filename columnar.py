@@ -0,0 +1,9 @@
+# columnar.py
+# `format=columnar` results: a columns header plus row arrays. The client
+# never expands them into row dicts; the compact renderer (tool_format.py)
+# and the router's item tracking (createagent._track) read the arrays
+# directly, and columnar is only requested when the output is compact.
+
+
+def is_columnar(res) -> bool:
+    return isinstance(res, dict) and res.get("format") == "columnar"
@@ -1,14 +1,23 @@
 # app_create_agent.py
 from pyexpat.errors import messages
-import os, json, uuid, requests
-from typing import Optional
+import os, json, uuid, time, asyncio, contextlib, requests
+from collections import OrderedDict
+from typing import List, Optional
+
+import httpx
+import msgpack
+import orjson
 
 from pydantic import BaseModel, Field
 from langchain_core.tools import StructuredTool
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.messages import AIMessage, ToolMessage
 from langchain.agents import create_agent  # LangChain's production agent API
 
 from prompt import SYSTEM_PROMPT
+from providers import make_chat_model
+from response_cache import ResponseCache, is_discovery, self_contained
+from tool_format import render
+from columnar import is_columnar
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,24 +27,354 @@ load_dotenv()
 
 API_URL = os.getenv("FOOD_API", "http://127.0.0.1:8765/invoke")
 CART_ID = os.getenv("CART_ID") or str(uuid.uuid4())
+# orders are filed under USER_ID so a returning user can list and reorder them
+USER_ID = os.getenv("USER_ID") or CART_ID
 currentobj=[]
 
+# session context for the model router: menu items shown so far and cart size
+shown_items = {}
+cart_state = {"size": 0}
+
+def _track(tool: str, res: dict):
+    if is_columnar(res):
+        if tool == "restaurants.search":
+            cols, rows = res["menu_columns"], [m for menu in res["menus"] for m in menu]
+        else:
+            cols, rows = res["columns"], res["rows"]
+        if "id" in cols and "name" in cols:
+            i, n = cols.index("id"), cols.index("name")
+            shown_items.update((m[n], m[i]) for m in rows)
+    elif "results" in res:
+        for r in res["results"]:
+            for m in r.get("menu", []):
+                shown_items[m["name"]] = m["id"]
+    elif "menu" in res:
+        for m in res["menu"]:
+            shown_items[m["name"]] = m["id"]
+    elif tool == "cart.clear":
+        cart_state["size"] = 0
+    elif "cart" in res or "items" in res:
+        cart_state["size"] = len(res.get("cart", res).get("items", []))
+
+def router_context() -> dict:
+    return {"shown_items": list(shown_items), "cart_size": cart_state["size"]}
+
 
 # ---------------------------
 # Thin client for your /invoke
 # ---------------------------
+# FOOD_API_FORMAT=msgpack negotiates MessagePack responses; json (default)
+# is decoded with orjson straight from the response bytes.
+FOOD_API_FORMAT = os.getenv("FOOD_API_FORMAT", "json")
+MSGPACK = "application/msgpack"
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": MSGPACK if FOOD_API_FORMAT == "msgpack" else "application/json",
+    # rate-limit session for calls without a cart_id (catalog reads, chat log)
+    "X-Cart-Id": CART_ID,
+}
+
+def _encode_request(tool: str, params: dict) -> bytes:
+    return orjson.dumps({"tool": tool, "params": params})
+
+def _decode_response(content_type: str, body: bytes):
+    if content_type.startswith(MSGPACK):
+        return msgpack.unpackb(body, raw=False)
+    return orjson.loads(body)
+
+def _result(r):
+    # 429 from admission control carries {"error": {"code": "RATE_LIMITED", ...}}:
+    # a tool result like any other error, not an exception
+    if r.status_code != 429:
+        r.raise_for_status()
+    return _decode_response(r.headers.get("content-type", ""), r.content)
+
+def _stream_url(api_url: str) -> str:
+    return api_url.rsplit("/", 1)[0] + "/invoke_stream"
+
+def _batch_url(api_url: str) -> str:
+    return api_url.rsplit("/", 1)[0] + "/invoke_batch"
+
+def _encode_batch(calls, atomic: bool) -> bytes:
+    return orjson.dumps({"calls": [{"tool": t, "params": p} for t, p in calls], "atomic": atomic})
+
+def _is_ndjson(content_type: str) -> bool:
+    return content_type.startswith("application/x-ndjson")
+
+# FOOD_API_ETAGS=1 (default) revalidates catalog and cart reads: the last
+# answer per request is kept with its etag, and while it is still current
+# the backend replies {"not_modified": true} instead of the full payload.
+FOOD_API_ETAGS = os.getenv("FOOD_API_ETAGS", "1") == "1"
+CONDITIONAL_TOOLS = ("restaurants.search", "menus.list", "cart.view")
+
+class Validators:
+    """LRU of (tool, params) -> (etag, answer) for conditional reads."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.revalidated = 0
+
+    def request(self, tool: str, params: dict):
+        """(token, params to send); token goes back to response()."""
+        if not FOOD_API_ETAGS or tool not in CONDITIONAL_TOOLS:
+            return None, params
+        key = (tool, orjson.dumps(params, option=orjson.OPT_SORT_KEYS))
+        entry = self._entries.get(key)
+        return (key, entry), {**params, "if_none_match": entry[0] if entry else None}
+
+    def response(self, token, res):
+        if token is None or not isinstance(res, dict):
+            return res
+        key, entry = token
+        if res.get("not_modified") and entry is not None:
+            self.revalidated += 1
+            return entry[1]
+        tag = res.pop("etag", None)
+        if tag is not None:
+            self._entries[key] = (tag, res)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return res
+
+validators = Validators()
+
+
 class FoodAPI:
     def __init__(self, api_url: str):
         self.api_url = api_url
     def invoke(self, tool: str, params: dict):
         # print(f"Invoking tool: {tool} with params: {params}")
-        r = requests.post(self.api_url, json={"tool": tool, "params": params})
-        r.raise_for_status()
-        
-        return r.json()
+        token, params = validators.request(tool, params)
+        r = requests.post(self.api_url, data=_encode_request(tool, params), headers=_HEADERS)
+        return validators.response(token, _result(r))
+
+    def stream(self, tool: str, params: dict, limit: Optional[int] = None):
+        """Yield records from /invoke_stream as they arrive; stops reading
+        (and drops the connection) after `limit` records."""
+        with requests.post(_stream_url(self.api_url), data=_encode_request(tool, params),
+                           headers=_HEADERS, stream=True) as r:
+            if r.status_code != 429:
+                r.raise_for_status()
+            if not _is_ndjson(r.headers.get("content-type", "")):
+                yield _decode_response(r.headers.get("content-type", ""), r.content)
+                return
+            n = 0
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                yield orjson.loads(line)
+                n += 1
+                if limit is not None and n >= limit:
+                    return
 
 client = FoodAPI(API_URL)
-def _json(o) -> str: return json.dumps(o, ensure_ascii=False)
+
+
+# ---------------------------
+# Async client (pooled keep-alive connections)
+# ---------------------------
+class AsyncFoodAPI:
+    def __init__(self, api_url: str, max_connections: int = 20, max_batch: int = 64):
+        self.api_url = api_url
+        self.max_connections = max_connections
+        self.max_batch = max_batch
+        self._client = None
+        self._pending = []
+        self._flusher = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # created lazily so the pool belongs to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=30,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def invoke(self, tool: str, params: dict):
+        token, params = validators.request(tool, params)
+        r = await self._http().post(self.api_url, content=_encode_request(tool, params), headers=_HEADERS)
+        return validators.response(token, _result(r))
+
+    async def batch(self, calls, atomic: bool = False) -> dict:
+        """One /invoke_batch round trip for [(tool, params), ...]."""
+        r = await self._http().post(_batch_url(self.api_url), content=_encode_batch(calls, atomic), headers=_HEADERS)
+        return _result(r)
+
+    async def submit(self, tool: str, params: dict):
+        """Like invoke(), but queued: calls submitted while a batch is in
+        flight go out together in the next one, in submission order."""
+        token, params = validators.request(tool, params)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((tool, params, fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return validators.response(token, await fut)
+
+    async def _flush(self):
+        # one batch in flight at a time, which keeps calls on the same cart ordered
+        await asyncio.sleep(0)  # let the other calls of this model step queue up
+        while self._pending:
+            calls, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            try:
+                res = await self.batch([(t, p) for t, p, _ in calls])
+            except Exception as e:
+                for _, _, fut in calls:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            results = res["results"] if "results" in res else [res] * len(calls)
+            for (_, _, fut), r in zip(calls, results):
+                if not fut.done():
+                    fut.set_result(r)
+
+    async def stream(self, tool: str, params: dict, limit: Optional[int] = None):
+        n = 0
+        async with self._http().stream("POST", _stream_url(self.api_url),
+                                       content=_encode_request(tool, params), headers=_HEADERS) as r:
+            if r.status_code != 429:
+                r.raise_for_status()
+            if not _is_ndjson(r.headers.get("content-type", "")):
+                yield _decode_response(r.headers.get("content-type", ""), await r.aread())
+                return
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                yield orjson.loads(line)
+                n += 1
+                if limit is not None and n >= limit:
+                    return
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+aclient = AsyncFoodAPI(API_URL, int(os.getenv("FOOD_API_POOL", "20")))
+
+# FOOD_API_BATCH=1 (default) sends the tool calls of one model step as one
+# /invoke_batch request (one connection, one commit on the backend)
+FOOD_API_BATCH = os.getenv("FOOD_API_BATCH", "1") == "1"
+
+async def _call(tool: str, params: dict):
+    return await (aclient.submit if FOOD_API_BATCH else aclient.invoke)(tool, params)
+
+# ---------------------------
+# Conversation log (write-behind)
+# ---------------------------
+# Messages are appended to a local copy of the history right away and sent
+# to conversation.append by a background task, so a turn never waits on a
+# logging write. The sender keeps one request in flight and waits for the
+# backend commit (wait=true) before sending the next, which keeps messages
+# ordered per conversation; a failed send is retried with the same order and
+# message ids, so the backend stores each message once.
+class ConversationLog:
+    def __init__(self, api: "AsyncFoodAPI", retry_s: float = 1.0):
+        self.api = api
+        self.retry_s = retry_s
+        self._history = {}
+        self._pending = []
+        self._sender = None
+
+    async def history(self, conversation_id: int) -> list:
+        """The conversation so far, loaded from the backend once per process."""
+        if conversation_id not in self._history:
+            res = await self.api.invoke("conversation.load", {"conversation_id": conversation_id})
+            self._history[conversation_id] = [list(m) for m in res["messages"]]
+        return self._history[conversation_id]
+
+    def append(self, conversation_id: int, role: str, content: str):
+        self._history.setdefault(conversation_id, []).append([role, content])
+        # the id lets the backend drop copies when a batch is sent again
+        self._pending.append({"conversation_id": conversation_id, "role": role, "content": content,
+                              "message_id": uuid.uuid4().hex})
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send())
+
+    async def _send(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            delay = self.retry_s
+            try:
+                res = await self.api.invoke("conversation.append", {"messages": batch, "wait": True})
+                error = res.get("error")
+                if error and error.get("code") not in ("SERVER_ERROR", "RATE_LIMITED"):
+                    print("conversation log: dropped rejected batch:", error)
+                elif error:
+                    delay = max(delay, error.get("retry_after_s") or 0)
+                    raise RuntimeError(error)
+                elif res.get("status") == "queued":
+                    # accepted but not committed yet: send again to wait for it
+                    raise RuntimeError("still queued on the backend")
+            except Exception as e:
+                print("conversation log: send failed, retrying:", e)
+                self._pending = batch + self._pending
+                await asyncio.sleep(delay)
+
+    async def flush(self):
+        """Wait until everything appended so far is committed."""
+        while self._sender is not None and not self._sender.done():
+            await self._sender
+
+conversation_log = ConversationLog(aclient)
+
+# Tool calls from one model step run concurrently (ToolNode gathers the
+# coroutines); calls that mutate the same cart take its lock so they still
+# apply one at a time and in order. Batched calls are already sent in order.
+_cart_locks: dict = {}
+
+def _cart_lock(cart_id: str):
+    if FOOD_API_BATCH:
+        return contextlib.nullcontext()
+    lock = _cart_locks.get(cart_id)
+    if lock is None:
+        lock = _cart_locks[cart_id] = asyncio.Lock()
+    return lock
+
+async def _amutate(tool: str, params: dict):
+    async with _cart_lock(params["cart_id"]):
+        res = await _call(tool, params)
+    _track(tool, res)
+    return res
+
+def _json(o) -> str: return orjson.dumps(o).decode()
+
+# TOOL_OUTPUT_FORMAT=compact renders tool results as dense text for the model
+# (see tool_format.py); json keeps the raw backend payload
+TOOL_OUTPUT_FORMAT = os.getenv("TOOL_OUTPUT_FORMAT", "compact")
+
+def _out(tool: str, res) -> str:
+    return render(tool, res) if TOOL_OUTPUT_FORMAT == "compact" else _json(res)
+
+# FOOD_API_COLUMNAR=1 (default) fetches list results as columns + row arrays;
+# the compact renderer reads the arrays directly, no row dicts are built
+FOOD_API_COLUMNAR = os.getenv("FOOD_API_COLUMNAR", "1") == "1"
+
+# compact output only shows these, so ask the backend for nothing else
+def _projection(tool: str) -> dict:
+    if TOOL_OUTPUT_FORMAT != "compact":
+        return {}
+    if tool == "restaurants.search":
+        p = {"fields": ["id", "name", "area", "rating", "cuisine_tags"],
+             "menu_fields": ["id", "name", "price_cents"]}
+        if os.getenv("SEARCH_MENU_LIMIT"):
+            p["menu_limit"] = int(os.getenv("SEARCH_MENU_LIMIT"))
+        if FOOD_API_COLUMNAR:
+            p["format"] = "columnar"
+        return p
+    if tool == "menus.list":
+        p = {"fields": ["id", "name", "price_cents"]}
+        if FOOD_API_COLUMNAR:
+            p["format"] = "columnar"
+        return p
+    if tool in ("cart.view", "cart.add_items", "orders.reorder"):
+        return {"fields": ["menu_item_id", "name", "quantity", "unit_price_cents", "total"]}
+    return {}
 
 # ---------------------------
 # Pydantic arg schemas
@@ -45,7 +384,8 @@ class RestaurantsSearchArgs(BaseModel):
     area: Optional[str] = None
     cuisine: Optional[str] = None
     min_rating: Optional[float] = None
-    price_level: Optional[int] = None
+    price_level: Optional[int] = None  # at most this (1 = cheapest)
+    dish: Optional[str] = None  # restaurants with an available dish matching this
 
 class MenusListArgs(BaseModel):
     restaurant_id: int
@@ -60,6 +400,13 @@ class CartAddItemArgs(BaseModel):
     menu_item_id: int
     quantity: int = Field(default=1, ge=1, le=20)
 
+class CartLine(BaseModel):
+    menu_item_id: int
+    quantity: int = Field(default=1, ge=1, le=20)
+
+class CartAddItemsArgs(BaseModel):
+    items: List[CartLine] = Field(..., min_length=1, max_length=20)
+
 class CartUpdateItemArgs(BaseModel):
     menu_item_id: int
     quantity: int = Field(..., ge=0, le=20)
@@ -73,6 +420,12 @@ class CartClearArgs(BaseModel):
 class OrdersCreateMockArgs(BaseModel):
     delivery_fee_cents: Optional[int] = None
 
+class OrdersListRecentArgs(BaseModel):
+    limit: int = Field(default=5, ge=1, le=20)
+
+class OrdersReorderArgs(BaseModel):
+    order_id: str
+
 class OrdersStatusGetArgs(BaseModel):
     order_id: str
 
@@ -95,48 +448,64 @@ class ConversationLoadArgs(BaseModel):
 # ---------------------------
 # Tool wrappers (each calls your API)
 # ---------------------------
-def restaurants_search_tool(city=None, area=None, cuisine=None, min_rating=None, price_level=None) -> str:
+def _lines(items) -> list:
+    # StructuredTool hands over CartLine models or plain dicts
+    return [i.model_dump() if isinstance(i, BaseModel) else dict(i) for i in items]
+
+def restaurants_search_tool(city=None, area=None, cuisine=None, min_rating=None, price_level=None, dish=None) -> str:
     params = {k: v for k, v in {
         "city": city, "area": area, "cuisine": cuisine,
-        "min_rating": min_rating, "price_level": price_level
+        "min_rating": min_rating, "price_level": price_level, "dish": dish
     }.items() if v is not None}
-    response = _json(client.invoke("restaurants.search", params))
+    params.update(_projection("restaurants.search"))
+    response = _out("restaurants.search", client.invoke("restaurants.search", params))
     currentobj.append(response)
     # print("Current Object in restaurants_search_tool:", currentobj)
     return response
 
 def menus_list_tool(restaurant_id: int) -> str:
-    return _json(client.invoke("menus.list", {"restaurant_id": restaurant_id}))
+    return _out("menus.list", client.invoke("menus.list", {"restaurant_id": restaurant_id, **_projection("menus.list")}))
 
 def cart_ensure_tool(cart_id: Optional[str] = None) -> str:
-    return _json(client.invoke("cart.ensure", {"cart_id": cart_id or CART_ID}))
+    return _out("cart.ensure", client.invoke("cart.ensure", {"cart_id": cart_id or CART_ID}))
 
 def cart_view_tool(cart_id: Optional[str] = None) -> str:
-    return _json(client.invoke("cart.view", {"cart_id": cart_id or CART_ID}))
+    return _out("cart.view", client.invoke("cart.view", {"cart_id": cart_id or CART_ID, **_projection("cart.view")}))
 
 def cart_add_item_tool(menu_item_id: int, quantity: int = 1) -> str:
-    return _json(client.invoke("cart.add_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id, "quantity": quantity}))
+    return _out("cart.add_item", client.invoke("cart.add_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id, "quantity": quantity}))
+
+def cart_add_items_tool(items: list) -> str:
+    p = {"cart_id": CART_ID, "items": _lines(items), **_projection("cart.add_items")}
+    return _out("cart.add_items", client.invoke("cart.add_items", p))
 
 def cart_update_item_tool(menu_item_id: int, quantity: int) -> str:
-    return _json(client.invoke("cart.update_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id, "quantity": quantity}))
+    return _out("cart.update_item", client.invoke("cart.update_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id, "quantity": quantity}))
 
 def cart_remove_item_tool(menu_item_id: int) -> str:
-    return _json(client.invoke("cart.remove_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id}))
+    return _out("cart.remove_item", client.invoke("cart.remove_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id}))
 
 def cart_clear_tool() -> str:
-    return _json(client.invoke("cart.clear", {"cart_id": CART_ID}))
+    return _out("cart.clear", client.invoke("cart.clear", {"cart_id": CART_ID}))
 
 def orders_create_mock_tool(delivery_fee_cents: Optional[int] = None) -> str:
-    p = {"cart_id": CART_ID}
+    p = {"cart_id": CART_ID, "user_id": USER_ID}
     if delivery_fee_cents is not None:
         p["delivery_fee_cents"] = int(delivery_fee_cents)
-    return _json(client.invoke("orders.create_mock", p))
+    return _out("orders.create_mock", client.invoke("orders.create_mock", p))
+
+def orders_list_recent_tool(limit: int = 5) -> str:
+    return _out("orders.list_recent", client.invoke("orders.list_recent", {"user_id": USER_ID, "limit": limit}))
+
+def orders_reorder_tool(order_id: str) -> str:
+    p = {"cart_id": CART_ID, "user_id": USER_ID, "order_id": order_id, **_projection("orders.reorder")}
+    return _out("orders.reorder", client.invoke("orders.reorder", p))
 
 def orders_status_get_tool(order_id: str) -> str:
-    return _json(client.invoke("orders.status.get", {"order_id": order_id}))
+    return _out("orders.status.get", client.invoke("orders.status.get", {"order_id": order_id}))
 
 def orders_status_advance_mock_tool(order_id: str) -> str:
-    return _json(client.invoke("orders.status.advance_mock", {"order_id": order_id}))
+    return _out("orders.status.advance_mock", client.invoke("orders.status.advance_mock", {"order_id": order_id}))
 
 
 
@@ -159,68 +528,189 @@ def conversation_load_tool(conversation_id: int) -> str:
         "conversation.load",
         {"conversation_id": conversation_id}
     ))
+
+
+# FOOD_API_STREAM=1 streams restaurants.search (NDJSON) and stops reading after
+# SEARCH_STREAM_LIMIT restaurants; the compact output would cut the rest anyway
+FOOD_API_STREAM = os.getenv("FOOD_API_STREAM", "0") == "1"
+SEARCH_STREAM_LIMIT = int(os.getenv("SEARCH_STREAM_LIMIT", "20"))
+
+async def _astream_search(params: dict) -> dict:
+    params = {k: v for k, v in params.items() if k != "format"}  # records are row-format
+    results = []
+    async for record in aclient.stream("restaurants.search", params, limit=SEARCH_STREAM_LIMIT):
+        if "error" in record:
+            return record
+        results.append(record)
+    return {"results": results}
+
+
+# ---------------------------
+# Async tool wrappers (same contracts, pooled async client)
+# ---------------------------
+async def restaurants_search_atool(city=None, area=None, cuisine=None, min_rating=None, price_level=None, dish=None) -> str:
+    params = {k: v for k, v in {
+        "city": city, "area": area, "cuisine": cuisine,
+        "min_rating": min_rating, "price_level": price_level, "dish": dish
+    }.items() if v is not None}
+    params.update(_projection("restaurants.search"))
+    if FOOD_API_STREAM:
+        res = await _astream_search(params)
+    else:
+        res = await _call("restaurants.search", params)
+    _track("restaurants.search", res)
+    response = _out("restaurants.search", res)
+    currentobj.append(response)
+    return response
+
+async def menus_list_atool(restaurant_id: int) -> str:
+    res = await _call("menus.list", {"restaurant_id": restaurant_id, **_projection("menus.list")})
+    _track("menus.list", res)
+    return _out("menus.list", res)
+
+async def cart_ensure_atool(cart_id: Optional[str] = None) -> str:
+    return _out("cart.ensure", await _amutate("cart.ensure", {"cart_id": cart_id or CART_ID}))
+
+async def cart_view_atool(cart_id: Optional[str] = None) -> str:
+    cid = cart_id or CART_ID
+    # wait for in-flight mutations of this cart so the view reflects them
+    async with _cart_lock(cid):
+        res = await _call("cart.view", {"cart_id": cid, **_projection("cart.view")})
+    _track("cart.view", res)
+    return _out("cart.view", res)
+
+async def cart_add_item_atool(menu_item_id: int, quantity: int = 1) -> str:
+    return _out("cart.add_item", await _amutate("cart.add_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id, "quantity": quantity}))
+
+async def cart_add_items_atool(items: list) -> str:
+    p = {"cart_id": CART_ID, "items": _lines(items), **_projection("cart.add_items")}
+    return _out("cart.add_items", await _amutate("cart.add_items", p))
+
+async def cart_update_item_atool(menu_item_id: int, quantity: int) -> str:
+    return _out("cart.update_item", await _amutate("cart.update_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id, "quantity": quantity}))
+
+async def cart_remove_item_atool(menu_item_id: int) -> str:
+    return _out("cart.remove_item", await _amutate("cart.remove_item", {"cart_id": CART_ID, "menu_item_id": menu_item_id}))
+
+async def cart_clear_atool() -> str:
+    return _out("cart.clear", await _amutate("cart.clear", {"cart_id": CART_ID}))
+
+async def orders_create_mock_atool(delivery_fee_cents: Optional[int] = None) -> str:
+    p = {"cart_id": CART_ID, "user_id": USER_ID}
+    if delivery_fee_cents is not None:
+        p["delivery_fee_cents"] = int(delivery_fee_cents)
+    return _out("orders.create_mock", await _amutate("orders.create_mock", p))
+
+async def orders_list_recent_atool(limit: int = 5) -> str:
+    return _out("orders.list_recent", await _call("orders.list_recent", {"user_id": USER_ID, "limit": limit}))
+
+async def orders_reorder_atool(order_id: str) -> str:
+    p = {"cart_id": CART_ID, "user_id": USER_ID, "order_id": order_id, **_projection("orders.reorder")}
+    return _out("orders.reorder", await _amutate("orders.reorder", p))
+
+async def orders_status_get_atool(order_id: str) -> str:
+    return _out("orders.status.get", await _call("orders.status.get", {"order_id": order_id}))
+
+async def orders_status_advance_mock_atool(order_id: str) -> str:
+    return _out("orders.status.advance_mock", await _call("orders.status.advance_mock", {"order_id": order_id}))
+
+async def conversation_create_atool(cart_id: str) -> str:
+    return _json(await _call("conversation.create", {"cart_id": cart_id}))
+
+async def conversation_save_message_atool(conversation_id: int, role: str, content: str) -> str:
+    return _json(await _call(
+        "conversation.save_message",
+        {
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content
+        }
+    ))
+
+async def conversation_load_atool(conversation_id: int) -> str:
+    return _json(await _call(
+        "conversation.load",
+        {"conversation_id": conversation_id}
+    ))
 # ---------------------------
 # Build LangChain tools (StructuredTool from langchain_core.tools)
 # ---------------------------
 restaurants_search = StructuredTool.from_function(
     func=restaurants_search_tool,
+    coroutine=restaurants_search_atool,
     name="restaurants.search",
-    description="Search open restaurants by city/area/cuisine/rating/price.",
+    description="Search open restaurants by city/area/cuisine/dish/rating/max price level.",
     args_schema=RestaurantsSearchArgs
 )
 menus_list = StructuredTool.from_function(
-    func=menus_list_tool, name="menus.list",
+    func=menus_list_tool, coroutine=menus_list_atool, name="menus.list",
     description="List available menu items for a restaurant.",
     args_schema=MenusListArgs
 )
 cart_ensure = StructuredTool.from_function(
-    func=cart_ensure_tool, name="cart.ensure",
+    func=cart_ensure_tool, coroutine=cart_ensure_atool, name="cart.ensure",
     description="Ensure a cart exists for this session (idempotent).",
     args_schema=CartEnsureArgs
 )
 cart_view = StructuredTool.from_function(
-    func=cart_view_tool, name="cart.view",
+    func=cart_view_tool, coroutine=cart_view_atool, name="cart.view",
     description="View current cart items and subtotal.",
     args_schema=CartViewArgs
 )
 cart_add_item = StructuredTool.from_function(
-    func=cart_add_item_tool, name="cart.add_item",
+    func=cart_add_item_tool, coroutine=cart_add_item_atool, name="cart.add_item",
     description="Add a menu item to the current cart (quantity 1..20).",
     args_schema=CartAddItemArgs
 )
+cart_add_items = StructuredTool.from_function(
+    func=cart_add_items_tool, coroutine=cart_add_items_atool, name="cart.add_items",
+    description="Add several menu items to the current cart in one call: items=[{menu_item_id, quantity}].",
+    args_schema=CartAddItemsArgs
+)
 cart_update_item = StructuredTool.from_function(
-    func=cart_update_item_tool, name="cart.update_item",
+    func=cart_update_item_tool, coroutine=cart_update_item_atool, name="cart.update_item",
     description="Update quantity for a cart item; quantity=0 removes it.",
     args_schema=CartUpdateItemArgs
 )
 cart_remove_item = StructuredTool.from_function(
-    func=cart_remove_item_tool, name="cart.remove_item",
+    func=cart_remove_item_tool, coroutine=cart_remove_item_atool, name="cart.remove_item",
     description="Remove an item from the current cart.",
     args_schema=CartRemoveItemArgs
 )
 cart_clear = StructuredTool.from_function(
-    func=cart_clear_tool, name="cart.clear",
+    func=cart_clear_tool, coroutine=cart_clear_atool, name="cart.clear",
     description="Clear the current cart.",
     args_schema=CartClearArgs
 )
 orders_create_mock = StructuredTool.from_function(
-    func=orders_create_mock_tool, name="orders.create_mock",
+    func=orders_create_mock_tool, coroutine=orders_create_mock_atool, name="orders.create_mock",
     description="Place a mock order from the current cart.",
     args_schema=OrdersCreateMockArgs
 )
+orders_list_recent = StructuredTool.from_function(
+    func=orders_list_recent_tool, coroutine=orders_list_recent_atool, name="orders.list_recent",
+    description="List this user's most recent orders (id, date, total, items).",
+    args_schema=OrdersListRecentArgs
+)
+orders_reorder = StructuredTool.from_function(
+    func=orders_reorder_tool, coroutine=orders_reorder_atool, name="orders.reorder",
+    description="Copy a past order's items into the current cart at today's prices; reports unavailable items.",
+    args_schema=OrdersReorderArgs
+)
 orders_status_get = StructuredTool.from_function(
-    func=orders_status_get_tool, name="orders.status.get",
+    func=orders_status_get_tool, coroutine=orders_status_get_atool, name="orders.status.get",
     description="Get current status and ETA for an order.",
     args_schema=OrdersStatusGetArgs
 )
 orders_status_advance_mock = StructuredTool.from_function(
-    func=orders_status_advance_mock_tool, name="orders.status.advance_mock",
+    func=orders_status_advance_mock_tool, coroutine=orders_status_advance_mock_atool, name="orders.status.advance_mock",
     description="[DEV] Advance the order status.",
     args_schema=OrdersAdvanceMockArgs
 
 )
 conversation_create = StructuredTool.from_function(
     func=conversation_create_tool,
+    coroutine=conversation_create_atool,
     name="conversation.create",
     description="Create a new conversation and return conversation_id",
     args_schema=ConversationCreateArgs
@@ -228,12 +718,14 @@ conversation_create = StructuredTool.from_function(
 
 conversation_save_message = StructuredTool.from_function(
     func=conversation_save_message_tool,
+    coroutine=conversation_save_message_atool,
     name="conversation.save_message",
     description="Save a chat message",
     args_schema=ConversationSaveMessageArgs
 )
 conversation_load = StructuredTool.from_function(
     func=conversation_load_tool,
+    coroutine=conversation_load_atool,
     name="conversation.load",
     description="Load full conversation history",
     args_schema=ConversationLoadArgs
@@ -242,8 +734,8 @@ conversation_load = StructuredTool.from_function(
 
 TOOLS = [
     restaurants_search, 
-    cart_ensure, cart_view, cart_add_item, cart_update_item, cart_remove_item, cart_clear,
-    orders_create_mock, orders_status_get, orders_status_advance_mock,conversation_create,conversation_save_message
+    cart_ensure, cart_view, cart_add_item, cart_add_items, cart_update_item, cart_remove_item, cart_clear,
+    orders_create_mock, orders_list_recent, orders_reorder, orders_status_get, orders_status_advance_mock,conversation_create,conversation_save_message
 ]
 
 
@@ -251,13 +743,16 @@ TOOLS = [
 # ---------------------------
 # Model + create_agent (LangChain)
 # ---------------------------
-llm = ChatGoogleGenerativeAI(
-    model="gemini-3-flash-preview", 
-    # model="gemini-2.5-flash-lite", 
-    # model="gemini-2.5-pro",
-  
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+def build_llm(provider: str = LLM_PROVIDER):
+    # LLM_PROVIDER: gemini | groq | openai | ollama | fake | hedged | routed (see providers.py)
+    model = make_chat_model(provider)
+    if provider == "routed":
+        model.context = router_context
+    return model
 
-    temperature=0.2, convert_system_message_to_human=True)
+llm = build_llm()
 agent = create_agent(llm, 
                      tools=TOOLS,
                        system_prompt=SYSTEM_PROMPT,
@@ -266,8 +761,89 @@ agent = create_agent(llm,
 # create_agent builds a graph-based agent you can invoke with a messages list. [1](https://docs.langchain.com/oss/python/langchain/agents)[2](https://reference.langchain.com/python/langchain/agents/)
 
 
+def extract_assistant_text(messages):
+    """
+    Extract the last assistant text message.
+    Gemini returns content blocks, other providers return a plain string.
+    """
+    for msg in reversed(messages):
+        if isinstance(msg, AIMessage):
+            content = msg.content
 
-def main():
+            if isinstance(content, str):
+                return content.strip()
+
+            if isinstance(content, list):
+                for item in content:
+                    if isinstance(item, dict) and "text" in item:
+                        return item["text"].strip()
+
+    return ""
+
+
+# ---------------------------
+# Response cache for discovery turns (keyed by catalog version)
+# ---------------------------
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") != "0"
+CATALOG_VERSION_TTL_S = float(os.getenv("CATALOG_VERSION_TTL_S", "5"))
+response_cache = ResponseCache(threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.75")))
+_catalog_version = {"value": None, "checked": 0.0}
+
+async def catalog_version():
+    # re-read at most every CATALOG_VERSION_TTL_S so cache hits cost no round trip
+    now = time.monotonic()
+    if _catalog_version["value"] is None or now - _catalog_version["checked"] > CATALOG_VERSION_TTL_S:
+        res = await _call("catalog.version", {})
+        _catalog_version.update(value=res.get("version"), checked=now)
+    return _catalog_version["value"]
+
+def _searched_only(new_messages) -> bool:
+    names = [m.name for m in new_messages if isinstance(m, ToolMessage)]
+    return bool(names) and all(n == "restaurants.search" for n in names)
+
+def _search_args(new_messages) -> list:
+    # the filters the agent actually sent to restaurants.search this turn
+    return [c["args"] for m in new_messages if isinstance(m, AIMessage)
+            for c in m.tool_calls if c["name"] == "restaurants.search"]
+
+
+async def chat_turn(conversation_id: int, q: str) -> str:
+    # 3./4. Log the user message (written behind) and take the local history
+    history = await conversation_log.history(conversation_id)
+    conversation_log.append(conversation_id, "user", q)
+
+    # discovery turns can be answered from the cache without the LLM or a search
+    discovery = RESPONSE_CACHE and is_discovery(q)
+    if discovery:
+        version = await catalog_version()
+        hit = response_cache.lookup(q, version)
+        if hit:
+            currentobj.extend(hit["payloads"])
+            shown_items.update(hit["shown"])
+            conversation_log.append(conversation_id, "assistant", hit["reply"])
+            return hit["reply"]
+
+    # print("History:", history)
+
+    # 5. Agent invocation
+    messages = history + currentobj
+    result = await agent.ainvoke({"messages": messages})
+    reply = extract_assistant_text(result["messages"])
+
+    new_messages = result["messages"][len(messages):]
+    if discovery and reply and _searched_only(new_messages) and self_contained(q, _search_args(new_messages)):
+        response_cache.store(q, version, {
+            "reply": reply,
+            "payloads": currentobj[len(messages) - len(history):],
+            "shown": dict(shown_items),
+        })
+
+    # 6. Log assistant message
+    conversation_log.append(conversation_id, "assistant", reply)
+    return reply
+
+
+async def amain():
     # print(f"CART_ID: {CART_ID}")
     print("Welcome to the Food Ordering Assistant! Type your messages below (Ctrl+C to exit).")
     print("Can you please provide your location (city or area) and cuisine type to get started? (ex: 'I'm in downtown and looking for Italian food.')")
@@ -276,41 +852,20 @@ def main():
     messages = []
 
     # 2. Create conversation
-    conv = json.loads(conversation_create_tool(CART_ID))
+    conv = json.loads(await conversation_create_atool(CART_ID))
     conversation_id = conv["conversation_id"]
     print("Conversation ID:", conversation_id)
     try:
         while True:
         
-            q = input("\nYou: ").strip()
+            # read in a thread so the conversation log keeps sending meanwhile
+            q = (await asyncio.to_thread(input, "\nYou: ")).strip()
             if q in {"quit","exit","q","bye","goodbye","stop"}:
                 break
             if not q:
                 continue
 
-            # 3. Save user message
-            conversation_save_message_tool(conversation_id, "user", q)
-
-            # 4. Load messages from DB
-            history = json.loads(
-                conversation_load_tool(conversation_id)
-            )["messages"]
-            # print("History:", history)
-
-            
-
-            # messages.append(("user", q))
-            # messages = messages[-2:]  # keep last 6 messages
-
-            # result = agent.invoke({"messages": messages})
-
-            # 5. Agent invocation
-            result = agent.invoke({"messages": history + currentobj})
-            reply = result["messages"][-1].content[0]["text"]
-
-
-            # 6. Save assistant message
-            conversation_save_message_tool(conversation_id, "assistant", reply)
+            reply = await chat_turn(conversation_id, q)
             messages.append(("assistant", reply))
 
             print("-----------------------------------------------------------------------")
@@ -319,6 +874,13 @@ def main():
 
     except KeyboardInterrupt:
         print("\nGoodbye!")
+    finally:
+        await conversation_log.flush()
+        await aclient.aclose()
+
+
+def main():
+    asyncio.run(amain())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,156 @@
+# fakellm.py
+# Scripted, network-free chat model for offline runs and latency benchmarks.
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field, PrivateAttr
+
+
+# ---------------------------
+# Script loading
+# ---------------------------
+# A script is a list of turns:
+#   {"user": "i want a biryani near guindy",
+#    "steps": [{"tool_calls": [{"name": "restaurants.search", "args": {...}}]},
+#              {"content": "OK. I found ..."}]}
+# Each model call inside a turn replays the next step; the last step is
+# repeated if the agent keeps looping.
+
+def _norm(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def turns_from_transcript(path: str) -> List[dict]:
+    """Parse a 'You: / Assistant:' transcript (see output.txt) into text-only turns."""
+    turns, user, reply = [], None, None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("You:"):
+                if user is not None and reply is not None:
+                    turns.append({"user": user, "steps": [{"content": reply.strip()}]})
+                user, reply = line[len("You:"):].strip(), None
+            elif line.startswith("Assistant:"):
+                reply = line[len("Assistant:"):].strip()
+            elif line.startswith("-----"):
+                continue
+            elif reply is not None:
+                reply += "\n" + line
+    if user is not None and reply is not None:
+        turns.append({"user": user, "steps": [{"content": reply.strip()}]})
+    return turns
+
+
+def load_script(path: str) -> dict:
+    """Load a JSON script, or build a text-only one from a transcript file."""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            script = json.load(f)
+        if isinstance(script, list):
+            script = {"turns": script}
+        return script
+    return {"turns": turns_from_transcript(path)}
+
+
+# ---------------------------
+# Fake chat model
+# ---------------------------
+class ScriptedChatModel(BaseChatModel):
+    """Replays scripted tool calls and replies with synthetic latency.
+
+    Stateless: the turn is picked by matching the latest user message against
+    the script (falling back to the number of user messages seen), and the
+    step by counting AI messages after it, so one instance can serve many
+    concurrent sessions deterministically.
+    """
+
+    turns: List[dict] = Field(default_factory=list)
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # injected slow responses, to stand in for a provider's tail latency
+    tail_ms: float = 0.0
+    tail_prob: float = 0.0
+    seed: int = 0
+    calls: int = 0
+
+    _rng: random.Random = PrivateAttr(default=None)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ScriptedChatModel":
+        script = load_script(path)
+        for key in ("latency_ms", "jitter_ms", "tail_ms", "tail_prob", "seed"):
+            if key in script and key not in kwargs:
+                kwargs[key] = script[key]
+        return cls(turns=script["turns"], **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, *, tool_choice: Optional[str] = None, **kwargs):
+        # tool schemas are irrelevant for replay; the script names the tools
+        return self
+
+    # ---- replay ----
+    def _locate(self, messages: List[BaseMessage]):
+        by_text = {_norm(t.get("user", "")): i for i, t in enumerate(self.turns)}
+        humans = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+
+        anchor, turn = None, None
+        for i in reversed(humans):
+            content = messages[i].content
+            key = _norm(content if isinstance(content, str) else str(content))
+            if key in by_text:
+                anchor, turn = i, by_text[key]
+                break
+        if turn is None:
+            anchor = humans[-1] if humans else -1
+            turn = max(len(humans) - 1, 0) % max(len(self.turns), 1)
+
+        step = sum(1 for m in messages[anchor + 1:] if isinstance(m, AIMessage))
+        return turn, step
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        if not self.turns:
+            return AIMessage(content="")
+        turn, step = self._locate(messages)
+        steps = self.turns[turn].get("steps") or [{"content": ""}]
+        spec = steps[min(step, len(steps) - 1)]
+
+        tool_calls = [
+            {"name": c["name"], "args": c.get("args", {}), "id": f"call_{turn}_{step}_{n}", "type": "tool_call"}
+            for n, c in enumerate(spec.get("tool_calls", []))
+        ]
+        return AIMessage(content=spec.get("content", ""), tool_calls=tool_calls)
+
+    def _delay(self) -> float:
+        if not (self.jitter_ms or self.tail_prob):
+            return self.latency_ms / 1000
+        # seeded, so a run with the same call order sees the same delays
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if self.tail_prob and self._rng.random() < self.tail_prob:
+            delay += self.tail_ms
+        return max(0.0, delay) / 1000
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
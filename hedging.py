@@ -0,0 +1,187 @@
+# hedging.py
+# Provider-router chat model: hedged requests across LLM providers with
+# rolling per-provider latency tracking.
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict, Field
+
+
+# ---------------------------
+# Rolling latency per provider
+# ---------------------------
+class LatencyTracker:
+    def __init__(self, window: int = 200, failure_window: int = 20):
+        self.window = window
+        self.failure_window = failure_window
+        self._samples: Dict[str, deque] = {}
+        self._outcomes: Dict[str, deque] = {}  # True = answered, False = failed
+        self._lock = threading.Lock()
+
+    def record(self, name: str, ms: float):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(ms)
+            self._outcomes.setdefault(name, deque(maxlen=self.failure_window)).append(True)
+
+    def record_failure(self, name: str):
+        # an error or empty answer has no useful latency (it is often fast)
+        with self._lock:
+            self._outcomes.setdefault(name, deque(maxlen=self.failure_window)).append(False)
+
+    def failure_rate(self, name: str) -> float:
+        with self._lock:
+            outcomes = list(self._outcomes.get(name, ()))
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def count(self, name: str) -> int:
+        return len(self._samples.get(name, ()))
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self) -> dict:
+        return {
+            name: {"n": self.count(name), "p50_ms": self.percentile(name, 0.50), "p95_ms": self.percentile(name, 0.95),
+                   "failure_rate": round(self.failure_rate(name), 3)}
+            for name in list(self._outcomes)
+        }
+
+
+def _valid(message) -> bool:
+    # a response counts only if it says something or calls a tool
+    return isinstance(message, AIMessage) and bool(message.content or message.tool_calls)
+
+
+# ---------------------------
+# Hedged chat model
+# ---------------------------
+class HedgedChatModel(BaseChatModel):
+    """Sends each request to the primary provider; if no valid answer arrives
+    by the hedging deadline a backup provider is raced against it, the first
+    valid response wins and the other request is cancelled.
+
+    The primary is the provider with the lowest rolling p50 once every
+    provider has `min_samples` observations (listed order before that);
+    providers that failed more than `max_failure_rate` of their recent calls
+    go last either way. The deadline is `hedge_after_ms` if set, otherwise
+    the provider's rolling p95.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    names: List[str]
+    models: List[Any]
+    hedge_after_ms: Optional[float] = None
+    default_hedge_ms: float = 1500.0
+    min_samples: int = 20
+    max_failure_rate: float = 0.5
+    tracker: LatencyTracker = Field(default_factory=LatencyTracker)
+    counters: Dict[str, int] = Field(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-router"
+
+    def bind_tools(self, tools, *, tool_choice: Optional[str] = None, **kwargs):
+        # bound copies share the tracker and counters with this instance
+        bound = [m.bind_tools(tools, tool_choice=tool_choice, **kwargs) for m in self.models]
+        return self.model_copy(update={"models": bound})
+
+    # ---- routing ----
+    def _order(self) -> List[int]:
+        order = list(range(len(self.models)))
+        if all(self.tracker.count(n) >= self.min_samples for n in self.names):
+            order.sort(key=lambda i: self.tracker.percentile(self.names[i], 0.50))
+        # a provider failing fast would never lose on latency: demote it
+        order.sort(key=lambda i: self.tracker.failure_rate(self.names[i]) > self.max_failure_rate)
+        return order
+
+    def _deadline(self, name: str) -> float:
+        if self.hedge_after_ms is not None:
+            return self.hedge_after_ms / 1000
+        if self.tracker.count(name) >= self.min_samples:
+            return self.tracker.percentile(name, 0.95) / 1000
+        return self.default_hedge_ms / 1000
+
+    def _bump(self, key: str):
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    async def _call(self, i: int, messages, stop):
+        name = self.names[i]
+        t0 = time.perf_counter()
+        message = await self.models[i].ainvoke(messages, stop=stop)
+        if _valid(message):  # empty answers are recorded as failures instead
+            self.tracker.record(name, (time.perf_counter() - t0) * 1000)
+        return message
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        order = self._order()
+        queue = deque(order)
+        pending: Dict[asyncio.Task, tuple] = {}
+        errors: List[BaseException] = []
+
+        def launch():
+            i = queue.popleft()
+            task = asyncio.ensure_future(self._call(i, messages, stop))
+            # each request is judged against its own provider's deadline
+            pending[task] = (self.names[i], time.perf_counter(), self._deadline(self.names[i]))
+
+        launch()
+        deadline = self._deadline(self.names[order[0]])
+        hedged = False
+        try:
+            while pending:
+                timeout = deadline if (queue and not hedged) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # primary missed the deadline: race a backup against it
+                    hedged = True
+                    self._bump("hedges")
+                    launch()
+                    continue
+
+                for task in done:
+                    name, _, _ = pending.pop(task)
+                    if task.exception() is None and _valid(task.result()):
+                        self._bump(f"wins.{name}")
+                        return ChatResult(generations=[ChatGeneration(message=task.result())])
+                    self._bump(f"failures.{name}")
+                    self.tracker.record_failure(name)
+                    errors.append(task.exception() or ValueError(f"{name}: empty response"))
+
+                # a provider failed outright: fall through to the next one now
+                if not pending and queue:
+                    launch()
+        finally:
+            now = time.perf_counter()
+            for task, (name, t0, own_deadline) in pending.items():
+                task.cancel()
+                # a loser that outlived its deadline is a slow sample, not a
+                # missing one; keep it so the p95 (and the deadline) stay honest
+                if now - t0 >= own_deadline:
+                    self.tracker.record(name, (now - t0) * 1000)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        raise errors[-1]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._agenerate(messages, stop=stop))
+        # called synchronously from inside a running loop: race on a helper thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self._agenerate(messages, stop=stop)).result()
@@ -0,0 +1,336 @@
+# metrics.py
+# Prometheus text metrics for GET /metrics. Counters and histograms are kept
+# per thread (a dict owned by the thread that writes it, so recording takes no
+# lock) and summed when scraped. With several uvicorn workers set METRICS_DIR:
+# every worker writes its totals to METRICS_DIR/<pid>.json every
+# METRICS_FLUSH_S and a scrape, whichever worker takes it, adds up all the
+# files (counters of exited workers stay, their gauges are dropped). Empty
+# the directory when deploying.
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# latency buckets, seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NO_TOOL = "(none)"  # SQL run outside a tool call (writer commits, index loads)
+
+HELP = {
+    "food_tool_calls_total": ("counter", "Tool calls dispatched, by tool."),
+    "food_tool_errors_total": ("counter", "Tool calls answered with an error, by tool and code."),
+    "food_tool_seconds": ("histogram", "Tool call time in dispatch (excludes writer queueing), by tool."),
+    "food_sql_statements_total": ("counter", "SQL statements executed, by the tool that ran them."),
+    "food_sql_seconds_total": ("counter", "Time in SQLite execute and fetch calls, by tool."),
+    "food_db_connections_opened_total": ("counter", "SQLite connections opened."),
+    "food_db_connections_closed_total": ("counter", "SQLite connections closed."),
+    "food_http_requests_total": ("counter", "Requests to /invoke*, by path and status."),
+    "food_http_request_seconds": ("histogram", "Request time to /invoke* including admission queueing, by path."),
+    "food_http_requests_in_flight": ("gauge", "Requests to /invoke* being served or queued."),
+    "food_admission_admitted_total": ("counter", "Requests that passed the rate limits."),
+    "food_admission_rejected_total": ("counter", "Requests refused with 429, by reason."),
+    "food_admission_queue_wait_seconds_total": ("counter", "Time requests spent in the admission queue."),
+    "food_admission_queue_depth": ("gauge", "Requests waiting in the admission queue."),
+    "food_writer_queue_depth": ("gauge", "Jobs waiting for the SQLite writer, by DB file."),
+    "food_writer_jobs_total": ("counter", "Jobs run by the SQLite writer, by DB file."),
+    "food_writer_commits_total": ("counter", "Group commits by the SQLite writer, by DB file."),
+    "food_db_pool": ("gauge", "Connection pool statistics (PostgreSQL), by stat."),
+    "food_search_executions_total": ("counter", "restaurants.search computations run (single-flight leaders)."),
+    "food_search_coalesced_total": ("counter", "restaurants.search calls answered by another call's computation."),
+    "food_catalog_cache_hits_total": ("counter", "Catalog read cache hits, by cache."),
+    "food_catalog_cache_misses_total": ("counter", "Catalog read cache misses, by cache."),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self.gauges = []  # callables -> [(name, labels, value)], read on scrape
+        self.totals = []  # same, for counters the components already keep per process
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = ({}, {}, {})  # counters, histograms, tool -> [statements, seconds]
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name: str, labels: tuple = (), value=1):
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, seconds: float):
+        histograms = self._shard()[1]
+        cell = histograms.get((name, labels))
+        if cell is None:
+            cell = histograms[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+        cell[bisect.bisect_left(BUCKETS, seconds)] += 1  # last slot: +Inf
+        cell[-1] += seconds
+
+    # the tool the current thread is running, for SQL attribution
+    def tool(self) -> str:
+        return getattr(self._local, "tool", NO_TOOL)
+
+    def set_tool(self, tool: str) -> str:
+        prev = self.tool()
+        self._local.tool = tool
+        sql = self._shard()[2]
+        cell = sql.get(tool)
+        if cell is None:
+            cell = sql[tool] = [0, 0.0]
+        self._local.sql = cell  # the per-statement path only touches this
+        return prev
+
+    def sql_cell(self) -> list:
+        cell = getattr(self._local, "sql", None)
+        if cell is None:
+            self.set_tool(NO_TOOL)
+            cell = self._local.sql
+        return cell
+
+    def snapshot(self) -> dict:
+        """Totals over all threads, plus the current gauges."""
+        counters, histograms = {}, {}
+        with self._lock:
+            shards = list(self._shards)
+        for own_counters, own_histograms, own_sql in shards:
+            for key, v in dict(own_counters).items():  # dict() copies without releasing the GIL
+                counters[key] = counters.get(key, 0) + v
+            for tool, (n, seconds) in dict(own_sql).items():
+                for key, v in ((("food_sql_statements_total", (("tool", tool),)), n),
+                               (("food_sql_seconds_total", (("tool", tool),)), seconds)):
+                    counters[key] = counters.get(key, 0) + v
+            for key, cell in dict(own_histograms).items():
+                total = histograms.setdefault(key, [0] * len(cell))
+                for i, v in enumerate(list(cell)):
+                    total[i] += v
+        gauges = []
+        for kind, reads in ((counters, self.totals), (gauges, self.gauges)):
+            for read in reads:
+                try:
+                    values = list(read())
+                except Exception as e:
+                    print("metrics callback failed:", e)
+                    continue
+                if kind is gauges:
+                    gauges += values
+                else:
+                    for n, l, v in values:
+                        counters[(n, l)] = counters.get((n, l), 0) + v
+        return {
+            "pid": os.getpid(),
+            "counters": [[n, list(map(list, l)), v] for (n, l), v in counters.items()],
+            "histograms": [[n, list(map(list, l)), c] for (n, l), c in histograms.items()],
+            "gauges": [[n, list(map(list, l)), v] for n, l, v in gauges],
+        }
+
+
+registry = Registry()
+registry.gauges.append(lambda: [("food_http_requests_in_flight", (), RequestMetricsMiddleware.in_flight)])
+
+
+# ---------- several workers ----------
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_snapshot(directory: str, snap: dict):
+    path = os.path.join(directory, f"{snap['pid']}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snap, f)
+    os.replace(tmp, path)
+
+
+def collect(directory: str = None) -> list:
+    """This worker's fresh snapshot plus the last one of every other worker."""
+    own = registry.snapshot()
+    if not directory:
+        return [own]
+    write_snapshot(directory, own)
+    snaps = [own]
+    for name in os.listdir(directory):
+        if not name.endswith(".json") or name == f"{own['pid']}.json":
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced
+        if not _alive(snap["pid"]):
+            snap["gauges"] = []
+        snaps.append(snap)
+    return snaps
+
+
+def start_flusher(directory: str, every_s: float):
+    def flush():
+        while True:
+            time.sleep(every_s)
+            try:
+                write_snapshot(directory, registry.snapshot())
+            except Exception as e:
+                print("metrics flush failed:", e)
+    os.makedirs(directory, exist_ok=True)
+    threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+
+# ---------- exposition ----------
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def render(snaps) -> str:
+    """Prometheus text format (0.0.4) for the summed snapshots."""
+    series = {}  # name -> {labels: value or histogram cell}
+    kinds = {}
+    for snap in snaps:
+        for kind in ("counters", "histograms", "gauges"):
+            for name, labels, v in snap[kind]:
+                kinds[name] = kind
+                bucket = series.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                if kind == "histograms":
+                    total = bucket.setdefault(key, [0] * len(v))
+                    for i, x in enumerate(v):
+                        total[i] += x
+                else:
+                    bucket[key] = bucket.get(key, 0) + v
+    out = []
+    for name in sorted(series):
+        kind = HELP.get(name, ({"counters": "counter", "histograms": "histogram", "gauges": "gauge"}[kinds[name]], ""))
+        if kind[1]:
+            out.append(f"# HELP {name} {kind[1]}")
+        out.append(f"# TYPE {name} {kind[0]}")
+        for labels, v in sorted(series[name].items()):
+            if kinds[name] != "histograms":
+                out.append(f"{name}{_labels(labels)} {v}")
+                continue
+            running = 0
+            for le, n in zip(BUCKETS + ("+Inf",), v):
+                running += n
+                out.append(f"{name}_bucket{_labels(labels + (('le', le),))} {running}")
+            out.append(f"{name}_sum{_labels(labels)} {v[-1]}")
+            out.append(f"{name}_count{_labels(labels)} {running}")
+    return "\n".join(out) + "\n"
+
+
+# ---------- SQLite timing ----------
+_perf_counter = time.perf_counter
+_local = registry._local
+
+
+def _sql_done(t0: float, statement: int = 0):
+    cell = getattr(_local, "sql", None) or registry.sql_cell()
+    cell[0] += statement
+    cell[1] += _perf_counter() - t0
+
+
+class MeteredCursor(sqlite3.Cursor):
+    """Counts statements and times execute + fetch against the running tool."""
+
+    def execute(self, sql, params=()):
+        t0 = _perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _sql_done(t0, 1)
+
+    def executemany(self, sql, seq):
+        t0 = _perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            _sql_done(t0, 1)
+
+    def fetchone(self):
+        t0 = _perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _sql_done(t0)
+
+    def fetchmany(self, size=None):
+        t0 = _perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _sql_done(t0)
+
+    def fetchall(self):
+        t0 = _perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _sql_done(t0)
+
+
+class MeteredConnection(sqlite3.Connection):
+    """sqlite3.connect(..., factory=MeteredConnection)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        registry.inc("food_db_connections_opened_total")
+
+    def cursor(self, factory=MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def executescript(self, script):
+        t0 = _perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            _sql_done(t0, 1)
+
+    def close(self):
+        super().close()
+        registry.inc("food_db_connections_closed_total")
+
+
+# ---------- HTTP ----------
+class RequestMetricsMiddleware:
+    """ASGI wrapper: in-flight gauge, counts by status and latency for `paths`."""
+
+    in_flight = 0  # per process; only the event loop thread changes it
+
+    def __init__(self, app, paths=("/invoke", "/invoke_batch", "/invoke_stream")):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        path, status = scope["path"], [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+        RequestMetricsMiddleware.in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            RequestMetricsMiddleware.in_flight -= 1
+            registry.observe("food_http_request_seconds", (("path", path),), time.perf_counter() - t0)
+            registry.inc("food_http_requests_total", (("path", path), ("status", status[0])))
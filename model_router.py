@@ -0,0 +1,254 @@
+# model_router.py
+# Cost/latency-aware routing: a cheap local classifier scores each user turn,
+# simple turns go to a small fast model and the large model is used only on
+# low confidence or when the small model's tool call fails validation.
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict, Field, ValidationError
+
+
+# ---------------------------
+# Turn classifier
+# ---------------------------
+# Trigger phrases mirror the intent sections of prompt.py.
+INTENT_TRIGGERS = {
+    "search": ("near", "restaurant", "restaurants", "find", "looking for", "show me", "hungry"),
+    "menu": ("menu",),
+    "add": ("add", "add to cart", "want to add"),
+    "update": ("one more", "add more", "increase", "decrease", "modify", "update"),
+    "remove": ("remove item", "delete item", "remove"),
+    "view": ("view cart", "show cart", "my cart", "what's in my cart", "what’s in my cart"),
+    "clear": ("clear cart", "remove my cart", "delete cart", "empty my cart"),
+    "order": ("place order", "place the order", "checkout", "yes"),
+}
+CART_INTENTS = {"add", "update", "remove"}
+VAGUE_REFS = ("it", "that", "this", "those", "these", "same", "them", "one of")
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+
+def _has_phrase(words: List[str], phrase: str) -> bool:
+    target = phrase.split()
+    n = len(target)
+    return any(words[i:i + n] == target for i in range(len(words) - n + 1))
+
+
+def fuzzy_in(token: str, words) -> bool:
+    # tolerate spellings like 'briyani' for 'biryani'
+    return token in words or any(
+        abs(len(w) - len(token)) <= 2 and SequenceMatcher(None, w, token).ratio() >= 0.8 for w in words
+    )
+
+
+def turn_features(text: str, shown_items: List[str] = (), cart_size: int = 0) -> dict:
+    words = _words(text)
+    intents = {
+        name for name, phrases in INTENT_TRIGGERS.items()
+        if any(_has_phrase(words, p) for p in phrases)
+    }
+    # 'add one more' is an update and 'add to my cart' is not a view (prompt.py)
+    if "update" in intents:
+        intents.discard("add")
+    if len(intents) > 1:
+        intents.discard("view")
+    intents = sorted(intents)
+    # an item counts as referenced when every token of its name appears
+    wordset = set(words)
+    refs = []
+    for name in shown_items:
+        tokens = [t for t in _words(name) if len(t) > 2]
+        if tokens and all(fuzzy_in(t, wordset) for t in tokens):
+            refs.append(name)
+    return {
+        "intents": intents,
+        "n_words": len(words),
+        "n_numbers": sum(1 for w in words if w.isdigit() or w in ("one", "two", "three", "four", "five")),
+        "shown_refs": refs,
+        "vague_ref": any(_has_phrase(words, v) for v in VAGUE_REFS),
+        "conjunction": "and" in wordset or "also" in wordset or "," in (text or ""),
+        "cart_size": cart_size,
+    }
+
+
+def score_turn(features: dict) -> float:
+    """Confidence (0..1) that a small model handles the turn correctly."""
+    intents = features["intents"]
+    if len(intents) == 1:
+        conf = 0.9
+    elif not intents:
+        conf = 0.4
+    else:
+        conf = 0.5
+
+    if CART_INTENTS & set(intents):
+        refs = len(features["shown_refs"])
+        if refs == 0:
+            conf -= 0.3   # item must be resolved from earlier context
+        elif refs > 1:
+            conf -= 0.2   # multi-item request
+        if features["intents"] != ["add"] and features["cart_size"] == 0:
+            conf -= 0.2   # updating/removing with nothing known in the cart
+    if features["vague_ref"]:
+        conf -= 0.2
+    if features["conjunction"] and features["n_numbers"] > 1:
+        conf -= 0.2
+    if features["n_words"] > 25:
+        conf -= 0.2
+    return max(0.0, min(1.0, conf))
+
+
+# ---------------------------
+# Decision log
+# ---------------------------
+class RoutingLog:
+    """Appends one JSON line per routing decision/outcome for threshold tuning."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        if not self.path:
+            return
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# ---------------------------
+# Routed chat model
+# ---------------------------
+class RoutedChatModel(BaseChatModel):
+    """Routes each model call to `small` or `large` by turn complexity.
+
+    `context` is an optional callable returning {"shown_items": [...],
+    "cart_size": n} for the current session (menu items already shown to the
+    user and the number of lines in the cart).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    small: Any
+    large: Any
+    small_name: str = "small"
+    large_name: str = "large"
+    threshold: float = 0.7
+    context: Optional[Callable[[], dict]] = None
+    tool_schemas: Dict[str, Any] = Field(default_factory=dict)
+    log: RoutingLog = Field(default_factory=lambda: RoutingLog(None))
+    counters: Dict[str, int] = Field(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def bind_tools(self, tools, *, tool_choice: Optional[str] = None, **kwargs):
+        schemas = {t.name: getattr(t, "args_schema", None) for t in tools if hasattr(t, "name")}
+        return self.model_copy(update={
+            "small": self.small.bind_tools(tools, tool_choice=tool_choice, **kwargs),
+            "large": self.large.bind_tools(tools, tool_choice=tool_choice, **kwargs),
+            "tool_schemas": schemas,
+        })
+
+    def _bump(self, key: str):
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    # ---- features of the current turn ----
+    @staticmethod
+    def _turn(messages):
+        # createagent appends search payloads (JSON or compact "[tool] ...")
+        # as user messages; skip them
+        last = max(
+            (i for i, m in enumerate(messages)
+             if isinstance(m, HumanMessage) and not str(m.content).lstrip().startswith(("{", "["))),
+            default=-1,
+        )
+        text = messages[last].content if last >= 0 else ""
+        after = messages[last + 1:]
+        step = sum(1 for m in after if isinstance(m, AIMessage))
+        tool_errors = sum(
+            1 for m in after
+            if isinstance(m, ToolMessage) and ('"error"' in str(m.content) or "] error" in str(m.content))
+        )
+        return (text if isinstance(text, str) else str(text)), step, tool_errors
+
+    def _tool_problems(self, message) -> List[str]:
+        if not isinstance(message, AIMessage) or not (message.content or message.tool_calls):
+            return ["empty_response"]
+        problems = []
+        for call in message.tool_calls:
+            if self.tool_schemas and call["name"] not in self.tool_schemas:
+                problems.append(f"unknown_tool:{call['name']}")
+                continue
+            schema = self.tool_schemas.get(call["name"])
+            if schema is not None and hasattr(schema, "model_validate"):
+                try:
+                    schema.model_validate(call.get("args") or {})
+                except ValidationError as e:
+                    problems.append(f"invalid_args:{call['name']}:{e.error_count()}")
+        return problems
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text, step, tool_errors = self._turn(messages)
+        ctx = self.context() if self.context else {}
+        features = turn_features(text, ctx.get("shown_items", ()), ctx.get("cart_size", 0))
+        confidence = score_turn(features)
+        # a tool error in this turn means the small model already went wrong
+        route = "small" if confidence >= self.threshold and not tool_errors else "large"
+
+        t0 = time.perf_counter()
+        model = self.small if route == "small" else self.large
+        message = await model.ainvoke(messages, stop=stop)
+        problems, escalated = [], False
+        if route == "small":
+            problems = self._tool_problems(message)
+            if problems:
+                escalated = True
+                message = await self.large.ainvoke(messages, stop=stop)
+
+        self._bump(f"route.{route}")
+        if escalated:
+            self._bump("escalations")
+        self.log.write({
+            "ts": time.time(),
+            "text": text,
+            "step": step,
+            "features": features,
+            "confidence": round(confidence, 3),
+            "threshold": self.threshold,
+            "route": route,
+            "model": self.large_name if (route == "large" or escalated) else self.small_name,
+            "escalated": escalated,
+            "problems": problems,
+            "prior_tool_errors": tool_errors,
+            "tool_calls": [c["name"] for c in getattr(message, "tool_calls", [])],
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._agenerate(messages, stop=stop))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self._agenerate(messages, stop=stop)).result()
+
+
+def routing_log_from_env() -> RoutingLog:
+    return RoutingLog(os.getenv("ROUTING_LOG", "routing_log.jsonl"))
@@ -0,0 +1,81 @@
+# providers.py
+# Chat model construction by provider name. Imports are lazy so an offline
+# run only needs the packages of the providers it actually uses.
+import os
+
+
+def _fake(prefix: str = "FAKE_LLM"):
+    from fakellm import ScriptedChatModel
+    overrides = {}
+    for key in ("latency_ms", "jitter_ms", "tail_ms", "tail_prob"):
+        value = os.getenv(f"{prefix}_{key.upper()}")
+        if value:
+            overrides[key] = float(value)
+    if os.getenv(f"{prefix}_SEED"):
+        overrides["seed"] = int(os.getenv(f"{prefix}_SEED"))
+    script = os.getenv(f"{prefix}_SCRIPT") or os.getenv("FAKE_LLM_SCRIPT", "fake_script.json")
+    return ScriptedChatModel.from_file(script, **overrides)
+
+
+def make_chat_model(provider: str):
+    """Build one chat model. `fake:<NAME>` reads FAKE_<NAME>_* settings so
+    several stand-ins with different delays can be configured side by side."""
+    if provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
+            # model="gemini-2.5-flash-lite",
+            # model="gemini-2.5-pro",
+            temperature=0.2, convert_system_message_to_human=True)
+
+    if provider == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            model=os.getenv("GROQ_MODEL", "llama-3.1-8b-instant"),
+            api_key=os.getenv("GROQ_API_KEY"),
+            temperature=0.2)
+
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            temperature=0.2)
+
+    if provider == "ollama":
+        from langchain_ollama import ChatOllama
+        return ChatOllama(
+            model=os.getenv("OLLAMA_MODEL", "llama3.1"),
+            base_url=os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434"),
+            temperature=0.2)
+
+    if provider == "fake":
+        return _fake()
+
+    if provider.startswith("fake:"):
+        return _fake("FAKE_" + provider.split(":", 1)[1].upper())
+
+    if provider == "hedged":
+        from hedging import HedgedChatModel
+        names = [n.strip() for n in os.getenv("LLM_HEDGE_PROVIDERS", "gemini,groq").split(",") if n.strip()]
+        hedge_after = os.getenv("LLM_HEDGE_AFTER_MS")
+        return HedgedChatModel(
+            names=names,
+            models=[make_chat_model(n) for n in names],
+            hedge_after_ms=float(hedge_after) if hedge_after else None,
+        )
+
+    if provider == "routed":
+        from model_router import RoutedChatModel, routing_log_from_env
+        small = os.getenv("ROUTER_SMALL", "groq")
+        large = os.getenv("ROUTER_LARGE", "gemini")
+        return RoutedChatModel(
+            small=make_chat_model(small),
+            large=make_chat_model(large),
+            small_name=small,
+            large_name=large,
+            threshold=float(os.getenv("ROUTER_THRESHOLD", "0.7")),
+            log=routing_log_from_env(),
+        )
+
+    raise ValueError(f"Unknown LLM provider: {provider}")
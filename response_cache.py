@@ -0,0 +1,134 @@
+# response_cache.py
+# Semantic cache for discovery turns ("biryani near guindy", "briyani in
+# guindy"). Their answers depend only on the catalog, so entries are keyed
+# by catalog version and dropped as soon as the version changes.
+import re
+import threading
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from model_router import fuzzy_in, turn_features
+
+# words that do not change which restaurants a discovery question returns
+STOPWORDS = {
+    "i", "im", "i'm", "want", "wanna", "need", "a", "an", "the", "some", "any", "me", "my",
+    "show", "find", "get", "give", "list", "looking", "for", "to", "eat", "near", "nearby",
+    "in", "at", "around", "by", "of", "from", "please", "plz", "pls", "can", "you", "could",
+    "location", "area", "place", "places", "restaurant", "restaurants", "food", "shop", "shops",
+    "is", "are", "there", "what", "which", "good", "best",
+}
+DISCOVERY_INTENTS = {"search", "menu"}
+# restaurants.search filters a stored turn must have named itself: what to
+# eat and where
+WHAT_FILTERS = ("cuisine", "dish")
+WHERE_FILTERS = ("area", "city")
+
+
+def is_discovery(text: str) -> bool:
+    # "briyani in guindy" has no trigger word, so also accept turns with no
+    # intent at all; only self_contained() turns get stored
+    features = turn_features(text)
+    return set(features["intents"]) <= DISCOVERY_INTENTS and not features["vague_ref"]
+
+
+def self_contained(text: str, searches: List[dict]) -> bool:
+    """True when every restaurants.search the turn ran (their args) used only
+    filters spelled out in the turn, naming both what and where. "guindy" in
+    answer to "which area?" also searches the earlier turn's cuisine, so its
+    reply depends on the conversation and must not be stored under its text."""
+    words = normalize(text).split()
+    if not searches:
+        return False
+    for args in searches:
+        used = {k: v for k, v in args.items() if v not in (None, "")}
+        if set(used) - set(WHAT_FILTERS + WHERE_FILTERS):
+            return False  # rating / price limits come from anywhere in the chat
+        if not (set(used) & set(WHAT_FILTERS) and set(used) & set(WHERE_FILTERS)):
+            return False
+        for value in used.values():
+            terms = normalize(str(value)).split()
+            if not terms or not all(fuzzy_in(t, words) for t in terms):
+                return False
+    return True
+
+
+def normalize(text: str) -> str:
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return " ".join(sorted(w for w in words if w not in STOPWORDS))
+
+
+def embed(normalized: str, dim: int = 1024) -> np.ndarray:
+    """Hashed character 2/3-gram bag, L2-normalised."""
+    v = np.zeros(dim, dtype=np.float32)
+    for tok in normalized.split():
+        s = f" {tok} "
+        for n in (2, 3):
+            for i in range(len(s) - n + 1):
+                v[zlib.crc32(s[i:i + n].encode()) % dim] += 1.0
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+def _same_terms(a: str, b: str) -> bool:
+    # nearest neighbour must also agree term by term, so 'biryani guindy'
+    # never answers 'biryani adyar' however close the vectors are
+    ta, tb = a.split(), b.split()
+    return bool(ta) and all(fuzzy_in(t, tb) for t in ta) and all(fuzzy_in(t, ta) for t in tb)
+
+
+class ResponseCache:
+    def __init__(self, threshold: float = 0.75, max_entries: int = 1024, dim: int = 1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self.version = None
+        self._keys: List[str] = []
+        self._values: List[dict] = []
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _reset(self, version):
+        self.version = version
+        self._keys, self._values = [], []
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+    def lookup(self, text: str, version) -> Optional[dict]:
+        key = normalize(text)
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if not key or not self._keys:
+                self.misses += 1
+                return None
+            sims = self._matrix @ embed(key, self.dim)
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold and _same_terms(key, self._keys[best]):
+                self.hits += 1
+                return self._values[best]
+            self.misses += 1
+            return None
+
+    def store(self, text: str, version, value: dict):
+        key = normalize(text)
+        if not key:
+            return
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if key in self._keys:
+                return
+            if len(self._keys) >= self.max_entries:
+                # oldest first
+                self._keys.pop(0)
+                self._values.pop(0)
+                self._matrix = self._matrix[1:]
+            self._keys.append(key)
+            self._values.append(value)
+            self._matrix = np.vstack([self._matrix, embed(key, self.dim)[None, :]])
+
+    def stats(self) -> dict:
+        return {"entries": len(self._keys), "hits": self.hits, "misses": self.misses, "version": self.version}
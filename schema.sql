@@ -1,27 +1,10 @@
 -- schema.sql
+-- Transactional tables (carts, orders, conversations, users). The catalog is
+-- in schema_catalog.sql: run both on food1.db for a single file, or
+-- schema_catalog.sql on catalog.db when the backend runs with CATALOG_DB
+-- (menu_items references then resolve through ATTACH and are not enforced).
 PRAGMA foreign_keys = ON;
 
-CREATE TABLE IF NOT EXISTS restaurants (
-  id              INTEGER PRIMARY KEY,
-  name            TEXT NOT NULL,
-  area            TEXT,             -- e.g., T. Nagar, OMR
-  city            TEXT,             -- e.g., Chennai
-  cuisine_tags    TEXT,             -- CSV tags: 'South Indian,Biryani'
-  rating          REAL,             -- 0-5
-  price_level     INTEGER,          -- 1=cheap, 2=mid, 3=premium
-  is_open         INTEGER DEFAULT 1
-);
-
-CREATE TABLE IF NOT EXISTS menu_items (
-  id              INTEGER PRIMARY KEY,
-  restaurant_id   INTEGER NOT NULL REFERENCES restaurants(id) ON DELETE CASCADE,
-  name            TEXT NOT NULL,
-  description     TEXT,
-  price_cents     INTEGER NOT NULL,
-  is_available    INTEGER DEFAULT 1,
-  category        TEXT              -- e.g., 'Main Course','Dessert'
-);
-
 CREATE TABLE IF NOT EXISTS carts (
   id              TEXT PRIMARY KEY, -- a session/user UUID
   created_at      TEXT NOT NULL DEFAULT (datetime('now'))
@@ -55,16 +38,41 @@ CREATE TABLE IF NOT EXISTS orders (
 CREATE TABLE IF NOT EXISTS order_items (
   id              INTEGER PRIMARY KEY,
   order_id        TEXT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+  menu_item_id    INTEGER REFERENCES menu_items(id),  -- for reorder
   menu_item_name  TEXT NOT NULL,          -- snapshot
   unit_price_cents INTEGER NOT NULL,      -- snapshot
-  quantity        INTEGER NOT NULL\
-  
+  quantity        INTEGER NOT NULL
 );
 
-CREATE INDEX IF NOT EXISTS idx_restaurants_city ON restaurants(city);
-CREATE INDEX IF NOT EXISTS idx_menu_restaurant ON menu_items(restaurant_id);
 CREATE INDEX IF NOT EXISTS idx_cart_items_cart ON cart_items(cart_id);
+-- one line per item per cart (cart.add_items upserts on it)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_items_cart_item ON cart_items(cart_id, menu_item_id);
 CREATE INDEX IF NOT EXISTS idx_orders_cart ON orders(cart_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_placed ON orders(user_id, placed_at);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
+
+-- cart version for conditional cart.view (etag / if_none_match): every
+-- cart_items change bumps its cart; never reset, so a version is never reused
+CREATE TABLE IF NOT EXISTS cart_versions (
+  cart_id         TEXT PRIMARY KEY,
+  version         INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_cart_items_ins_version AFTER INSERT ON cart_items
+BEGIN
+  INSERT INTO cart_versions(cart_id, version) VALUES (NEW.cart_id, 1)
+  ON CONFLICT(cart_id) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_cart_items_upd_version AFTER UPDATE ON cart_items
+BEGIN
+  INSERT INTO cart_versions(cart_id, version) VALUES (NEW.cart_id, 1)
+  ON CONFLICT(cart_id) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_cart_items_del_version AFTER DELETE ON cart_items
+BEGIN
+  INSERT INTO cart_versions(cart_id, version) VALUES (OLD.cart_id, 1)
+  ON CONFLICT(cart_id) DO UPDATE SET version = version + 1;
+END;
 
 
 CREATE TABLE IF NOT EXISTS conversations (
@@ -78,7 +86,9 @@ CREATE TABLE IF NOT EXISTS messages (
   conversation_id INTEGER NOT NULL,
   role TEXT NOT NULL CHECK(role IN ('user','assistant','system')),
   content TEXT NOT NULL,
+  message_id TEXT,           -- client-chosen, makes conversation.append retries idempotent
   created_at TEXT NOT NULL DEFAULT (datetime('now')),
+  -- ALTER TABLE messages ADD COLUMN message_id TEXT;
   FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
 );
 
@@ -92,3 +102,6 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE INDEX IF NOT EXISTS idx_messages_conversation
 ON messages(conversation_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_message_id
+ON messages(message_id);
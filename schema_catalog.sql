@@ -0,0 +1,91 @@
+-- schema_catalog.sql
+-- Read-mostly catalog: restaurants, menu items and the catalog version.
+-- Lives in food1.db next to schema.sql, or alone in catalog.db (CATALOG_DB).
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS restaurants (
+  id              INTEGER PRIMARY KEY,
+  name            TEXT NOT NULL,
+  area            TEXT,             -- e.g., T. Nagar, OMR
+  city            TEXT,             -- e.g., Chennai
+  cuisine_tags    TEXT,             -- CSV tags: 'South Indian,Biryani'
+  rating          REAL,             -- 0-5
+  price_level     INTEGER,          -- 1=cheap, 2=mid, 3=premium
+  is_open         INTEGER DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS menu_items (
+  id              INTEGER PRIMARY KEY,
+  restaurant_id   INTEGER NOT NULL REFERENCES restaurants(id) ON DELETE CASCADE,
+  name            TEXT NOT NULL,
+  description     TEXT,
+  price_cents     INTEGER NOT NULL,
+  is_available    INTEGER DEFAULT 1,
+  category        TEXT              -- e.g., 'Main Course','Dessert'
+);
+
+CREATE INDEX IF NOT EXISTS idx_restaurants_city ON restaurants(city);
+CREATE INDEX IF NOT EXISTS idx_menu_restaurant ON menu_items(restaurant_id);
+
+
+-- catalog version: bumped on every restaurant/menu change so clients can
+-- invalidate anything derived from the catalog (e.g. cached search answers)
+CREATE TABLE IF NOT EXISTS catalog_meta (
+  id              INTEGER PRIMARY KEY CHECK (id = 1),
+  version         INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO catalog_meta(id, version) VALUES (1, 0);
+
+-- per-restaurant version for precise cache invalidation (catalog_cache.py):
+-- every change also stamps the restaurant it touches with the new
+-- catalog_meta.version, and restaurants changes stamp row 0 (the restaurant
+-- list itself, i.e. which restaurants a search matches)
+CREATE TABLE IF NOT EXISTS restaurant_versions (
+  restaurant_id   INTEGER PRIMARY KEY,
+  version         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_restaurant_versions_version ON restaurant_versions(version);
+
+-- dropped first so re-running this file upgrades the older version-only triggers
+DROP TRIGGER IF EXISTS trg_restaurants_ins_version;
+CREATE TRIGGER trg_restaurants_ins_version AFTER INSERT ON restaurants
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO restaurant_versions(restaurant_id, version)
+  SELECT r, version FROM catalog_meta, (SELECT NEW.id AS r UNION SELECT 0) WHERE id = 1;
+END;
+DROP TRIGGER IF EXISTS trg_restaurants_upd_version;
+CREATE TRIGGER trg_restaurants_upd_version AFTER UPDATE ON restaurants
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO restaurant_versions(restaurant_id, version)
+  SELECT r, version FROM catalog_meta, (SELECT NEW.id AS r UNION SELECT OLD.id UNION SELECT 0) WHERE id = 1;
+END;
+DROP TRIGGER IF EXISTS trg_restaurants_del_version;
+CREATE TRIGGER trg_restaurants_del_version AFTER DELETE ON restaurants
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO restaurant_versions(restaurant_id, version)
+  SELECT r, version FROM catalog_meta, (SELECT OLD.id AS r UNION SELECT 0) WHERE id = 1;
+END;
+DROP TRIGGER IF EXISTS trg_menu_items_ins_version;
+CREATE TRIGGER trg_menu_items_ins_version AFTER INSERT ON menu_items
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO restaurant_versions(restaurant_id, version)
+  SELECT NEW.restaurant_id, version FROM catalog_meta WHERE id = 1;
+END;
+DROP TRIGGER IF EXISTS trg_menu_items_upd_version;
+CREATE TRIGGER trg_menu_items_upd_version AFTER UPDATE ON menu_items
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO restaurant_versions(restaurant_id, version)
+  SELECT r, version FROM catalog_meta, (SELECT NEW.restaurant_id AS r UNION SELECT OLD.restaurant_id) WHERE id = 1;
+END;
+DROP TRIGGER IF EXISTS trg_menu_items_del_version;
+CREATE TRIGGER trg_menu_items_del_version AFTER DELETE ON menu_items
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  INSERT OR REPLACE INTO restaurant_versions(restaurant_id, version)
+  SELECT OLD.restaurant_id, version FROM catalog_meta WHERE id = 1;
+END;
@@ -0,0 +1,131 @@
+-- schema_pg.sql
+-- PostgreSQL version of schema_catalog.sql + schema.sql for STORAGE=postgres:
+--   psql "$POSTGRES_DSN" -f schema_pg.sql && psql "$POSTGRES_DSN" -f seed.sql
+-- Same tables and columns; 0/1 flags stay INTEGER and placed_at stays text
+-- so results match the SQLite backend.
+
+CREATE TABLE IF NOT EXISTS restaurants (
+  id              SERIAL PRIMARY KEY,
+  name            TEXT NOT NULL,
+  area            TEXT,
+  city            TEXT,
+  cuisine_tags    TEXT,
+  rating          DOUBLE PRECISION,
+  price_level     INTEGER,
+  is_open         INTEGER DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS menu_items (
+  id              SERIAL PRIMARY KEY,
+  restaurant_id   INTEGER NOT NULL REFERENCES restaurants(id) ON DELETE CASCADE,
+  name            TEXT NOT NULL,
+  description     TEXT,
+  price_cents     INTEGER NOT NULL,
+  is_available    INTEGER DEFAULT 1,
+  category        TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_restaurants_city ON restaurants(city);
+CREATE INDEX IF NOT EXISTS idx_menu_restaurant ON menu_items(restaurant_id);
+
+CREATE TABLE IF NOT EXISTS catalog_meta (
+  id              INTEGER PRIMARY KEY CHECK (id = 1),
+  version         BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_meta(id, version) VALUES (1, 0) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+  UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_restaurants_version ON restaurants;
+CREATE TRIGGER trg_restaurants_version AFTER INSERT OR UPDATE OR DELETE ON restaurants
+FOR EACH ROW EXECUTE FUNCTION bump_catalog_version();
+DROP TRIGGER IF EXISTS trg_menu_items_version ON menu_items;
+CREATE TRIGGER trg_menu_items_version AFTER INSERT OR UPDATE OR DELETE ON menu_items
+FOR EACH ROW EXECUTE FUNCTION bump_catalog_version();
+
+CREATE TABLE IF NOT EXISTS carts (
+  id              TEXT PRIMARY KEY,
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- no FKs to carts/menu_items: the SQLite backend does not enforce them either
+CREATE TABLE IF NOT EXISTS cart_items (
+  id              BIGSERIAL PRIMARY KEY,
+  cart_id         TEXT NOT NULL,
+  user_id         TEXT,
+  menu_item_id    INTEGER NOT NULL,
+  quantity        INTEGER NOT NULL CHECK(quantity > 0),
+  unit_price_cents INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+  id              TEXT PRIMARY KEY,
+  seq             BIGSERIAL,        -- placing order, breaks same-second ties
+  cart_id         TEXT NOT NULL,
+  user_id         TEXT NOT NULL,
+  status          TEXT NOT NULL CHECK(status IN ('PLACED','CONFIRMED','PREPARING','OUT_FOR_DELIVERY','DELIVERED','CANCELLED')),
+  subtotal_cents  INTEGER NOT NULL,
+  delivery_fee_cents INTEGER NOT NULL,
+  total_cents     INTEGER NOT NULL,
+  placed_at       TEXT NOT NULL DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'),
+  eta_minutes     INTEGER,
+  tracking_code   TEXT
+);
+
+CREATE TABLE IF NOT EXISTS order_items (
+  id              BIGSERIAL PRIMARY KEY,
+  order_id        TEXT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+  menu_item_id    INTEGER,
+  menu_item_name  TEXT NOT NULL,
+  unit_price_cents INTEGER NOT NULL,
+  quantity        INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_cart_items_cart ON cart_items(cart_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_items_cart_item ON cart_items(cart_id, menu_item_id);
+CREATE INDEX IF NOT EXISTS idx_orders_cart ON orders(cart_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_placed ON orders(user_id, placed_at);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
+
+-- cart version for conditional cart.view, as in schema.sql
+CREATE TABLE IF NOT EXISTS cart_versions (
+  cart_id         TEXT PRIMARY KEY,
+  version         BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION bump_cart_version() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO cart_versions(cart_id, version)
+  VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.cart_id ELSE NEW.cart_id END, 1)
+  ON CONFLICT (cart_id) DO UPDATE SET version = cart_versions.version + 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cart_items_version ON cart_items;
+CREATE TRIGGER trg_cart_items_version AFTER INSERT OR UPDATE OR DELETE ON cart_items
+FOR EACH ROW EXECUTE FUNCTION bump_cart_version();
+
+CREATE TABLE IF NOT EXISTS conversations (
+  id              BIGSERIAL PRIMARY KEY,
+  cart_id         TEXT NOT NULL,
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+  id              BIGSERIAL PRIMARY KEY,
+  conversation_id BIGINT NOT NULL,
+  role            TEXT NOT NULL CHECK(role IN ('user','assistant','system')),
+  content         TEXT NOT NULL,
+  message_id      TEXT,  -- client-chosen, makes conversation.append retries idempotent
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS message_id TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id);
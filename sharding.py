@@ -0,0 +1,195 @@
+# sharding.py
+# Consistent hashing of carts and conversations over several SQLite files
+# (DB_SHARDS in backend.py), plus the offline tools that go with it:
+#
+#   python sharding.py init --shards s0.db,s1.db,s2.db
+#   python sharding.py reshard --from food1.db --to s0.db,s1.db,s2.db
+#   python sharding.py scan --shards s0.db,s1.db "SELECT cart_id, COUNT(*) FROM cart_items GROUP BY cart_id"
+#   python sharding.py where --shards s0.db,s1.db <cart_id or conversation_id>
+#
+# Shards are named by the exact strings in DB_SHARDS; the ring hashes those
+# names, so reshard --to must list them the same way the backend does.
+import argparse
+import bisect
+import hashlib
+import sqlite3
+
+VNODES = 128
+
+
+def _hash(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Maps a key to one of `nodes`; adding or removing a node only moves the
+    keys that land on it (about 1/N of them)."""
+
+    def __init__(self, nodes, vnodes: int = VNODES):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        self.nodes = list(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node(self, key) -> str:
+        i = bisect.bisect(self._keys, _hash(str(key)))
+        return self._nodes[i % len(self._nodes)]
+
+
+def parse_shards(spec: str) -> list:
+    return [p.strip() for p in (spec or "").split(",") if p.strip()]
+
+
+# ---------- Admin scan ----------
+def scan(paths, sql: str, params=(), catalog: str = None):
+    """Run one read-only query on every shard; yields (path, row).
+
+    `catalog` attaches the catalog DB so queries can join menu_items.
+    """
+    for path in paths:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            if catalog:
+                conn.execute("ATTACH DATABASE ? AS catalog", (f"file:{catalog}?mode=ro",))
+            for row in conn.execute(sql, params):
+                yield path, row
+        finally:
+            conn.close()
+
+
+# ---------- Reshard ----------
+# routing keys per family; cart data follows cart_id, chat data follows
+# conversation_id (the same keys backend.shard_key() hashes)
+KEY_QUERIES = {
+    "cart": "SELECT id FROM carts UNION SELECT cart_id FROM cart_items UNION SELECT cart_id FROM orders"
+            " UNION SELECT cart_id FROM cart_versions",
+    "conversation": "SELECT id FROM conversations UNION SELECT conversation_id FROM messages",
+}
+_CARTS = "(SELECT key FROM temp.moving WHERE family = 'cart')"
+_CONVERSATIONS = "(SELECT key FROM temp.moving WHERE family = 'conversation')"
+# copied in this order, deleted in reverse (order_items before its orders)
+MOVES = [
+    ("carts", f"id IN {_CARTS}"),
+    # before cart_items, whose insert triggers then bump it: cart versions
+    # keep growing across a move, so an old etag never matches new contents
+    ("cart_versions", f"cart_id IN {_CARTS}"),
+    ("cart_items", f"cart_id IN {_CARTS}"),
+    ("orders", f"cart_id IN {_CARTS}"),
+    ("order_items", f"order_id IN (SELECT id FROM main.orders WHERE cart_id IN {_CARTS})"),
+    ("conversations", f"id IN {_CONVERSATIONS}"),
+    ("messages", f"conversation_id IN {_CONVERSATIONS}"),
+]
+# per-file row ids that would collide in the destination; copied without
+# them (in rowid order, so messages keep their order)
+SURROGATE_IDS = {"cart_items", "order_items", "messages"}
+
+
+def _columns(conn, table: str) -> str:
+    cols = [r[1] for r in conn.execute(f"PRAGMA main.table_info({table})")]
+    if table in SURROGATE_IDS:
+        cols.remove("id")
+    return ", ".join(cols)
+
+
+def _move(conn, dst: str, keys: dict) -> dict:
+    conn.execute("ATTACH DATABASE ? AS dst", (dst,))
+    counts = {}
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS moving (family TEXT, key)")
+        conn.execute("DELETE FROM temp.moving")
+        conn.executemany(
+            "INSERT INTO temp.moving VALUES (?, ?)",
+            [(family, k) for family, ks in keys.items() for k in ks],
+        )
+        for table, where in MOVES:
+            cols = _columns(conn, table)
+            cur = conn.execute(
+                f"INSERT INTO dst.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE {where} ORDER BY rowid"
+            )
+            counts[table] = cur.rowcount
+        for table, where in reversed(MOVES):
+            conn.execute(f"DELETE FROM main.{table} WHERE {where}")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("DETACH DATABASE dst")
+    return counts
+
+
+def init(paths, schema: str = "schema.sql"):
+    """Create the transactional tables (IF NOT EXISTS) in every shard file."""
+    ddl = open(schema).read()
+    for path in paths:
+        conn = sqlite3.connect(path)
+        conn.executescript(ddl)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+
+
+def reshard(old, new, schema: str = "schema.sql", vnodes: int = VNODES):
+    """Move every cart and conversation in the `old` shard files to its home
+    in the `new` ring. Run it with the backend stopped.
+
+    Files only in `new` are created from `schema`; files only in `old` are
+    left empty. Each (source, destination) pair moves in one transaction, so
+    an interrupted run can simply be repeated.
+    """
+    ring = HashRing(new, vnodes)
+    init(new, schema)
+
+    for src in old:
+        conn = sqlite3.connect(src, isolation_level=None)
+        plan = {}
+        for family, sql in KEY_QUERIES.items():
+            for (key,) in conn.execute(sql):
+                dst = ring.node(key)
+                if dst != src:
+                    plan.setdefault(dst, {}).setdefault(family, []).append(key)
+        for dst, keys in plan.items():
+            counts = _move(conn, dst, keys)
+            print(f"{src} -> {dst}: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cart/conversation shard tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("init", help="create the shard files from schema.sql")
+    p.add_argument("--shards", required=True)
+    p.add_argument("--schema", default="schema.sql")
+
+    p = sub.add_parser("reshard", help="move rows to their shard after DB_SHARDS changes (backend stopped)")
+    p.add_argument("--from", dest="old", required=True, help="current shard files, comma-separated")
+    p.add_argument("--to", dest="new", required=True, help="new DB_SHARDS value")
+    p.add_argument("--schema", default="schema.sql")
+
+    p = sub.add_parser("scan", help="run a read-only query on every shard")
+    p.add_argument("--shards", required=True)
+    p.add_argument("--catalog", default=None, help="attach the catalog DB as `catalog`")
+    p.add_argument("sql")
+
+    p = sub.add_parser("where", help="shard for a cart_id / conversation_id")
+    p.add_argument("--shards", required=True)
+    p.add_argument("key")
+
+    args = parser.parse_args()
+    if args.cmd == "init":
+        init(parse_shards(args.shards), args.schema)
+    elif args.cmd == "reshard":
+        reshard(parse_shards(args.old), parse_shards(args.new), args.schema)
+    elif args.cmd == "scan":
+        for path, row in scan(parse_shards(args.shards), args.sql, catalog=args.catalog):
+            print(path, *row, sep="\t")
+    else:
+        print(HashRing(parse_shards(args.shards)).node(args.key))
+
+
+if __name__ == "__main__":
+    main()
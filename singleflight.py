@@ -0,0 +1,58 @@
+# singleflight.py
+# Request coalescing: concurrent calls with the same key share one
+# in-flight computation. The first caller (the leader) runs it, callers that
+# arrive while it runs wait for it and get the same result (or exception);
+# nothing is kept once it returns, so this only merges bursts. Put the data
+# version in the key (restaurants_search uses the catalog version) so a
+# caller never joins a computation reading older data than it would have.
+import threading
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = self.followers = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                self.followers += 1
+                leader = False
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights), "executions": self.leaders, "coalesced": self.followers,
+            # share of calls answered by someone else's execution
+            "coalescing_ratio": round(self.followers / calls, 4) if calls else 0.0,
+        }
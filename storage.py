@@ -0,0 +1,233 @@
+# storage.py
+# The tool contract shared by every storage backend: the tools, their field
+# whitelists and parameter checks, and the Storage base class. Backends:
+# SQLiteStorage (backend.py, the default), MemoryStorage (storage_memory.py)
+# and PostgresStorage (storage_pg.py); pick one with STORAGE=sqlite|memory|postgres.
+# python storage_contract.py runs the same tool script against each of them.
+import json
+import zlib
+
+TOOLS = (
+    "restaurants.search", "menus.list", "catalog.version",
+    "cart.ensure", "cart.add_item", "cart.add_items", "cart.view",
+    "cart.update_item", "cart.remove_item", "cart.clear",
+    "orders.create_mock", "orders.list_recent", "orders.reorder",
+    "conversation.create", "conversation.save_message", "conversation.append",
+    "conversation.load",
+)
+
+# read tools that answer {"not_modified": true} when params["if_none_match"]
+# is still the answer's etag (see dispatch() in backend.py)
+CONDITIONAL_TOOLS = ("restaurants.search", "menus.list", "cart.view")
+
+# ---------- Field projection ----------
+# Whitelisted output fields -> SQL expression, per read tool.
+RESTAURANT_FIELDS = {
+    "id": "id", "name": "name", "area": "area", "city": "city",
+    "cuisine_tags": "cuisine_tags", "rating": "rating",
+    "price_level": "price_level", "is_open": "is_open",
+}
+MENU_FIELDS = {
+    "id": "id", "restaurant_id": "restaurant_id", "name": "name",
+    "description": "description", "price_cents": "price_cents",
+    "is_available": "is_available", "category": "category",
+}
+CART_FIELDS = {
+    "menu_item_id": "ci.menu_item_id", "name": "mi.name", "quantity": "ci.quantity",
+    "unit_price_cents": "ci.unit_price_cents",
+    "total": "ci.quantity * ci.unit_price_cents AS total",
+}
+# what SELECT * / the original queries returned
+DEFAULT_CART_FIELDS = ("name", "quantity", "unit_price_cents", "total")
+MESSAGE_ROLES = {"user", "assistant", "system"}
+DELIVERY_FEE_CENTS = 4000  # flat, per order
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+class InvalidParams(ValueError):
+    pass
+
+
+def projection(requested, allowed: dict, default, required=()):
+    """Validate `requested` against the whitelist.
+
+    Returns (output_fields, select_fields); select_fields adds any `required`
+    columns the handler needs internally (e.g. restaurant id for menus).
+    """
+    if requested is None:
+        fields = tuple(default)
+    else:
+        if isinstance(requested, str):
+            requested = [f.strip() for f in requested.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in allowed]
+        if unknown or not requested:
+            raise InvalidFields(
+                f"unknown fields {unknown}; allowed: {sorted(allowed)}" if unknown else "fields must not be empty"
+            )
+        fields = tuple(dict.fromkeys(requested))
+    select = fields + tuple(f for f in required if f not in fields)
+    return fields, select
+
+
+def wants_columnar(p) -> bool:
+    # opt-in: "columnar" sends a `columns` header plus row arrays straight
+    # from the cursor tuples instead of one dict per row
+    fmt = p.get("format") or "rows"
+    if fmt not in ("rows", "columnar"):
+        raise InvalidParams("format must be 'rows' or 'columnar'")
+    return fmt == "columnar"
+
+
+def parse_menu_limit(p):
+    limit = p.get("menu_limit")
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise InvalidFields("menu_limit must be an integer") from None
+    if limit < 0:
+        raise InvalidFields("menu_limit must be >= 0")
+    return limit
+
+
+def search_filters(p) -> dict:
+    """restaurants.search filters; None means "any".
+
+    area/cuisine/dish match substrings case-insensitively (dish: the name of
+    an available menu item), city matches exactly, min_rating is a floor and
+    price_level a cap (1 = cheapest).
+    """
+    f = {k: p.get(k) or None for k in ("area", "cuisine", "city", "dish")}
+    try:
+        f["min_rating"] = None if p.get("min_rating") is None else float(p["min_rating"])
+        f["price_level"] = None if p.get("price_level") is None else int(p["price_level"])
+    except (TypeError, ValueError):
+        raise InvalidParams("min_rating must be a number and price_level an integer")
+    return f
+
+
+def recent_limit(p) -> int:
+    try:
+        return max(1, min(int(p.get("limit") or 5), 50))
+    except (TypeError, ValueError):
+        raise InvalidParams("limit must be an integer") from None
+
+
+def parse_items(p) -> dict:
+    """cart.add_items lines -> {menu_item_id: quantity}; the same item twice
+    in one request adds up."""
+    items = p.get("items") or []
+    if not isinstance(items, list):
+        raise InvalidParams("items must be a list")
+    wanted = {}
+    for line in items:
+        if not isinstance(line, dict):
+            raise InvalidParams("each item must be an object")
+        try:
+            menu_item_id, quantity = int(line["menu_item_id"]), int(line.get("quantity", 1))
+        except (KeyError, TypeError, ValueError):
+            raise InvalidParams(f"bad item {line!r}: needs an integer menu_item_id and quantity") from None
+        if quantity < 1:
+            raise InvalidParams(f"quantity must be >= 1 (menu_item_id {menu_item_id})")
+        wanted[menu_item_id] = wanted.get(menu_item_id, 0) + quantity
+    if not wanted:
+        raise InvalidParams("items must not be empty")
+    return wanted
+
+
+def parse_messages(p) -> list:
+    """conversation.append messages -> [(conversation_id, role, content, message_id)].
+
+    message_id is optional and chosen by the client; the backends skip a
+    message whose id is already stored, so a retried batch is not duplicated."""
+    messages = p.get("messages") or []
+    if not isinstance(messages, list):
+        raise InvalidParams("messages must be a list")
+    rows = []
+    for m in messages:
+        if not isinstance(m, dict):
+            raise InvalidParams("each message must be an object")
+        try:
+            conversation_id = int(m.get("conversation_id"))
+        except (TypeError, ValueError):
+            raise InvalidParams(f"bad conversation_id {m.get('conversation_id')!r}") from None
+        if m.get("role") not in MESSAGE_ROLES or not isinstance(m.get("content"), str):
+            raise InvalidParams(f"bad message for conversation {conversation_id}: role/content")
+        message_id = m.get("message_id")
+        if message_id is not None and not isinstance(message_id, str):
+            raise InvalidParams(f"bad message_id {message_id!r}: must be a string")
+        rows.append((conversation_id, m["role"], m["content"], message_id))
+    if not rows:
+        raise InvalidParams("messages must not be empty")
+    return rows
+
+
+def cart_result(fields, select, rows) -> dict:
+    """{"items", "subtotal_rupees"} from projected cart rows (select has total)."""
+    total_pos = select.index("total")
+    return {
+        "items": [dict(zip(fields, r)) for r in rows],
+        "subtotal_rupees": sum(r[total_pos] for r in rows) / 100
+    }
+
+
+def make_etag(params: dict, *versions) -> str:
+    """Weak validator: the versions the answer is read at plus a digest of
+    the request (filters, projection, format)."""
+    request = json.dumps({k: v for k, v in params.items() if k != "if_none_match"}, sort_keys=True, default=str)
+    return 'W/"' + ".".join(str(v) for v in versions) + f'-{zlib.crc32(request.encode()):08x}"'
+
+
+# ---------- Backends ----------
+class Storage:
+    """One method per tool, named after it ("cart.add_item" -> cart_add_item),
+    taking the params dict and returning the tool's result dict. Handlers
+    report expected failures as {"error": ...} and raise InvalidFields /
+    InvalidParams for bad input; dispatch() turns those into error codes."""
+
+    name = "base"
+
+    def call(self, tool: str, params: dict):
+        if tool not in TOOLS:
+            return {"error": {"code": "UNKNOWN_TOOL", "message": tool}}
+        return getattr(self, tool.replace(".", "_"))(params)
+
+    def etag(self, tool: str, params: dict):
+        """Validator for a CONDITIONAL_TOOLS answer, read before the answer
+        itself (so it can only be older than the data, never newer); None
+        when this store cannot tell, and the call is answered in full."""
+        return None
+
+    def pool_stats(self) -> dict:
+        """Connection pool numbers for /metrics ({} when there is no pool)."""
+        return {}
+
+    def batch(self, run, writes: bool = True):
+        """Call run(tx) inside one transaction and return its result; tx has
+        savepoint/rollback_to/release, and every call made from run shares
+        the transaction."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Savepoints:
+    """Savepoints on a DB-API connection (SQLite and PostgreSQL spell them alike)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def savepoint(self, name: str):
+        self.conn.execute(f"SAVEPOINT {name}")
+
+    def rollback_to(self, name: str):
+        self.conn.execute(f"ROLLBACK TO SAVEPOINT {name}")
+
+    def release(self, name: str):
+        self.conn.execute(f"RELEASE SAVEPOINT {name}")
+
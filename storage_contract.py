@@ -0,0 +1,270 @@
+# storage_contract.py
+# Tool contract check: runs one scripted session (catalog, cart, orders,
+# conversations, batches, error cases) through POST /invoke and
+# /invoke_batch against each storage backend, checks the key results and
+# requires every backend to answer exactly like SQLite.
+#   python storage_contract.py                   # sqlite (+ SQL search, + snapshot, + two shards) + memory (+ postgres if POSTGRES_DSN)
+#   POSTGRES_DSN=postgresql://localhost/food_test python storage_contract.py postgres
+# The postgres run TRUNCATEs every table: point it at a scratch database.
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+from fastapi.testclient import TestClient
+
+import backend
+import catalog_snapshot
+import sharding
+from catalog_index import Snapshot
+from storage_memory import MemoryStorage
+from storage_pg import PostgresStorage
+
+PG_TABLES = "restaurants, menu_items, carts, cart_items, cart_versions, orders, order_items, conversations, messages"
+
+
+def _seeded_sqlite(tmp: str) -> str:
+    path = os.path.join(tmp, "contract.db")
+    conn = sqlite3.connect(path)
+    for script in ("schema_catalog.sql", "schema.sql", "seed.sql"):
+        conn.executescript(open(script).read())
+    conn.commit()
+    conn.close()
+    return path
+
+
+def open_sqlite(tmp, index=True, snapshot=None):
+    backend.DB_PATH = _seeded_sqlite(tmp)
+    backend.DB_SHARDS, backend.RING, backend.CATALOG_DB = [], None, None
+    backend.CATALOG_INDEX = index
+    backend.CATALOG_SNAPSHOT = snapshot
+    return backend.SQLiteStorage()
+
+
+def open_sqlite_sql(tmp):
+    """SQLite with restaurants.search on SQL instead of the catalog index."""
+    return open_sqlite(tmp, index=False)
+
+
+def open_sqlite_snapshot(tmp):
+    """SQLite with the catalog index read from a mapped snapshot file."""
+    store = open_sqlite(tmp, snapshot=os.path.join(tmp, "catalog.snap"))
+    conn = sqlite3.connect(backend.DB_PATH)
+    try:
+        catalog_snapshot.write(Snapshot.load(conn), backend.CATALOG_SNAPSHOT)
+    finally:
+        conn.close()
+    return store
+
+
+def open_sqlite_sharded(tmp):
+    """SQLite with carts and conversations on two shards and the catalog in
+    DB_PATH; c1 and c2 land on different shards, so reordering c1's order
+    into c2 reads it from the other file."""
+    store = open_sqlite(tmp)
+    for i in range(100):
+        shards = [os.path.join(tmp, f"shard{i}-{n}.db") for n in range(2)]
+        ring = sharding.HashRing(shards)
+        if ring.node("c1") != ring.node("c2"):
+            break
+    sharding.init(shards)
+    backend.DB_SHARDS, backend.RING, backend.CATALOG_DB = shards, ring, backend.DB_PATH
+    return store
+
+
+def open_memory(tmp):
+    conn = sqlite3.connect(_seeded_sqlite(tmp))
+    try:
+        return MemoryStorage.from_sqlite(conn)
+    finally:
+        conn.close()
+
+
+def open_postgres(tmp):
+    store = PostgresStorage(os.environ["POSTGRES_DSN"])
+    store.execute_file("schema_pg.sql")
+    with store.pool.connection() as conn:
+        conn.execute(f"TRUNCATE {PG_TABLES} RESTART IDENTITY CASCADE")
+        conn.execute("UPDATE catalog_meta SET version = 0")
+    store.execute_file("seed.sql")
+    return store
+
+
+STORES = {
+    "sqlite": open_sqlite, "sqlite-sql": open_sqlite_sql, "sqlite-snapshot": open_sqlite_snapshot,
+    "sqlite-sharded": open_sqlite_sharded, "memory": open_memory, "postgres": open_postgres,
+}
+
+
+class Session:
+    def __init__(self, client):
+        self.client = client
+        self.log = []
+        self.failures = []
+
+    def call(self, tool, params=None):
+        res = self.client.post("/invoke", json={"tool": tool, "params": params or {}}).json()
+        self.log.append((tool, res))
+        return res
+
+    def batch(self, calls, atomic=False):
+        body = {"calls": [{"tool": t, "params": p} for t, p in calls], "atomic": atomic}
+        res = self.client.post("/invoke_batch", json=body).json()
+        self.log.append(("batch", res))
+        return res
+
+    def check(self, cond, what):
+        if not cond:
+            self.failures.append(f"step {len(self.log)}: {what}")
+
+
+def _code(res):
+    return (res.get("error") or {}).get("code") if isinstance(res, dict) else None
+
+
+def scenario(s: Session):
+    s.check(s.call("catalog.version")["version"] > 0, "catalog.version counts the seed inserts")
+    res = s.call("restaurants.search")
+    s.check(len(res["results"]) == 3 and all(r["menu"] for r in res["results"]), "search returns every open restaurant with its menu")
+    res = s.call("restaurants.search", {"area": "adyar", "fields": ["name", "rating"], "menu_fields": ["name", "price_cents"], "menu_limit": 1})
+    s.check([r["restaurant"] for r in res["results"]] == [{"name": "Sangeetha Veg", "rating": 4.2}], "area filter + projection")
+    res = s.call("restaurants.search", {"cuisine": "BIRYANI", "format": "columnar", "menu_fields": ["id"]})
+    s.check(res.get("format") == "columnar" and res["menus"] == [[[3], [4]]], "columnar search")
+    s.check(_code(s.call("restaurants.search", {"area": "adyar", "menu_limit": "three"})) == "INVALID_FIELDS", "search bad menu_limit")
+    res = s.call("restaurants.search", {"city": "chennai", "min_rating": 4.2, "fields": ["id"], "menu_limit": 0})
+    s.check([r["restaurant"]["id"] for r in res["results"]] == [1, 3], "city + min_rating")
+    res = s.call("restaurants.search", {"dish": "egg bir", "price_level": 2, "fields": ["name"], "menu_fields": ["name"]})
+    s.check([r["restaurant"]["name"] for r in res["results"]] == ["Buhari"], "dish + price_level")
+    s.check(s.call("restaurants.search", {"cuisine": "indian,sweets", "price_level": 1})["results"] == [], "price_level cap")
+    s.check(_code(s.call("restaurants.search", {"min_rating": "high"})) == "INVALID_PARAMS", "bad min_rating")
+    s.check(_code(s.call("restaurants.search", {"fields": ["nope"]})) == "INVALID_FIELDS", "unknown field")
+    s.check(_code(s.call("restaurants.search", {"format": "xml"})) == "INVALID_PARAMS", "unknown format")
+    s.call("menus.list", {"restaurant_id": 2})
+    s.call("menus.list", {"restaurant_id": 2, "fields": "id,name", "format": "columnar"})
+    tag = s.call("menus.list", {"restaurant_id": 2, "if_none_match": None}).get("etag")
+    s.check(tag and s.call("menus.list", {"restaurant_id": 2, "if_none_match": tag}).get("not_modified"), "menus.list revalidates")
+    res = s.call("restaurants.search", {"area": "adyar", "if_none_match": tag})
+    s.check("results" in res and res.get("etag") not in (None, tag), "etag covers the request")
+
+    s.call("cart.ensure", {"cart_id": "c1"})
+    s.check(s.call("cart.add_item", {"cart_id": "c1", "menu_item_id": 3, "quantity": 1})["status"] == "item_added", "add_item inserts")
+    s.check(s.call("cart.add_item", {"cart_id": "c1", "menu_item_id": 3, "quantity": 1})["status"] == "quantity_updated", "add_item adds up")
+    s.check("error" in s.call("cart.add_item", {"cart_id": "c1", "menu_item_id": 999, "quantity": 1}), "add_item unknown item")
+    res = s.call("cart.add_items", {"cart_id": "c1", "items": [{"menu_item_id": 4, "quantity": 2}, {"menu_item_id": 4}, {"menu_item_id": 1}],
+                                    "fields": ["menu_item_id", "quantity"]})
+    s.check(res.get("added") == [{"menu_item_id": 4, "quantity": 3}, {"menu_item_id": 1, "quantity": 1}], "add_items sums repeats")
+    s.check(_code(s.call("cart.add_items", {"cart_id": "c1", "items": [{"menu_item_id": 999}]})) == "NOT_FOUND", "add_items unknown item")
+    s.check(_code(s.call("cart.add_items", {"cart_id": "c1", "items": []})) == "INVALID_PARAMS", "add_items empty")
+    for bad in ([{"quantity": 1}], [{"menu_item_id": "four"}], ["4"]):
+        s.check(_code(s.call("cart.add_items", {"cart_id": "c1", "items": bad})) == "INVALID_PARAMS", f"add_items bad line {bad}")
+    s.call("cart.update_item", {"cart_id": "c1", "menu_item_id": 4, "quantity": 5})
+    s.call("cart.update_item", {"cart_id": "c1", "menu_item_id": 1, "quantity": 0})
+    res = s.call("cart.view", {"cart_id": "c1"})
+    s.check(res.get("subtotal_rupees") == 2 * 220 + 5 * 180, "cart subtotal")
+    s.call("cart.view", {"cart_id": "c1", "fields": ["menu_item_id", "quantity", "total"]})
+    tag = s.call("cart.view", {"cart_id": "c1", "if_none_match": None}).get("etag")
+    s.check(tag and s.call("cart.view", {"cart_id": "c1", "if_none_match": tag}).get("not_modified"), "cart.view revalidates")
+    s.call("cart.remove_item", {"cart_id": "c1", "menu_item_id": 3})
+    s.check("items" in s.call("cart.view", {"cart_id": "c1", "if_none_match": tag}), "cart change invalidates the etag")
+
+    order = s.call("orders.create_mock", {"cart_id": "c1", "user_id": "u1"})["order_id"]
+    s.call("cart.add_item", {"cart_id": "c1", "menu_item_id": 2, "quantity": 2})
+    s.call("orders.create_mock", {"cart_id": "c1", "user_id": "u1"})
+    s.check(_code(s.call("orders.list_recent", {"user_id": "u1", "limit": "ten"})) == "INVALID_PARAMS", "list_recent bad limit")
+    res = s.call("orders.list_recent", {"user_id": "u1"})
+    s.check(len(res["orders"]) == 2 and res["orders"][1]["items"] == "5x Egg Biryani", "list_recent newest first")
+    s.check(_code(s.call("orders.reorder", {"cart_id": "c2", "order_id": order})) == "NOT_FOUND", "reorder someone else's order")
+    res = s.call("orders.reorder", {"cart_id": "c2", "user_id": "u1", "order_id": order, "fields": ["name", "quantity"]})
+    s.check(res.get("status") == "reordered" and res["cart"]["items"] == [{"name": "Egg Biryani", "quantity": 5}], "reorder")
+    s.check(_code(s.call("orders.reorder", {"cart_id": "c2", "order_id": "missing"})) == "NOT_FOUND", "reorder unknown order")
+    # sharded: c2's order is on the other shard, most likely in the same second
+    third = s.call("orders.create_mock", {"cart_id": "c2", "user_id": "u1"})["order_id"]
+    res = s.call("orders.list_recent", {"user_id": "u1"})
+    s.check([o["order_id"] for o in res["orders"]][::2] == [third, order], "list_recent newest first across carts")
+    s.call("cart.clear", {"cart_id": "c1"})
+    s.check(s.call("cart.view", {"cart_id": "c1"})["items"] == [], "cart.clear")
+
+    conv = s.call("conversation.create", {"cart_id": "c1"})["conversation_id"]
+    s.call("conversation.save_message", {"conversation_id": conv, "role": "user", "content": "hi"})
+    s.call("conversation.append", {"messages": [
+        {"conversation_id": conv, "role": "assistant", "content": "hello"},
+        {"conversation_id": conv, "role": "user", "content": "bye"},
+    ], "wait": True})
+    retried = {"conversation_id": conv, "role": "user", "content": "bye", "message_id": "m-1"}
+    for _ in range(2):  # a retried batch is stored once
+        s.call("conversation.append", {"messages": [retried], "wait": True})
+    s.check(_code(s.call("conversation.append", {"messages": [{"conversation_id": conv, "role": "robot", "content": "x"}]})) == "INVALID_PARAMS", "bad role")
+    s.check(_code(s.call("conversation.append", {"messages": [{"role": "user", "content": "x"}]})) == "INVALID_PARAMS", "no conversation_id")
+    s.check(_code(s.call("conversation.append", {"messages": ["hi"]})) == "INVALID_PARAMS", "message not an object")
+    res = s.call("conversation.load", {"conversation_id": conv})
+    s.check(res["messages"] == [["user", "hi"], ["assistant", "hello"], ["user", "bye"], ["user", "bye"]], "messages in order, once per message_id")
+
+    res = s.batch([("cart.add_item", {"cart_id": "c3", "menu_item_id": 5, "quantity": 1}), ("cart.view", {"cart_id": "c3"})])
+    s.check(res.get("committed") and res["results"][1]["subtotal_rupees"] == 160, "batch sees its own writes")
+    res = s.batch([("cart.add_item", {"cart_id": "c3", "menu_item_id": 5, "quantity": 1}),
+                   ("cart.add_items", {"cart_id": "c3", "items": [{"menu_item_id": 999}]})], atomic=True)
+    s.check(res.get("committed") is False and res.get("failed_index") == 1, "atomic batch reports the failure")
+    s.check(s.call("cart.view", {"cart_id": "c3"})["subtotal_rupees"] == 160, "atomic batch rolled back")
+    s.check(_code(s.call("nope.tool")) == "UNKNOWN_TOOL", "unknown tool")
+
+
+def _normalized(log):
+    """Order ids (and sharded conversation ids) are random, placed_at is a
+    clock and etags are per backend: replace them."""
+    ids = {}
+
+    def walk(v, key=None):
+        if isinstance(v, dict):
+            return {k: walk(x, k) for k, x in v.items()}
+        if isinstance(v, list):
+            return [walk(x) for x in v]
+        if key in ("order_id", "conversation_id"):
+            return ids.setdefault(str(v), f"<{key[:-3]} {len(ids)}>")
+        if key == "placed_at":
+            return "<placed_at>"
+        if key == "etag":  # versions differ per backend
+            return "<etag>"
+        if key == "message":  # "no items for order <id>", "bad message for conversation <id>: ..."
+            return re.sub(r"\b(order|conversation) ([\w-]+)", lambda m: f"{m[1]} {ids.get(m[2], m[2])}", v)
+        return v
+    return [(tool, walk(res)) for tool, res in log]
+
+
+def run(kind: str, tmp: str) -> Session:
+    store = STORES[kind](tmp)
+    backend.use_storage(store)
+    try:
+        s = Session(TestClient(backend.app))
+        scenario(s)
+        return s
+    finally:
+        store.close()
+
+
+def main():
+    kinds = sys.argv[1:] or ["sqlite", "sqlite-sql", "sqlite-snapshot", "sqlite-sharded", "memory"] + (["postgres"] if os.getenv("POSTGRES_DSN") else [])
+    backend.print = lambda *a, **k: None
+    backend.ADMISSION = False  # one client firing the whole script back to back
+    tmp = tempfile.mkdtemp()
+    reference = _normalized(run("sqlite", tmp).log)
+    ok = True
+    for kind in kinds:
+        if kind == "postgres" and not os.getenv("POSTGRES_DSN"):
+            print("postgres: skipped, set POSTGRES_DSN to a scratch database")
+            continue
+        s = run(kind, tempfile.mkdtemp(dir=tmp))
+        log = _normalized(s.log)
+        for i, (want, got) in enumerate(zip(reference, log)):
+            if want != got:
+                s.failures.append(f"step {i + 1} ({want[0]}) differs from sqlite:\n  sqlite: {want[1]}\n  {kind}: {got[1]}")
+                break
+        print(f"{kind:>15}: {len(log)} calls, " + ("ok" if not s.failures else f"{len(s.failures)} failure(s)"))
+        for f in s.failures:
+            print("   ", f)
+        ok = ok and not s.failures
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# storage_memory.py
+# Everything in process: the catalog is loaded once (from a SQLite catalog),
+# carts/orders/conversations live in dicts behind one lock. For tests and
+# benchmarks; results match the SQLite handlers row for row.
+import copy
+import threading
+import time
+import uuid
+import zlib
+
+from storage import (
+    CART_FIELDS, DEFAULT_CART_FIELDS, DELIVERY_FEE_CENTS, MENU_FIELDS, MESSAGE_ROLES,
+    RESTAURANT_FIELDS, Storage, cart_result, parse_items, parse_menu_limit, parse_messages,
+    make_etag, projection, recent_limit, search_filters, wants_columnar,
+)
+
+
+def _like(value, needle) -> bool:
+    # LOWER(col) LIKE '%' || LOWER(:needle) || '%'; NULL never matches
+    return value is not None and needle.lower() in value.lower()
+
+
+class SnapshotSavepoints:
+    """Savepoints for in-memory state: a deep copy per savepoint."""
+
+    def __init__(self, store):
+        self.store = store
+        self._marks = []
+
+    def savepoint(self, name: str):
+        self._marks.append((name, copy.deepcopy(self.store.state)))
+
+    def rollback_to(self, name: str):
+        i = max(i for i, (n, _) in enumerate(self._marks) if n == name)
+        self.store.state = copy.deepcopy(self._marks[i][1])
+        del self._marks[i + 1:]
+
+    def release(self, name: str):
+        i = max(i for i, (n, _) in enumerate(self._marks) if n == name)
+        del self._marks[i:]
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self, restaurants=(), menu_items=(), version: int = 0):
+        # catalog: read-only after load; rows are dicts keyed like the tables
+        self.restaurants = sorted(restaurants, key=lambda r: r["id"])
+        self.menu_items = {m["id"]: m for m in sorted(menu_items, key=lambda m: m["id"])}
+        self.menus = {}
+        for m in self.menu_items.values():
+            self.menus.setdefault(m["restaurant_id"], []).append(m)
+        self.version = version
+        self.state = self._empty_state()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _empty_state() -> dict:
+        return {
+            "carts": {},          # cart_id -> {menu_item_id: [quantity, unit_price_cents]}
+            "orders": {},         # order_id -> order dict (incl. "lines")
+            "by_user": {},        # user_id -> [order_id, ...] in placing order
+            "conversations": {},  # conversation_id -> cart_id
+            "messages": {},       # conversation_id -> [(role, content), ...]
+            "message_ids": set(), # conversation.append message_ids already stored
+            "next_conversation": 1,
+        }
+
+    @classmethod
+    def from_sqlite(cls, conn):
+        """Load the catalog from a SQLite connection (catalog.db or food1.db)."""
+        cur = conn.execute(f"SELECT {', '.join(RESTAURANT_FIELDS)} FROM restaurants")
+        restaurants = [dict(zip(RESTAURANT_FIELDS, r)) for r in cur]
+        cur = conn.execute(f"SELECT {', '.join(MENU_FIELDS)} FROM menu_items")
+        menu_items = [dict(zip(MENU_FIELDS, r)) for r in cur]
+        row = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+        return cls(restaurants, menu_items, row[0] if row else 0)
+
+    def call(self, tool: str, params: dict):
+        with self._lock:
+            return super().call(tool, params)
+
+    def etag(self, tool: str, params: dict):
+        # the catalog never changes after load; a cart is tagged by its contents
+        if tool != "cart.view":
+            return make_etag(params, self.version)
+        with self._lock:
+            lines = sorted(self.state["carts"].get(params.get("cart_id"), {}).items())
+        return make_etag(params, f"{zlib.crc32(repr(lines).encode()):08x}", self.version)
+
+    def batch(self, run, writes: bool = True):
+        with self._lock:
+            before = copy.deepcopy(self.state)
+            try:
+                return run(SnapshotSavepoints(self))
+            except Exception:
+                self.state = before
+                raise
+
+    # ---------- catalog ----------
+    def _menu(self, restaurant_id, limit=None):
+        items = [m for m in self.menus.get(restaurant_id, ()) if m["is_available"] == 1]
+        return items if limit is None else items[:limit]
+
+    def restaurants_search(self, p):
+        fields, select = projection(p.get("fields"), RESTAURANT_FIELDS, RESTAURANT_FIELDS, required=("id",))
+        menu_fields, menu_select = projection(p.get("menu_fields"), MENU_FIELDS, MENU_FIELDS)
+        menu_limit = parse_menu_limit(p)
+        columnar = wants_columnar(p)
+        f = search_filters(p)
+        matches = [
+            r for r in self.restaurants
+            if r["is_open"] == 1
+            and (f["area"] is None or _like(r["area"], f["area"]))
+            and (f["cuisine"] is None or _like(r["cuisine_tags"], f["cuisine"]))
+            and (f["city"] is None or (r["city"] is not None and r["city"].lower() == f["city"].lower()))
+            and (f["min_rating"] is None or (r["rating"] is not None and r["rating"] >= f["min_rating"]))
+            and (f["price_level"] is None or (r["price_level"] is not None and r["price_level"] <= f["price_level"]))
+            and (f["dish"] is None or any(_like(m["name"], f["dish"]) for m in self._menu(r["id"])))
+        ]
+        if columnar:
+            return {
+                "format": "columnar",
+                "restaurant_columns": select,
+                "menu_columns": menu_select,
+                "restaurants": [tuple(r[f] for f in select) for r in matches],
+                "menus": [
+                    [tuple(m[f] for f in menu_select) for m in self._menu(r["id"], menu_limit)]
+                    for r in matches
+                ],
+            }
+        return {"results": [
+            {
+                "restaurant": {f: r[f] for f in fields},
+                "menu": [{f: m[f] for f in menu_select} for m in self._menu(r["id"], menu_limit)],
+            }
+            for r in matches
+        ]}
+
+    def menus_list(self, p):
+        fields, select = projection(p.get("fields"), MENU_FIELDS, MENU_FIELDS)
+        items = self._menu(p["restaurant_id"])
+        if wants_columnar(p):
+            return {"format": "columnar", "columns": select, "rows": [tuple(m[f] for f in select) for m in items]}
+        return {"menu": [{f: m[f] for f in select} for m in items]}
+
+    def catalog_version(self, p):
+        return {"version": self.version}
+
+    # ---------- cart ----------
+    def _cart_rows(self, cart_id, select):
+        # the SQL join drops lines whose menu item is gone
+        rows = []
+        for menu_item_id, (quantity, unit_price) in self.state["carts"].get(cart_id, {}).items():
+            item = self.menu_items.get(menu_item_id)
+            if item is None:
+                continue
+            values = {
+                "menu_item_id": menu_item_id, "name": item["name"], "quantity": quantity,
+                "unit_price_cents": unit_price, "total": quantity * unit_price,
+            }
+            rows.append(tuple(values[f] for f in select))
+        return rows
+
+    def _cart(self, cart_id, fields=None):
+        fields, select = projection(fields, CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+        return cart_result(fields, select, self._cart_rows(cart_id, select))
+
+    @staticmethod
+    def _check_quantity(quantity):
+        if quantity <= 0:
+            raise ValueError("CHECK constraint failed: quantity > 0")
+
+    def cart_ensure(self, p):
+        self.state["carts"].setdefault(p["cart_id"], {})
+        return {"cart_id": p["cart_id"], "status": "ready"}
+
+    def cart_add_item(self, p):
+        cart_id, menu_item_id, quantity = p["cart_id"], p["menu_item_id"], p["quantity"]
+        item = self.menu_items.get(menu_item_id)
+        if not item:
+            return {"error": "Menu item not found"}
+        lines = self.state["carts"].setdefault(cart_id, {})
+        if menu_item_id in lines:
+            self._check_quantity(lines[menu_item_id][0] + quantity)
+            lines[menu_item_id][0] += quantity
+            action = "quantity_updated"
+        else:
+            self._check_quantity(quantity)
+            lines[menu_item_id] = [quantity, item["price_cents"]]
+            action = "item_added"
+        return {"status": action, "cart": self._cart(cart_id)}
+
+    def cart_add_items(self, p):
+        fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+        cart_id = p["cart_id"]
+        wanted = parse_items(p)
+        missing = [i for i in wanted if i not in self.menu_items]
+        if missing:
+            return {"error": {"code": "NOT_FOUND", "message": f"menu items not found: {missing}"}}
+        unavailable = [i for i in wanted if self.menu_items[i]["is_available"] != 1]
+        if unavailable:
+            return {"error": {"code": "NOT_FOUND", "message": f"menu items not available: {unavailable}"}}
+        lines = self.state["carts"].setdefault(cart_id, {})
+        for menu_item_id, quantity in wanted.items():
+            if menu_item_id in lines:
+                lines[menu_item_id][0] += quantity
+            else:
+                lines[menu_item_id] = [quantity, self.menu_items[menu_item_id]["price_cents"]]
+        return {
+            "status": "items_added",
+            "added": [{"menu_item_id": i, "quantity": q} for i, q in wanted.items()],
+            "cart": cart_result(fields, select, self._cart_rows(cart_id, select)),
+        }
+
+    def cart_view(self, p):
+        return self._cart(p["cart_id"], p.get("fields"))
+
+    def cart_update_item(self, p):
+        lines = self.state["carts"].get(p["cart_id"], {})
+        if p["quantity"] == 0:
+            lines.pop(p["menu_item_id"], None)
+            return {"status": "item_removed"}
+        if p["menu_item_id"] in lines:
+            self._check_quantity(p["quantity"])
+            lines[p["menu_item_id"]][0] = p["quantity"]
+        return {"status": "item_updated", "menu_item_id": p["menu_item_id"], "quantity": p["quantity"]}
+
+    def cart_remove_item(self, p):
+        self.state["carts"].get(p["cart_id"], {}).pop(p["menu_item_id"], None)
+        return {"status": "item_removed", "menu_item_id": p["menu_item_id"]}
+
+    def cart_clear(self, p):
+        self.state["carts"].get(p["cart_id"], {}).clear()
+        return {"status": "cart_cleared"}
+
+    # ---------- orders ----------
+    def orders_create_mock(self, p):
+        cart_id = p["cart_id"]
+        cart = self.state["carts"].get(cart_id, {})
+        subtotal = sum(q * price for q, price in cart.values())
+        total = subtotal + DELIVERY_FEE_CENTS
+        order_id = str(uuid.uuid4())
+        user_id = p.get("user_id") or cart_id
+        self.state["orders"][order_id] = {
+            "id": order_id, "cart_id": cart_id, "user_id": user_id, "status": "PLACED",
+            "subtotal_cents": subtotal, "delivery_fee_cents": DELIVERY_FEE_CENTS, "total_cents": total,
+            "placed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            "lines": [
+                {"menu_item_id": i, "menu_item_name": self.menu_items[i]["name"], "unit_price_cents": price, "quantity": q}
+                for i, (q, price) in cart.items() if i in self.menu_items
+            ],
+        }
+        self.state["by_user"].setdefault(user_id, []).append(order_id)
+        return {"order_id": order_id, "total_rupees": total / 100}
+
+    def orders_list_recent(self, p):
+        ids = self.state["by_user"].get(p["user_id"], [])
+        # newest first; same-second orders newest-placed first, like the index scan
+        orders = sorted(
+            (self.state["orders"][i] for i in reversed(ids)), key=lambda o: o["placed_at"], reverse=True
+        )[:recent_limit(p)]
+        return {"orders": [
+            {
+                "order_id": o["id"],
+                "status": o["status"],
+                "placed_at": o["placed_at"],
+                "total_rupees": o["total_cents"] / 100,
+                "items": ", ".join(f"{l['quantity']}x {l['menu_item_name']}" for l in o["lines"]),
+            }
+            for o in orders
+        ]}
+
+    def orders_reorder(self, p):
+        fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+        order_id, cart_id = p["order_id"], p["cart_id"]
+        order = self.state["orders"].get(order_id)
+        if not order or not order["lines"] or order["user_id"] != (p.get("user_id") or cart_id):
+            return {"error": {"code": "NOT_FOUND", "message": f"no items for order {order_id}"}}
+        unavailable, repriced = [], []
+        lines = self.state["carts"].setdefault(cart_id, {})
+        for l in order["lines"]:
+            item = self.menu_items.get(l["menu_item_id"])
+            if not item or item["is_available"] != 1:
+                unavailable.append({"menu_item_id": l["menu_item_id"], "name": l["menu_item_name"], "quantity": l["quantity"]})
+                continue
+            if item["price_cents"] != l["unit_price_cents"]:
+                repriced.append({
+                    "name": l["menu_item_name"],
+                    "was_rupees": l["unit_price_cents"] / 100,
+                    "now_rupees": item["price_cents"] / 100,
+                })
+            current = lines.get(item["id"])
+            quantity = l["quantity"] + (current[0] if current else 0)
+            lines[item["id"]] = [quantity, item["price_cents"]]
+        return {
+            "status": "reordered",
+            "order_id": order_id,
+            "unavailable": unavailable,
+            "repriced": repriced,
+            "cart": cart_result(fields, select, self._cart_rows(cart_id, select)),
+        }
+
+    # ---------- conversations ----------
+    def conversation_create(self, p):
+        conversation_id = p.get("conversation_id")
+        if conversation_id is None:
+            conversation_id = self.state["next_conversation"]
+        self.state["next_conversation"] = max(self.state["next_conversation"], conversation_id + 1)
+        self.state["conversations"][conversation_id] = p["cart_id"]
+        return {"conversation_id": conversation_id}
+
+    def conversation_save_message(self, p):
+        if p["role"] not in MESSAGE_ROLES:
+            raise ValueError("CHECK constraint failed: role")
+        self.state["messages"].setdefault(int(p["conversation_id"]), []).append((p["role"], p["content"]))
+        return {"status": "saved"}
+
+    def conversation_append(self, p):
+        rows = parse_messages(p)
+        seen = self.state["message_ids"]
+        for conversation_id, role, content, message_id in rows:
+            if message_id is not None:
+                if message_id in seen:
+                    continue
+                seen.add(message_id)
+            self.state["messages"].setdefault(conversation_id, []).append((role, content))
+        return {"status": "saved", "count": len(rows)}
+
+    def conversation_load(self, p):
+        return {"messages": list(self.state["messages"].get(int(p["conversation_id"]), []))}
@@ -0,0 +1,375 @@
+# storage_pg.py
+# PostgreSQL storage (STORAGE=postgres, POSTGRES_DSN) over a psycopg 3
+# connection pool. Same tables as the SQLite files (schema_pg.sql) and the
+# same results; every tool call borrows one pooled connection and commits
+# when it returns, a batch keeps one connection for all its calls.
+import contextlib
+import functools
+import threading
+
+from storage import (
+    CART_FIELDS, DEFAULT_CART_FIELDS, DELIVERY_FEE_CENTS, MENU_FIELDS, RESTAURANT_FIELDS,
+    Savepoints, Storage, cart_result, make_etag, parse_items, parse_menu_limit, parse_messages,
+    projection, recent_limit, search_filters, wants_columnar,
+)
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+except ImportError:  # STORAGE=postgres unavailable
+    psycopg = None
+
+
+@functools.lru_cache(maxsize=256)
+def _search_sql(select: tuple) -> str:
+    cols = ", ".join(RESTAURANT_FIELDS[f] for f in select)
+    return f"""
+        SELECT {cols}
+        FROM restaurants
+        WHERE is_open = 1
+        AND (%(area)s::text IS NULL OR area ILIKE '%%' || %(area)s || '%%')
+        AND (%(cuisine)s::text IS NULL OR cuisine_tags ILIKE '%%' || %(cuisine)s || '%%')
+        AND (%(city)s::text IS NULL OR LOWER(city) = LOWER(%(city)s))
+        AND (%(min_rating)s::float8 IS NULL OR rating >= %(min_rating)s)
+        AND (%(price_level)s::int IS NULL OR price_level <= %(price_level)s)
+        AND (%(dish)s::text IS NULL OR EXISTS (
+            SELECT 1 FROM menu_items mi
+            WHERE mi.restaurant_id = restaurants.id AND mi.is_available = 1
+            AND mi.name ILIKE '%%' || %(dish)s || '%%'))
+        ORDER BY id
+    """
+
+
+@functools.lru_cache(maxsize=256)
+def _menus_sql(select: tuple) -> str:
+    # all menus of a page of restaurants in one round trip
+    cols = ", ".join(MENU_FIELDS[f] for f in select)
+    return f"""
+        SELECT restaurant_id, {cols}
+        FROM menu_items
+        WHERE restaurant_id = ANY(%s) AND is_available = 1
+        ORDER BY restaurant_id, id
+    """
+
+
+@functools.lru_cache(maxsize=64)
+def _cart_sql(select: tuple) -> str:
+    cols = ", ".join(CART_FIELDS[f] for f in select)
+    return f"""
+        SELECT {cols}
+        FROM cart_items ci
+        JOIN menu_items mi ON mi.id = ci.menu_item_id
+        WHERE ci.cart_id = %s
+        ORDER BY ci.id
+    """
+
+
+class PostgresStorage(Storage):
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        if psycopg is None:
+            raise RuntimeError("STORAGE=postgres needs psycopg 3 and psycopg_pool (pip install 'psycopg[binary,pool]')")
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True)
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            # inside batch(): part of its transaction
+            yield conn
+            return
+        with self.pool.connection() as conn:
+            yield conn
+
+    def pool_stats(self) -> dict:
+        return self.pool.get_stats()
+
+    def etag(self, tool: str, params: dict):
+        with self._conn() as conn:
+            row = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+            versions = [row[0] if row else 0]
+            if tool == "cart.view":
+                row = conn.execute("SELECT version FROM cart_versions WHERE cart_id = %s", (params.get("cart_id"),)).fetchone()
+                versions.insert(0, row[0] if row else 0)
+        return make_etag(params, *versions)
+
+    def batch(self, run, writes: bool = True):
+        # the pool commits on return and rolls back if run raises
+        with self.pool.connection() as conn:
+            self._local.conn = conn
+            try:
+                return run(Savepoints(conn))
+            finally:
+                self._local.conn = None
+
+    def execute_file(self, path: str):
+        """Run a SQL script (schema_pg.sql, seed.sql)."""
+        with self.pool.connection() as conn:
+            conn.execute(open(path).read())
+
+    def close(self):
+        self.pool.close()
+
+    # ---------- catalog ----------
+    def _menus(self, conn, restaurant_ids, select, limit):
+        menus = {i: [] for i in restaurant_ids}
+        for row in conn.execute(_menus_sql(select), (list(restaurant_ids),)):
+            menu = menus[row[0]]
+            if limit is None or len(menu) < limit:
+                menu.append(row[1:])
+        return menus
+
+    def restaurants_search(self, p):
+        fields, select = projection(p.get("fields"), RESTAURANT_FIELDS, RESTAURANT_FIELDS, required=("id",))
+        menu_fields, menu_select = projection(p.get("menu_fields"), MENU_FIELDS, MENU_FIELDS)
+        menu_limit = parse_menu_limit(p)
+        columnar = wants_columnar(p)
+        with self._conn() as conn:
+            restaurants = conn.execute(
+                _search_sql(select), search_filters(p)
+            ).fetchall()
+            id_pos = select.index("id")
+            menus = self._menus(conn, [r[id_pos] for r in restaurants], menu_select, menu_limit)
+        if columnar:
+            return {
+                "format": "columnar",
+                "restaurant_columns": select,
+                "menu_columns": menu_select,
+                "restaurants": restaurants,
+                "menus": [menus[r[id_pos]] for r in restaurants],
+            }
+        return {"results": [
+            {
+                "restaurant": {f: v for f, v in zip(select, r) if f in fields},
+                "menu": [dict(zip(menu_select, m)) for m in menus[r[id_pos]]],
+            }
+            for r in restaurants
+        ]}
+
+    def menus_list(self, p):
+        fields, select = projection(p.get("fields"), MENU_FIELDS, MENU_FIELDS)
+        columnar = wants_columnar(p)
+        with self._conn() as conn:
+            rows = self._menus(conn, [int(p["restaurant_id"])], select, None)[int(p["restaurant_id"])]
+        if columnar:
+            return {"format": "columnar", "columns": select, "rows": rows}
+        return {"menu": [dict(zip(select, r)) for r in rows]}
+
+    def catalog_version(self, p):
+        with self._conn() as conn:
+            row = conn.execute("SELECT version FROM catalog_meta WHERE id = 1").fetchone()
+        return {"version": row[0] if row else 0}
+
+    # ---------- cart ----------
+    @staticmethod
+    def _cart(conn, cart_id, fields=None):
+        fields, select = projection(fields, CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+        return cart_result(fields, select, conn.execute(_cart_sql(select), (cart_id,)).fetchall())
+
+    def cart_ensure(self, p):
+        with self._conn() as conn:
+            conn.execute("INSERT INTO carts(id) VALUES (%s) ON CONFLICT DO NOTHING", (p["cart_id"],))
+        return {"cart_id": p["cart_id"], "status": "ready"}
+
+    def cart_add_item(self, p):
+        cart_id = p["cart_id"]
+        with self._conn() as conn:
+            item = conn.execute("SELECT price_cents FROM menu_items WHERE id = %s", (p["menu_item_id"],)).fetchone()
+            if not item:
+                return {"error": "Menu item not found"}
+            # xmax = 0 only for a freshly inserted row
+            inserted = conn.execute("""
+                INSERT INTO cart_items(cart_id, menu_item_id, quantity, unit_price_cents)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (cart_id, menu_item_id) DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity
+                RETURNING xmax = 0
+            """, (cart_id, p["menu_item_id"], p["quantity"], item[0])).fetchone()[0]
+            return {"status": "item_added" if inserted else "quantity_updated", "cart": self._cart(conn, cart_id)}
+
+    def cart_add_items(self, p):
+        fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+        cart_id = p["cart_id"]
+        wanted = parse_items(p)
+        with self._conn() as conn:
+            found = {r[0]: r for r in conn.execute(
+                "SELECT id, price_cents, is_available FROM menu_items WHERE id = ANY(%s)", (list(wanted),)
+            ).fetchall()}
+            missing = [i for i in wanted if i not in found]
+            if missing:
+                return {"error": {"code": "NOT_FOUND", "message": f"menu items not found: {missing}"}}
+            unavailable = [i for i in wanted if found[i][2] != 1]
+            if unavailable:
+                return {"error": {"code": "NOT_FOUND", "message": f"menu items not available: {unavailable}"}}
+            prices = {i: r[1] for i, r in found.items()}
+            conn.cursor().executemany("""
+                INSERT INTO cart_items(cart_id, menu_item_id, quantity, unit_price_cents)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (cart_id, menu_item_id) DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity
+            """, [(cart_id, i, q, prices[i]) for i, q in wanted.items()])
+            rows = conn.execute(_cart_sql(select), (cart_id,)).fetchall()
+        return {
+            "status": "items_added",
+            "added": [{"menu_item_id": i, "quantity": q} for i, q in wanted.items()],
+            "cart": cart_result(fields, select, rows),
+        }
+
+    def cart_view(self, p):
+        with self._conn() as conn:
+            return self._cart(conn, p["cart_id"], p.get("fields"))
+
+    def cart_update_item(self, p):
+        with self._conn() as conn:
+            if p["quantity"] == 0:
+                conn.execute(
+                    "DELETE FROM cart_items WHERE cart_id = %s AND menu_item_id = %s", (p["cart_id"], p["menu_item_id"])
+                )
+                return {"status": "item_removed"}
+            conn.execute(
+                "UPDATE cart_items SET quantity = %s WHERE cart_id = %s AND menu_item_id = %s",
+                (p["quantity"], p["cart_id"], p["menu_item_id"])
+            )
+        return {"status": "item_updated", "menu_item_id": p["menu_item_id"], "quantity": p["quantity"]}
+
+    def cart_remove_item(self, p):
+        with self._conn() as conn:
+            conn.execute(
+                "DELETE FROM cart_items WHERE cart_id = %s AND menu_item_id = %s", (p["cart_id"], p["menu_item_id"])
+            )
+        return {"status": "item_removed", "menu_item_id": p["menu_item_id"]}
+
+    def cart_clear(self, p):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cart_items WHERE cart_id = %s", (p["cart_id"],))
+        return {"status": "cart_cleared"}
+
+    # ---------- orders ----------
+    def orders_create_mock(self, p):
+        cart_id = p["cart_id"]
+        user_id = p.get("user_id") or cart_id
+        with self._conn() as conn:
+            subtotal = conn.execute(
+                "SELECT COALESCE(SUM(quantity * unit_price_cents), 0) FROM cart_items WHERE cart_id = %s", (cart_id,)
+            ).fetchone()[0]
+            total = subtotal + DELIVERY_FEE_CENTS
+            order_id = conn.execute("""
+                INSERT INTO orders(id, cart_id, user_id, status, subtotal_cents, delivery_fee_cents, total_cents)
+                VALUES (gen_random_uuid()::text, %s, %s, 'PLACED', %s, %s, %s)
+                RETURNING id
+            """, (cart_id, user_id, subtotal, DELIVERY_FEE_CENTS, total)).fetchone()[0]
+            conn.execute("""
+                INSERT INTO order_items(order_id, menu_item_id, menu_item_name, unit_price_cents, quantity)
+                SELECT %s, ci.menu_item_id, mi.name, ci.unit_price_cents, ci.quantity
+                FROM cart_items ci
+                JOIN menu_items mi ON mi.id = ci.menu_item_id
+                WHERE ci.cart_id = %s
+                ORDER BY ci.id
+            """, (order_id, cart_id))
+        return {"order_id": order_id, "total_rupees": total / 100}
+
+    def orders_list_recent(self, p):
+        with self._conn() as conn:
+            orders = conn.execute("""
+                SELECT id, status, total_cents, placed_at
+                FROM orders
+                WHERE user_id = %s
+                ORDER BY placed_at DESC, seq DESC
+                LIMIT %s
+            """, (p["user_id"], recent_limit(p))).fetchall()
+            items = {}
+            if orders:
+                items = dict(conn.execute("""
+                    SELECT order_id, string_agg(quantity || 'x ' || menu_item_name, ', ' ORDER BY id)
+                    FROM order_items
+                    WHERE order_id = ANY(%s)
+                    GROUP BY order_id
+                """, ([o[0] for o in orders],)).fetchall())
+        return {"orders": [
+            {
+                "order_id": order_id,
+                "status": status,
+                "placed_at": placed_at,
+                "total_rupees": total_cents / 100,
+                "items": items.get(order_id, ""),
+            }
+            for order_id, status, total_cents, placed_at in orders
+        ]}
+
+    def orders_reorder(self, p):
+        fields, select = projection(p.get("fields"), CART_FIELDS, DEFAULT_CART_FIELDS, required=("total",))
+        order_id, cart_id = p["order_id"], p["cart_id"]
+        user_id = p.get("user_id") or cart_id
+        with self._conn() as conn:
+            lines = conn.execute("""
+                SELECT oi.menu_item_id, oi.menu_item_name, oi.quantity, oi.unit_price_cents,
+                       mi.price_cents, COALESCE(mi.is_available, 0) AS available
+                FROM order_items oi
+                JOIN orders o ON o.id = oi.order_id
+                LEFT JOIN menu_items mi ON mi.id = oi.menu_item_id
+                WHERE oi.order_id = %s AND o.user_id = %s
+                ORDER BY oi.id
+            """, (order_id, user_id)).fetchall()
+            if not lines:
+                return {"error": {"code": "NOT_FOUND", "message": f"no items for order {order_id}"}}
+            conn.execute("INSERT INTO carts(id) VALUES (%s) ON CONFLICT DO NOTHING", (cart_id,))
+            conn.execute("""
+                INSERT INTO cart_items(cart_id, menu_item_id, quantity, unit_price_cents)
+                SELECT %s, mi.id, oi.quantity, mi.price_cents
+                FROM order_items oi
+                JOIN menu_items mi ON mi.id = oi.menu_item_id
+                WHERE oi.order_id = %s AND mi.is_available = 1
+                ORDER BY oi.id
+                ON CONFLICT (cart_id, menu_item_id) DO UPDATE SET
+                    quantity = cart_items.quantity + EXCLUDED.quantity,
+                    unit_price_cents = EXCLUDED.unit_price_cents
+            """, (cart_id, order_id))
+            rows = conn.execute(_cart_sql(select), (cart_id,)).fetchall()
+        return {
+            "status": "reordered",
+            "order_id": order_id,
+            "unavailable": [
+                {"menu_item_id": menu_item_id, "name": name, "quantity": quantity}
+                for menu_item_id, name, quantity, _, _, available in lines if not available
+            ],
+            "repriced": [
+                {"name": name, "was_rupees": was / 100, "now_rupees": now / 100}
+                for _, name, _, was, now, available in lines if available and now != was
+            ],
+            "cart": cart_result(fields, select, rows),
+        }
+
+    # ---------- conversations ----------
+    def conversation_create(self, p):
+        with self._conn() as conn:
+            if p.get("conversation_id") is not None:
+                conn.execute(
+                    "INSERT INTO conversations (id, cart_id) VALUES (%s, %s)", (p["conversation_id"], p["cart_id"])
+                )
+                return {"conversation_id": p["conversation_id"]}
+            row = conn.execute("INSERT INTO conversations (cart_id) VALUES (%s) RETURNING id", (p["cart_id"],)).fetchone()
+        return {"conversation_id": row[0]}
+
+    def conversation_save_message(self, p):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (%s, %s, %s)",
+                (p["conversation_id"], p["role"], p["content"])
+            )
+        return {"status": "saved"}
+
+    def conversation_append(self, p):
+        rows = parse_messages(p)
+        with self._conn() as conn:
+            conn.cursor().executemany(
+                "INSERT INTO messages (conversation_id, role, content, message_id) VALUES (%s, %s, %s, %s)"
+                " ON CONFLICT (message_id) DO NOTHING", rows
+            )
+        return {"status": "saved", "count": len(rows)}
+
+    def conversation_load(self, p):
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = %s ORDER BY id", (p["conversation_id"],)
+            ).fetchall()
+        return {"messages": rows}
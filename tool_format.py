@@ -0,0 +1,161 @@
+# tool_format.py
+# Compact, LLM-oriented rendering of tool results. The model only needs ids,
+# names, rupee prices and ratings; the raw backend JSON also carries
+# is_open/is_available/restaurant_id/descriptions/price_cents and repeats
+# every key on every row, and all of it is re-sent each turn via history.
+import json
+
+from columnar import is_columnar
+
+# rough budget per tool output (tokens ~= chars / 4; no tokenizer dependency)
+DEFAULT_TOKEN_CAP = 800
+TOKEN_CAPS = {
+    "restaurants.search": 700,
+    "menus.list": 500,
+    "cart.view": 400,
+    "cart.add_item": 400,
+    "cart.add_items": 400,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _rupees(cents) -> str:
+    rupees = (cents or 0) / 100
+    return f"{rupees:.0f}" if rupees == int(rupees) else f"{rupees:.2f}"
+
+
+def _capped(tool: str, header: str, blocks, unit: str, total: int = None) -> str:
+    """Join header + blocks until the tool's token cap, then mark the cut.
+    `blocks` may be a generator (pass `total`) so cut blocks are never built.
+    A first block over the cap on its own (one restaurant with a long menu)
+    is cut line by line, keeping at least its first line."""
+    cap = TOKEN_CAPS.get(tool, DEFAULT_TOKEN_CAP)
+    total = len(blocks) if total is None else total
+    lines = [header]
+    used = estimate_tokens(header)
+    for i, block in enumerate(blocks):
+        cost = estimate_tokens(block) + 1
+        if used + cost <= cap:
+            lines.append(block)
+            used += cost
+            continue
+        more = f"{total - i} more {unit}"
+        if i == 0:
+            rows = block.split("\n")
+            kept = 1
+            used += estimate_tokens(rows[0]) + 1
+            while kept < len(rows) and used + estimate_tokens(rows[kept]) + 1 <= cap:
+                used += estimate_tokens(rows[kept]) + 1
+                kept += 1
+            lines += rows[:kept]
+            more = f"{len(rows) - kept} more line(s)" + (f" and {total - 1} more {unit}" if total > 1 else "")
+        lines.append(f"... truncated: {more} not shown (narrow the request)")
+        break
+    return "\n".join(lines)
+
+
+def _menu_line(m) -> str:
+    return f"- {m['id']}|{m['name']}|{_rupees(m.get('price_cents'))}"
+
+
+def _picker(columns, names):
+    """Row tuple -> values of `names` (None for absent columns), no dict built."""
+    pos = [columns.index(n) if n in columns else None for n in names]
+    return lambda row: [row[i] if i is not None else None for i in pos]
+
+
+def _search_header(n: int) -> str:
+    return (
+        f"[restaurants.search] {n} restaurant(s). "
+        "R restaurant_id|name|area|rating|cuisines, then - menu_item_id|dish|price_rupees"
+    )
+
+
+def render_search(res: dict) -> str:
+    if is_columnar(res):
+        return render_search_columnar(res)
+    results = res.get("results", [])
+    blocks = []
+    for entry in results:
+        r, menu = entry.get("restaurant", {}), entry.get("menu", [])
+        lines = [f"R {r.get('id')}|{r.get('name')}|{r.get('area')}|{r.get('rating')}|{r.get('cuisine_tags')}"]
+        lines += [_menu_line(m) for m in menu]
+        blocks.append("\n".join(lines))
+    return _capped("restaurants.search", _search_header(len(results)), blocks, "restaurants")
+
+
+def render_search_columnar(res: dict) -> str:
+    restaurant = _picker(res["restaurant_columns"], ("id", "name", "area", "rating", "cuisine_tags"))
+    dish = _picker(res["menu_columns"], ("id", "name", "price_cents"))
+
+    def blocks():
+        for r, menu in zip(res["restaurants"], res["menus"]):
+            lines = ["R " + "|".join(map(str, restaurant(r)))]
+            lines += [f"- {i}|{name}|{_rupees(cents)}" for i, name, cents in map(dish, menu)]
+            yield "\n".join(lines)
+    n = len(res["restaurants"])
+    return _capped("restaurants.search", _search_header(n), blocks(), "restaurants", total=n)
+
+
+def render_menu(res: dict) -> str:
+    if is_columnar(res):
+        dish = _picker(res["columns"], ("id", "name", "price_cents"))
+        lines = [f"- {i}|{name}|{_rupees(cents)}" for i, name, cents in map(dish, res["rows"])]
+    else:
+        lines = [_menu_line(m) for m in res.get("menu", [])]
+    header = f"[menus.list] {len(lines)} item(s). - menu_item_id|dish|price_rupees"
+    return _capped("menus.list", header, lines, "items")
+
+
+def _cart_lines(cart: dict) -> list:
+    return [
+        f"- {str(i['menu_item_id']) + '|' if 'menu_item_id' in i else ''}{i['name']} x{i['quantity']}"
+        f" @ {_rupees(i['unit_price_cents'])} = {_rupees(i['total'])}"
+        for i in cart.get("items", [])
+    ]
+
+
+def render_cart(tool: str, res: dict) -> str:
+    cart = res.get("cart", res)
+    status = f" status={res['status']}" if "status" in res else ""
+    ids = "menu_item_id|" if any("menu_item_id" in i for i in cart.get("items", [])) else ""
+    # the subtotal goes with the header so a capped cart still shows it
+    header = (f"[{tool}]{status} cart: {ids}dish x qty @ unit_rupees = line_rupees\n"
+              f"subtotal_rupees={cart.get('subtotal_rupees')}")
+    blocks = _cart_lines(cart)
+    # orders.reorder reports what it could not copy or re-priced
+    if res.get("unavailable"):
+        blocks.append("unavailable (not added): " + ", ".join(f"{u['quantity']}x {u['name']}" for u in res["unavailable"]))
+    if res.get("repriced"):
+        blocks.append("price changed: " + ", ".join(
+            f"{r['name']} {_rupees(r['was_rupees'] * 100)}->{_rupees(r['now_rupees'] * 100)}" for r in res["repriced"]))
+    return _capped(tool, header, blocks, "lines")
+
+
+def render_orders(res: dict) -> str:
+    orders = res.get("orders", [])
+    header = f"[orders.list_recent] {len(orders)} order(s), newest first. order_id|placed_at|status|total_rupees|items"
+    lines = [f"{o['order_id']}|{o['placed_at']}|{o['status']}|{o['total_rupees']}|{o['items']}" for o in orders]
+    return _capped("orders.list_recent", header, lines, "orders")
+
+
+def render(tool: str, res) -> str:
+    """Compact text for one tool result; unknown shapes fall back to dense JSON."""
+    if isinstance(res, dict) and "error" in res:
+        err = res["error"]
+        if isinstance(err, dict):
+            return f"[{tool}] error {err.get('code')}: {err.get('message')}"
+        return f"[{tool}] error: {err}"
+    if isinstance(res, dict):
+        if tool == "restaurants.search" and ("results" in res or is_columnar(res)):
+            return render_search(res)
+        if tool == "menus.list" and ("menu" in res or is_columnar(res)):
+            return render_menu(res)
+        if tool == "orders.list_recent" and "orders" in res:
+            return render_orders(res)
+        if "items" in res or "cart" in res:
+            return render_cart(tool, res)
+    return f"[{tool}] " + json.dumps(res, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,147 @@
+# writer.py
+# Single-writer group commit for one SQLite file. Mutations are queued as
+# jobs (callables taking the connection); one thread applies whatever is
+# queued in a single transaction, each job inside its own savepoint, commits
+# once and then resolves the jobs' futures. Readers keep their own
+# connections and read WAL snapshots meanwhile.
+import collections
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+def _failed(result) -> bool:
+    # handlers report failures as {"error": ...} instead of raising
+    return isinstance(result, dict) and "error" in result
+
+
+class WriteQueue:
+    def __init__(self, path: str, max_batch: int = 128, max_wait_ms: float = 0.0,
+                 busy_timeout_s: float = 10.0, on_start=None, connect=None):
+        self.path = path
+        self.connect = connect or sqlite3.connect
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.busy_timeout_s = busy_timeout_s
+        self.on_start = on_start
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # stats
+        self.batches = 0
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.max_batch_seen = 0
+        self._commit_ms = collections.deque(maxlen=1024)
+        self._batch_sizes = collections.deque(maxlen=1024)
+
+    @property
+    def thread(self):
+        return self._thread
+
+    def submit(self, fn, *args) -> Future:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"writer:{self.path}", daemon=True)
+                    self._thread.start()
+        fut = Future()
+        self._queue.put((fn, args, fut))
+        return fut
+
+    def call(self, fn, *args, timeout: float = 30.0):
+        return self.submit(fn, *args).result(timeout=timeout)
+
+    # ---- writer thread ----
+    def _connect(self):
+        conn = self.connect(self.path, isolation_level=None, timeout=self.busy_timeout_s)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA main.journal_mode=WAL")  # not attached read-only DBs
+        return conn
+
+    def _take(self):
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(jobs) < self.max_batch:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+        return jobs
+
+    def _run(self):
+        conn = None
+        while True:
+            jobs = self._take()
+            if conn is None:
+                try:
+                    conn = self._connect()
+                    if self.on_start:
+                        self.on_start(conn)
+                except Exception as e:
+                    # fail this batch instead of leaving callers waiting; retry on the next
+                    conn = None
+                    for _, _, fut in jobs:
+                        fut.set_exception(e)
+                    continue
+            self._apply(conn, jobs)
+
+    def _apply(self, conn, jobs):
+        outcomes = []
+        t0 = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, _ in jobs:
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = fn(*args)
+                    if _failed(result):
+                        conn.execute("ROLLBACK TO job")
+                    outcomes.append((True, result))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    outcomes.append((False, e))
+                conn.execute("RELEASE job")
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            outcomes = [(False, e)] * len(jobs)
+        self._record(len(jobs), (time.perf_counter() - t0) * 1000, outcomes)
+        # only now is every result durable
+        for (_, _, fut), (ok, value) in zip(jobs, outcomes):
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+
+    def _record(self, size: int, ms: float, outcomes):
+        self.batches += 1
+        self.jobs += size
+        self.failed_jobs += sum(1 for ok, v in outcomes if not ok or _failed(v))
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self._batch_sizes.append(size)
+        self._commit_ms.append(ms)
+
+    def stats(self) -> dict:
+        ms = sorted(self._commit_ms)
+        pct = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 2) if ms else None
+        sizes = list(self._batch_sizes)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "failed_jobs": self.failed_jobs,
+            "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else None,
+            "batch_size_max": self.max_batch_seen,
+            "commit_ms_p50": pct(0.50),
+            "commit_ms_p95": pct(0.95),
+        }